@@ -0,0 +1,116 @@
+"""
+合成语料生成器
+
+```bash
+python -m benchmarks.corpus .cache/bench/corpus --files 200 --sections 8 --header-depth 4 --section-words 300
+```
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+WORDS = (
+    "knowledge pipeline segment embedding dataset document token header section chunk vector index retrieval "
+    "query answer context model latency throughput batch cluster shard replica schema field record table"
+).split()
+
+
+@dataclass
+class CorpusSpec:
+    files: int = 100
+    sections: int = 6
+    header_depth: int = 4
+    section_words: int = 200
+    kinds: Sequence[str] = ("md", "mdx", "ts")
+    long_section_ratio: float = 0.1
+    seed: int = 42
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, words: int) -> str:
+    paragraphs = []
+    while words > 0:
+        n = min(words, rng.randint(20, 80))
+        paragraphs.append(_sentence(rng, n))
+        words -= n
+    return "\n\n".join(paragraphs)
+
+
+def _markdown(rng: random.Random, spec: CorpusSpec, index: int, *, frontmatter: bool) -> str:
+    parts = []
+    if frontmatter:
+        parts.append(f'---\ntitle: "Document {index}"\ndescription: synthetic document {index}\n---\n')
+    for s in range(spec.sections):
+        level = 1 if s == 0 else rng.randint(2, max(2, spec.header_depth))
+        words = spec.section_words
+        if rng.random() < spec.long_section_ratio:
+            # 超长章节触发二次切分
+            words *= 20
+        parts.append(f"{'#' * level} Section {index}.{s} {rng.choice(WORDS)}\n\n{_paragraphs(rng, words)}")
+        if s % 3 == 2:
+            parts.append("```python\n# comment, not a header\nprint('hello')\n```")
+    return "\n\n".join(parts)
+
+
+def _typescript(rng: random.Random, spec: CorpusSpec, index: int) -> str:
+    functions = []
+    for f in range(spec.sections * 4):
+        body = "\n".join(f"  // {_sentence(rng, 8)}\n  a = a + {i};" for i in range(spec.section_words // 40 + 1))
+        functions.append(f"export function f{index}_{f}(a: number): number {{\n{body}\n  return a;\n}}\n")
+    return "\n".join(functions)
+
+
+def generate_corpus(root: Path | str, spec: CorpusSpec | None = None) -> Path:
+    """
+    生成 md / mdx / ts 语料，相同的 spec 总是生成相同的内容
+
+    Returns: 语料根目录，<root>/<kind>/ 下按 kind 存放
+
+    """
+    spec = spec or CorpusSpec()
+    root = Path(root)
+    rng = random.Random(spec.seed)
+    for kind in spec.kinds:
+        (root / kind).mkdir(parents=True, exist_ok=True)
+    for i in range(spec.files):
+        for kind in spec.kinds:
+            fp = root / kind / f"doc_{i:05d}.{kind}"
+            if kind == "ts":
+                fp.write_text(_typescript(rng, spec, i), encoding="utf8")
+            else:
+                # mdx 的 schema 信息取自 frontmatter
+                fp.write_text(_markdown(rng, spec, i, frontmatter=kind == "mdx"), encoding="utf8")
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path)
+    parser.add_argument("--files", type=int, default=CorpusSpec.files)
+    parser.add_argument("--sections", type=int, default=CorpusSpec.sections)
+    parser.add_argument("--header-depth", type=int, default=CorpusSpec.header_depth)
+    parser.add_argument("--section-words", type=int, default=CorpusSpec.section_words)
+    parser.add_argument("--kinds", nargs="+", default=list(CorpusSpec.kinds))
+    parser.add_argument("--seed", type=int, default=CorpusSpec.seed)
+    args = parser.parse_args()
+    spec = CorpusSpec(
+        files=args.files,
+        sections=args.sections,
+        header_depth=args.header_depth,
+        section_words=args.section_words,
+        kinds=args.kinds,
+        seed=args.seed,
+    )
+    print(generate_corpus(args.root, spec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+分片与同步链路的基准测试
+
+每个用例在独立的子进程中运行，分别统计耗时、吞吐与峰值 RSS，结果写入 JSON 便于跨版本对比
+
+```bash
+python -m benchmarks.run                              # 全部用例
+python -m benchmarks.run chunk_md embed_knowledge_c8  # 指定用例
+python -m benchmarks.run --files 500 --latency 0.05 --output bench.json
+python -m benchmarks.run --compare benchmarks/results/<baseline>.json
+```
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Tuple
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+
+if TYPE_CHECKING:
+    from dify_knowledge_pipeline.cards import KnowledgeCard
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+CASES: Dict[str, Callable[[argparse.Namespace, Path], Dict[str, Any]]] = {}
+
+
+def case(fn: Callable[[argparse.Namespace, Path], Dict[str, Any]]):
+    CASES[fn.__name__] = fn
+    return fn
+
+
+def _peak_rss_mb() -> Dict[str, float | None]:
+    try:
+        import resource
+    except ImportError:
+        return {"peak_rss_mb": None, "peak_rss_children_mb": None}
+    # Linux 单位为 KB，macOS 为字节
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def _drain(cards: Iterable[Tuple[str, KnowledgeCard]]) -> Dict[str, Any]:
+    count = nbytes = 0
+    for _, card in cards:
+        count += 1
+        nbytes += card.nbytes
+    return {"cards": count, "card_bytes": nbytes}
+
+
+def _input_stats(fdr: Path, pattern: str) -> Dict[str, Any]:
+    files = list(fdr.rglob(pattern))
+    return {"files": len(files), "input_bytes": sum(fp.stat().st_size for fp in files)}
+
+
+def _timed(fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    metrics = fn()
+    metrics["seconds"] = round(time.perf_counter() - start, 4)
+    return metrics
+
+
+# ---------------- 分片 ----------------
+
+
+def _chunk_tech_docs(args, workdir: Path, kind: str, **kwargs) -> Dict[str, Any]:
+    from dify_knowledge_pipeline import fork_tech_docs_markdown_to_chunks
+
+    fdr = workdir / "corpus" / kind
+    metrics = _timed(
+        lambda: _drain(
+            fork_tech_docs_markdown_to_chunks(
+                fdr, workdir / f"out_{kind}", encoding_name=args.encoding_name, ext=f"*.{kind}", **kwargs
+            )
+        )
+    )
+    return {**_input_stats(fdr, f"*.{kind}"), **metrics}
+
+
+@case
+def chunk_md(args, workdir: Path):
+    return _chunk_tech_docs(args, workdir, "md")
+
+
+@case
+def chunk_md_token_splitter(args, workdir: Path):
+    return _chunk_tech_docs(args, workdir, "md", splitter="token")
+
+
+@case
+def chunk_md_workers(args, workdir: Path):
+    return _chunk_tech_docs(args, workdir, "md", workers=args.workers)
+
+
+@case
+def chunk_mdx(args, workdir: Path):
+    return _chunk_tech_docs(args, workdir, "mdx")
+
+
+@case
+def chunk_ts(args, workdir: Path):
+    from dify_knowledge_pipeline import fork_source_code_ts_to_chunks
+
+    fdr = workdir / "corpus" / "ts"
+    metrics = _timed(
+        lambda: _drain(fork_source_code_ts_to_chunks(fdr, workdir / "out_ts", encoding_name=args.encoding_name))
+    )
+    return {**_input_stats(fdr, "*.ts"), **metrics}
+
+
+# ---------------- 同步 ----------------
+
+
+def _cards(args, workdir: Path) -> Dict[str, KnowledgeCard]:
+    from dify_knowledge_pipeline import fork_tech_docs_markdown_to_chunks
+
+    fdr = workdir / "corpus" / "md"
+    return dict(fork_tech_docs_markdown_to_chunks(fdr, workdir / "out_sync", encoding_name=args.encoding_name))
+
+
+def _fire_drop(args, workdir: Path, *, max_concurrency: int, **fake_options):
+    from tests.fake_dify import FakeDify
+    from dify_knowledge_pipeline import DifyFireDrop
+
+    options = {"latency": args.latency, "jitter": args.jitter, **fake_options}
+    fake = FakeDify(**options)
+    state_path = workdir / f"sync_state_{time.monotonic_ns()}.json"
+    drop = DifyFireDrop(
+        dify_base_url="http://fake-dify/v1",
+        api_key="fake",
+        state_path=state_path,
+        max_concurrency=max_concurrency,
+        transport=fake.transport(),
+    )
+    return drop, fake
+
+
+def _embed(args, workdir: Path, *, max_concurrency: int, **fake_options) -> Dict[str, Any]:
+    cards = _cards(args, workdir)
+    drop, fake = _fire_drop(args, workdir, max_concurrency=max_concurrency, **fake_options)
+
+    def run():
+        report = drop.embed_knowledge(cards, db_name="benchmark")
+        return {"documents": len(cards), "uploaded": report.uploaded, "failed": report.failed}
+
+    metrics = _timed(run)
+    metrics.update(requests=sum(fake.requests.values()), retries=drop._transport.retries)
+    return metrics
+
+
+@case
+def embed_knowledge(args, workdir: Path):
+    return _embed(args, workdir, max_concurrency=1)
+
+
+@case
+def embed_knowledge_c8(args, workdir: Path):
+    return _embed(args, workdir, max_concurrency=8)
+
+
+@case
+def embed_knowledge_errors(args, workdir: Path):
+    return _embed(args, workdir, max_concurrency=8, error_rate=args.error_rate)
+
+
+@case
+def embed_knowledge_incremental_updates(args, workdir: Path):
+    cards = _cards(args, workdir)
+    drop, fake = _fire_drop(args, workdir, max_concurrency=8)
+    drop.embed_knowledge(cards, db_name="benchmark")
+
+    # 约 10% 的文档变化、1% 的文档被删除
+    now = int(time.time()) + 60
+    names = sorted(cards)
+    changed = set(names[::10])
+    current = {name: cards[name] for i, name in enumerate(names) if i % 100 != 99}
+    update_time = {name: now if name in changed else 0 for name in current}
+    requests_before = sum(fake.requests.values())
+
+    def run():
+        report = drop.embed_knowledge_incremental_updates(current, update_time, db_name="benchmark")
+        return {
+            "documents": len(current),
+            "updated": report.updated,
+            "skipped": report.skipped,
+            "deleted": report.deleted,
+            "failed": report.failed,
+        }
+
+    metrics = _timed(run)
+    metrics["requests"] = sum(fake.requests.values()) - requests_before
+    return metrics
+
+
+# ---------------- runner ----------------
+
+
+def _run_case(name: str, args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    """在子进程中执行单个用例，峰值 RSS 互不影响"""
+    cmd = [sys.executable, "-m", "benchmarks.run", "--child", name, "--workdir", str(workdir)]
+    cmd += [f"--{k.replace('_', '-')}={v}" for k, v in _case_options(args).items()]
+    proc = subprocess.run(
+        cmd, cwd=ROOT, stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL, text=True
+    )
+    if proc.returncode != 0:
+        return {"error": f"exit code {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _case_options(args: argparse.Namespace) -> Dict[str, Any]:
+    keys = ("encoding_name", "workers", "latency", "jitter", "error_rate")
+    return {k: getattr(args, k) for k in keys}
+
+
+def _metadata(args: argparse.Namespace, spec: CorpusSpec) -> Dict[str, Any]:
+    version = None
+    if m := re.search(r'^version = "([^"]+)"', (ROOT / "pyproject.toml").read_text(encoding="utf8"), re.M):
+        version = m[1]
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "version": version,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": asdict(spec),
+        "options": _case_options(args),
+    }
+
+
+def _throughput(metrics: Dict[str, Any]):
+    if not (seconds := metrics.get("seconds")):
+        return
+    if "files" in metrics:
+        metrics["files_per_s"] = round(metrics["files"] / seconds, 2)
+        metrics["mb_per_s"] = round(metrics["input_bytes"] / seconds / 1024 / 1024, 3)
+    if "documents" in metrics:
+        metrics["documents_per_s"] = round(metrics["documents"] / seconds, 2)
+
+
+def _compare(results: Dict[str, Any], baseline_path: Path):
+    baseline = json.loads(baseline_path.read_text(encoding="utf8"))["cases"]
+    print(f"\n{'case':<40}{'seconds':>12}{'baseline':>12}{'ratio':>8}{'rss_mb':>10}")
+    for name, metrics in results["cases"].items():
+        base = baseline.get(name, {})
+        seconds, base_seconds = metrics.get("seconds"), base.get("seconds")
+        ratio = f"{seconds / base_seconds:.2f}" if seconds and base_seconds else "-"
+        print(
+            f"{name:<40}{seconds or '-':>12}{base_seconds or '-':>12}{ratio:>8}{metrics.get('peak_rss_mb') or '-':>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cases", nargs="*", help=f"默认运行全部用例：{', '.join(CASES)}")
+    parser.add_argument("--workdir", type=Path, default=ROOT / ".cache" / "benchmarks")
+    parser.add_argument("--output", type=Path, help="结果文件，默认 benchmarks/results/<version>-<commit>.json")
+    parser.add_argument("--compare", type=Path, help="与之前的结果文件对比耗时")
+    parser.add_argument("--files", type=int, default=CorpusSpec.files)
+    parser.add_argument("--sections", type=int, default=CorpusSpec.sections)
+    parser.add_argument("--header-depth", type=int, default=CorpusSpec.header_depth)
+    parser.add_argument("--section-words", type=int, default=CorpusSpec.section_words)
+    parser.add_argument("--encoding-name", default="gpt2")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟 Dify 的单次请求延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="embed_knowledge_errors 用例的错误注入概率")
+    parser.add_argument("--verbose", action="store_true", help="显示用例的日志与进度条")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        metrics = CASES[args.child](args, args.workdir)
+        metrics.update(_peak_rss_mb())
+        print(json.dumps(metrics))
+        return
+
+    if unknown := [name for name in args.cases if name not in CASES]:
+        parser.error(f"unknown cases: {unknown}")
+
+    spec = CorpusSpec(
+        files=args.files, sections=args.sections, header_depth=args.header_depth, section_words=args.section_words
+    )
+    workdir = args.workdir / f"{spec.files}x{spec.sections}x{spec.section_words}-d{spec.header_depth}"
+    if not (workdir / "corpus").exists():
+        generate_corpus(workdir / "corpus", spec)
+
+    results = {"meta": _metadata(args, spec), "cases": {}}
+    for name in args.cases or CASES:
+        metrics = _run_case(name, args, workdir)
+        _throughput(metrics)
+        results["cases"][name] = metrics
+        print(f"{name:<40}{json.dumps(metrics)}", flush=True)
+
+    meta = results["meta"]
+    output = args.output or RESULTS_DIR / f"{meta['version']}-{meta['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf8")
+    print(f"\nresults -> {output}")
+
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
-from .fire_drop import DifyFireDrop
+from .fire_drop import DeleteReport, DifyFireDrop, SyncReport
+from .plan import SyncPlan
+from .scheduler import UploadScheduler
 from .pipeline import KnowledgePipline, fork_source_code_ts_to_chunks, fork_tech_docs_markdown_to_chunks
 from .client import KnowledgeDatasetsClient
+from .async_client import AsyncKnowledgeDatasetsClient
 from .errors import DifyClientError
+from .cards import CardWriter, KnowledgeCard
+from .datasets import DatasetCache
+from .metrics import Metrics, MetricsReport
+from .store import ChunkStore
 
 __all__ = [
     "KnowledgeDatasetsClient",
+    "AsyncKnowledgeDatasetsClient",
     "DifyFireDrop",
+    "SyncReport",
+    "DeleteReport",
+    "SyncPlan",
+    "UploadScheduler",
     "KnowledgePipline",
     "fork_source_code_ts_to_chunks",
     "fork_tech_docs_markdown_to_chunks",
     "DifyClientError",
+    "CardWriter",
+    "KnowledgeCard",
+    "DatasetCache",
+    "Metrics",
+    "MetricsReport",
+    "ChunkStore",
 ]
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Literal
+
+import httpx
+
+from dify_knowledge_pipeline.models import Segment
+from dify_knowledge_pipeline.pagination import apaginate
+from dify_knowledge_pipeline.recorder import RecorderMode, ResponseRecorder, make_recorder
+from dify_knowledge_pipeline.transport import AsyncDifyRetryTransport, RetryPolicy
+
+
+@dataclass
+class AsyncKnowledgeDatasetsClient:
+    """
+    基于 httpx.AsyncClient 的知识库 API 客户端
+
+    所有请求共享同一个连接池，可在单个事件循环中并发执行大量分段操作
+
+    ```python
+    async with AsyncKnowledgeDatasetsClient.from_env(dataset_id=dataset_id) as client:
+        responses = await asyncio.gather(*[client.create_segments(doc_id, segments) for doc_id in doc_ids])
+    ```
+    """
+
+    api_key: str
+    base_url: str = "http://192.168.1.180/v1"
+    dataset_id: str = ""
+    document_id: str = ""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    # None 表示安装了 h2 时自动启用 HTTP/2
+    http2: bool | None = None
+    timeout: float = 30.0
+    retry: RetryPolicy | None = None
+    rate_limit: float | None = None
+    transport: httpx.AsyncBaseTransport | None = None
+    # 同 KnowledgeDatasetsClient.recorder
+    recorder: RecorderMode | ResponseRecorder | None = "off"
+
+    storage_dir = Path(".cache/knowledge/")
+
+    def __post_init__(self):
+        if self.http2 is None:
+            self.http2 = importlib.util.find_spec("h2") is not None
+
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        limits = httpx.Limits(
+            max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive_connections
+        )
+        inner = self.transport or httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+        transport = AsyncDifyRetryTransport(inner, retry=self.retry, rate_limit=self.rate_limit)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url, headers=headers, transport=transport, timeout=self.timeout
+        )
+        self.recorder = make_recorder(self.recorder, self.storage_dir)
+
+    @classmethod
+    def from_env(
+        cls,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        dataset_id: str = "",
+        document_id: str = "",
+        **kwargs,
+    ):
+        base_url = base_url or os.environ["DIFY_BASE_URL"]
+        api_key = api_key or os.environ["DIFY_KNOWLEDGE_API_KEY"]
+        return cls(api_key=api_key, base_url=base_url, dataset_id=dataset_id, document_id=document_id, **kwargs)
+
+    async def __aenter__(self) -> AsyncKnowledgeDatasetsClient:
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+        await asyncio.to_thread(self.recorder.close)
+
+    async def _send_request(
+        self, request_method: str, url: str, *, files=None, data=None, json=None, params=None, **kwargs
+    ) -> httpx.Response:
+        dataset_id = kwargs.get("dataset_id", self.dataset_id)
+        if not dataset_id and ("/datasets" != url) and (request_method != "GET"):
+            raise ValueError("dataset_id must be specified")
+
+        payload = json or kwargs.get("payload")
+        response = await self.client.request(request_method, url, files=files, data=data, json=payload, params=params)
+        self.recorder.record(response, kwargs.get("cache_log"))
+
+        return response
+
+    @staticmethod
+    async def _file_field(file: str | Path | os.PathLike):
+        # 读入内存再上传，重试时可以重复发送
+        fp = Path(file)
+        return {"file": (fp.name, await asyncio.to_thread(fp.read_bytes))}
+
+    # ---------------- 知识库 ----------------
+
+    async def create_datasets(self, name: str) -> httpx.Response:
+        """创建空知识库"""
+        return await self._send_request("POST", "/datasets", json={"name": name}, cache_log="create_datasets.json")
+
+    async def list_datasets(self, page: str = "1", limit: str = "20") -> httpx.Response:
+        """知识库列表"""
+        return await self._send_request(
+            "GET", "/datasets", params={"page": page, "limit": limit}, cache_log="list_datasets.json"
+        )
+
+    async def iter_datasets(self, limit: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        """逐页遍历全部知识库"""
+
+        async def fetch_page(page: int) -> Dict[str, Any]:
+            response = await self.list_datasets(page=str(page), limit=str(limit))
+            response.raise_for_status()
+            return response.json()
+
+        async for dataset in apaginate(fetch_page):
+            yield dataset
+
+    async def delete_datasets(self, *, dataset_id: str | None = "") -> httpx.Response:
+        """删除知识库"""
+        dataset_id = dataset_id or self.dataset_id
+        return await self._send_request("DELETE", f"/datasets/{dataset_id}", dataset_id=dataset_id)
+
+    # ---------------- 文档 ----------------
+
+    async def create_document_by_text(
+        self,
+        name: str,
+        text: str,
+        process_rule: Dict[str, Any] | None = None,
+        indexing_technique: Literal["high_quality", "economy"] = "high_quality",
+        *,
+        dataset_id: str | None = "",
+    ) -> httpx.Response:
+        """通过文本创建文档，参数同 KnowledgeDatasetsClient.create_document_by_text"""
+        dataset_id = dataset_id or self.dataset_id
+        process_rule = process_rule or {"mode": "automatic"}
+        payload = {"name": name, "text": text, "process_rule": process_rule, "indexing_technique": indexing_technique}
+        url = f"/datasets/{dataset_id}/document/create_by_text"
+        return await self._send_request(
+            "POST", url, payload=payload, dataset_id=dataset_id, cache_log="create_document_by_text.json"
+        )
+
+    async def create_document_by_file(
+        self, data: dict, file: str | Path | os.PathLike, *, dataset_id: str | None = ""
+    ) -> httpx.Response:
+        """通过文件创建文档，data 的字段同 KnowledgeDatasetsClient.create_document_by_file"""
+        dataset_id = dataset_id or self.dataset_id
+        url = f"/datasets/{dataset_id}/document/create_by_file"
+        files = await self._file_field(file)
+        form = {"data": json.dumps(data, ensure_ascii=False)}
+        return await self._send_request("POST", url, files=files, data=form, dataset_id=dataset_id)
+
+    async def update_documents_by_text(
+        self,
+        document_id: str,
+        name: str | None = "",
+        text: str | None = "",
+        process_rule: dict | None = None,
+        *,
+        dataset_id: str | None = "",
+    ) -> httpx.Response:
+        """通过文本更新文档"""
+        dataset_id = dataset_id or self.dataset_id
+        payload = {k: v for k, v in {"name": name, "text": text, "process_rule": process_rule}.items() if v}
+        url = f"/datasets/{dataset_id}/documents/{document_id}/update_by_text"
+        return await self._send_request("POST", url, payload=payload, dataset_id=dataset_id)
+
+    async def update_documents_by_file(
+        self,
+        document_id: str,
+        file: Path | str | os.PathLike,
+        name: str | None = "",
+        process_rule: dict | None = None,
+        *,
+        dataset_id: str | None = "",
+    ) -> httpx.Response:
+        """通过文件更新文档"""
+        dataset_id = dataset_id or self.dataset_id
+        url = f"/datasets/{dataset_id}/documents/{document_id}/update_by_file"
+        files = await self._file_field(file)
+        data = {k: v for k, v in {"name": name, "process_rule": process_rule}.items() if v}
+        form = {"data": json.dumps(data, ensure_ascii=False)}
+        return await self._send_request("POST", url, files=files, data=form, dataset_id=dataset_id)
+
+    async def list_documents(
+        self, keyword: str | None = "", page: str | None = "", limit: str | None = "", *, dataset_id: str | None = ""
+    ) -> httpx.Response:
+        """知识库文档列表"""
+        dataset_id = dataset_id or self.dataset_id
+        params = {k: v for k, v in {"keyword": keyword, "page": page, "limit": limit}.items() if v}
+        return await self._send_request(
+            "GET",
+            f"/datasets/{dataset_id}/documents",
+            params=params,
+            dataset_id=dataset_id,
+            cache_log="list_documents.json",
+        )
+
+    async def iter_documents(
+        self, keyword: str | None = "", limit: int = 100, *, dataset_id: str | None = ""
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """逐页遍历知识库中的全部文档"""
+
+        async def fetch_page(page: int) -> Dict[str, Any]:
+            response = await self.list_documents(keyword, page=str(page), limit=str(limit), dataset_id=dataset_id)
+            response.raise_for_status()
+            return response.json()
+
+        async for document in apaginate(fetch_page):
+            yield document
+
+    async def get_documents_indexing_status(self, dataset_id: str, batch: str) -> httpx.Response:
+        """获取文档嵌入状态（进度）"""
+        dataset_id = dataset_id or self.dataset_id
+        url = f"/datasets/{dataset_id}/documents/{batch}/indexing-status"
+        return await self._send_request("GET", url, dataset_id=dataset_id)
+
+    async def delete_documents(self, document_id: str, *, dataset_id: str | None = "") -> httpx.Response:
+        """删除文档"""
+        dataset_id = dataset_id or self.dataset_id
+        url = f"/datasets/{dataset_id}/documents/{document_id}"
+        return await self._send_request("DELETE", url, dataset_id=dataset_id)
+
+    # ---------------- 分段 ----------------
+
+    async def create_segments(
+        self, document_id: str, segments: List[Segment], *, dataset_id: str | None = ""
+    ) -> httpx.Response:
+        """新增分段"""
+        dataset_id = dataset_id or self.dataset_id
+        payload = {"segments": [segment.model_dump() for segment in segments]}
+        url = f"/datasets/{dataset_id}/documents/{document_id}/segments"
+        return await self._send_request("POST", url, payload=payload, dataset_id=dataset_id)
+
+    async def list_segments(
+        self,
+        document_id: str,
+        keyword: str | None = None,
+        status: str | None = "completed",
+        *,
+        dataset_id: str | None = "",
+    ) -> httpx.Response:
+        """查询文档分段"""
+        dataset_id = dataset_id or self.dataset_id
+        params = {k: v for k, v in {"keyword": keyword, "status": status}.items() if v}
+        url = f"/datasets/{dataset_id}/documents/{document_id}/segments"
+        return await self._send_request(
+            "GET", url, params=params, dataset_id=dataset_id, cache_log="list_segments.json"
+        )
+
+    async def update_segments(
+        self,
+        segment_id: str,
+        segment: Segment,
+        *,
+        enabled: bool = True,
+        document_id: str | None = "",
+        dataset_id: str | None = "",
+    ) -> httpx.Response:
+        """更新文档分段"""
+        dataset_id = dataset_id or self.dataset_id
+        document_id = document_id or self.document_id
+        payload = {"segment": {**segment.model_dump(), "enabled": enabled}}
+        url = f"/datasets/{dataset_id}/documents/{document_id}/segments/{segment_id}"
+        return await self._send_request("POST", url, payload=payload, dataset_id=dataset_id)
+
+    async def delete_segments(
+        self, segment_id: str, *, document_id: str | None = "", dataset_id: str | None = ""
+    ) -> httpx.Response:
+        """删除文档分段"""
+        dataset_id = dataset_id or self.dataset_id
+        document_id = document_id or self.document_id
+        url = f"/datasets/{dataset_id}/documents/{document_id}/segments/{segment_id}"
+        return await self._send_request("DELETE", url, dataset_id=dataset_id)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
+
+import httpx
+from loguru import logger
+from pydantic import BaseModel, Field
+from tqdm import tqdm
+
+from dify_knowledge_pipeline.models import Segment
+from dify_knowledge_pipeline.tokens import TokenCounter
+from dify_knowledge_pipeline.transport import dify_error
+
+if TYPE_CHECKING:
+    from dify_knowledge_pipeline.client import KnowledgeDatasetsClient
+
+
+class SegmentFailure(BaseModel):
+    index: int = Field(..., description="分段在输入序列中的位置")
+    error: str
+
+
+class BulkSegmentReport(BaseModel):
+    document_id: str
+    total: int = 0
+    created: int = 0
+    failed: int = 0
+    requests: int = Field(0, description="实际发出的 create_segments 请求数")
+    elapsed: float = 0.0
+    segment_ids: List[str | None] = Field(default_factory=list, description="与输入顺序一致，失败的分段为 None")
+    failures: List[SegmentFailure] = Field(default_factory=list)
+
+
+@dataclass
+class SegmentBatch:
+    indexes: List[int] = field(default_factory=list)
+    segments: List[Segment] = field(default_factory=list)
+    nbytes: int = 0
+    ntokens: int = 0
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def split(self) -> Tuple[SegmentBatch, SegmentBatch]:
+        mid = len(self) // 2
+        return (
+            SegmentBatch(self.indexes[:mid], self.segments[:mid]),
+            SegmentBatch(self.indexes[mid:], self.segments[mid:]),
+        )
+
+
+class SegmentBulkWriter:
+    """
+    批量新增分段
+
+    - 按请求体字节数、token 数与分段数打包，单个超出预算的分段独占一个请求
+    - 以 max_concurrency 的并发度发送，在途批次不超过 max_concurrency * 2，输入可以是生成器
+    - 批次因分段内容校验失败（400）或请求体过大（413）被拒绝时二分重试，只有出错的分段记为失败；
+      鉴权失败、文档不存在、文档正在处理等与分段无关的错误直接使整个批次失败
+
+    ```python
+    writer = SegmentBulkWriter(KnowledgeDatasetsClient.from_env(dataset_id=dataset_id), max_concurrency=8)
+    report = writer.write(document_id, (Segment(content=q, answer=a) for q, a in qa_pairs))
+    ```
+    """
+
+    def __init__(
+        self,
+        client: KnowledgeDatasetsClient,
+        *,
+        max_batch_bytes: int = 512 * 1024,
+        max_batch_tokens: int = 8192,
+        max_batch_segments: int = 100,
+        max_concurrency: int = 4,
+        encoding_name: str = "gpt2",
+        counter: TokenCounter | None = None,
+        show_progress: bool = True,
+    ):
+        """
+        Args:
+            client: 知识库 API 客户端
+            max_batch_bytes: 单个请求体的最大字节数
+            max_batch_tokens: 单个请求中分段（content + answer）的最大 token 数，决定服务端单次嵌入的规模
+            max_batch_segments: 单个请求的最大分段数
+            max_concurrency: 并发请求数
+            encoding_name: 统计 token 使用的编码，传入 counter 时忽略
+            counter: 自定义 token 计数器
+            show_progress: 是否显示进度条
+        """
+        self.client = client
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_segments = max(1, max_batch_segments)
+        self.max_concurrency = max(1, max_concurrency)
+        self.counter = counter or TokenCounter.from_encoding_name(encoding_name)
+        self.show_progress = show_progress
+
+    def pack(self, segments: Iterable[Segment]) -> Iterator[SegmentBatch]:
+        """按字节数、token 数与分段数预算打包，保持输入顺序"""
+        batch = SegmentBatch()
+        for index, segment in enumerate(segments):
+            # 与请求体中的序列化方式一致，+1 为数组元素之间的逗号
+            nbytes = len(json.dumps(segment.model_dump(), ensure_ascii=False).encode("utf8")) + 1
+            ntokens = self.counter.count(segment.content) + self.counter.count(segment.answer or "")
+            if batch.indexes and (
+                len(batch) >= self.max_batch_segments
+                or batch.nbytes + nbytes > self.max_batch_bytes
+                or batch.ntokens + ntokens > self.max_batch_tokens
+            ):
+                yield batch
+                batch = SegmentBatch()
+            batch.indexes.append(index)
+            batch.segments.append(segment)
+            batch.nbytes += nbytes
+            batch.ntokens += ntokens
+        if batch.indexes:
+            yield batch
+
+    @staticmethod
+    def _is_bisectable(response: httpx.Response) -> bool:
+        """错误是否由批次中的个别分段引起，拆分批次后其余分段可以写入"""
+        if response.status_code == 413:
+            return True
+        # document_indexing、dataset_not_initialized 等 Dify 错误码针对整个文档或知识库，拆分后同样失败
+        return response.status_code == 400 and dify_error(response) is None
+
+    def _send(self, document_id: str, batch: SegmentBatch, dataset_id: str) -> Tuple[List[str | None], List[str], int]:
+        """Returns: (segment_ids, errors, requests)，segment_ids 与 errors 与 batch 顺序一致"""
+        try:
+            response = self.client.create_segments(document_id, batch.segments, dataset_id=dataset_id)
+        except httpx.HTTPError as err:
+            return [None] * len(batch), [repr(err)] * len(batch), 1
+
+        if response.is_success:
+            ids = [segment.get("id") for segment in response.json().get("data") or []]
+            ids += [None] * (len(batch) - len(ids))
+            return ids, ["missing segment id" if i is None else "" for i in ids], 1
+
+        error = f"{response.status_code} {response.text[:200]}"
+        if not self._is_bisectable(response) or len(batch) == 1:
+            return [None] * len(batch), [error] * len(batch), 1
+
+        # 请求被拒绝时二分定位出错的分段，其余分段仍然写入
+        left, right = batch.split()
+        left_ids, left_errors, left_requests = self._send(document_id, left, dataset_id)
+        right_ids, right_errors, right_requests = self._send(document_id, right, dataset_id)
+        return left_ids + right_ids, left_errors + right_errors, 1 + left_requests + right_requests
+
+    def write(self, document_id: str, segments: Iterable[Segment], *, dataset_id: str | None = "") -> BulkSegmentReport:
+        """
+        Args:
+            document_id: 文档 ID
+            segments: 待新增的分段，可以是生成器
+            dataset_id: 知识库 ID，默认使用 client.dataset_id
+
+        Returns: 逐个分段的写入结果
+
+        """
+        dataset_id = dataset_id or self.client.dataset_id
+        report = BulkSegmentReport(document_id=document_id)
+        progress = tqdm(desc="Segments", unit="seg", disable=not self.show_progress)
+        start = time.perf_counter()
+
+        def collect(batch: SegmentBatch, outcome: Tuple[List[str | None], List[str], int]):
+            ids, errors, requests = outcome
+            report.requests += requests
+            report.total += len(batch)
+            if len(report.segment_ids) < batch.indexes[-1] + 1:
+                report.segment_ids.extend([None] * (batch.indexes[-1] + 1 - len(report.segment_ids)))
+            for index, segment_id, error in zip(batch.indexes, ids, errors):
+                report.segment_ids[index] = segment_id
+                if segment_id:
+                    report.created += 1
+                else:
+                    report.failed += 1
+                    report.failures.append(SegmentFailure(index=index, error=error))
+            progress.update(len(batch))
+            progress.postfix = f"failed={report.failed}"
+
+        max_pending = self.max_concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = {}
+            for batch in self.pack(segments):
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(pending.pop(future), future.result())
+                pending[executor.submit(self._send, document_id, batch, dataset_id)] = batch
+            for future in list(pending):
+                collect(pending.pop(future), future.result())
+        progress.close()
+
+        report.failures.sort(key=lambda f: f.index)
+        report.elapsed = time.perf_counter() - start
+        if report.failed:
+            logger.warning(f"部分分段写入失败 - {document_id=} failed={report.failed}/{report.total}")
+        return report
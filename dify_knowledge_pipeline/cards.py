@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import uuid
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+SEPARATOR = "\n\n------------\n\n"
+
+
+class KnowledgeCard:
+    """
+    知识卡片句柄
+
+    已写入 fdr_out 的卡片只保存路径，上传时才读取内容；跨进程传递时也只序列化路径。
+    未落盘的卡片（offload=False）直接持有文本。
+
+    ```python
+    for table_name, card in fork_tech_docs_markdown_to_chunks(fdr_docs, fdr_out):
+        text = str(card)
+    ```
+    """
+
+    __slots__ = ("path", "num_segments", "_text")
+
+    def __init__(self, path: Path | None = None, *, text: str | None = None, num_segments: int | None = None):
+        if (path is None) == (text is None):
+            raise ValueError("KnowledgeCard requires exactly one of path or text")
+        self.path = path
+        self.num_segments = num_segments
+        self._text = text
+
+    def read(self) -> str:
+        if self._text is not None:
+            return self._text
+        return self.path.read_text(encoding="utf8")
+
+    def __str__(self) -> str:
+        return self.read()
+
+    def __repr__(self) -> str:
+        source = f"path={str(self.path)!r}" if self.path is not None else f"chars={len(self._text)}"
+        return f"KnowledgeCard({source}, num_segments={self.num_segments})"
+
+    @property
+    def nbytes(self) -> int:
+        """卡片的 utf8 字节数，落盘的卡片不需要读取内容"""
+        if self._text is not None:
+            return len(self._text.encode("utf8"))
+        return self.path.stat().st_size
+
+    def iter_segments(self, separator: str = SEPARATOR, *, block_size: int = 1 << 20) -> Iterator[str]:
+        """按块读取卡片并逐个返回分片，不在内存中保留整张卡片"""
+        if self._text is not None:
+            yield from self._text.split(separator)
+            return
+
+        with self.path.open("r", encoding="utf8") as file:
+            tail = ""
+            while block := file.read(block_size):
+                parts = (tail + block).split(separator)
+                tail = parts.pop()
+                yield from parts
+            yield tail
+
+
+class CardWriter:
+    """
+    逐个写入分片的卡片写入器
+
+    分片经缓冲写入 fdr_out 中唯一命名的临时文件，commit 时原子地重命名为卡片文件，
+    多个进程同时写同一个目录也不会互相覆盖或留下写了一半的卡片。未 commit 就退出时临时文件被删除。
+    fdr_out 为 None 时不落盘，分片保留在内存中。
+
+    ```python
+    with CardWriter(fdr_out) as writer:
+        for segment in segments:
+            writer.add(segment)
+        card = writer.commit("docs_index.txt")
+    ```
+    """
+
+    def __init__(self, fdr_out: Path | None, *, separator: str = SEPARATOR, buffer_size: int = 1 << 16):
+        self.fdr_out = fdr_out
+        self.separator = separator
+        self.buffer_size = buffer_size
+
+        self.num_segments = 0
+        self.num_chars = 0
+        self._segments: List[str] = []
+        self._file = None
+        self._tmp_path: str | None = None
+        self._closed = False
+
+    def _open(self):
+        # 与 write_text 一样按 umask 设置权限，mkstemp 会创建 0600 的文件
+        self.fdr_out.mkdir(exist_ok=True, parents=True)
+        self._tmp_path = str(self.fdr_out / f".card.{os.getpid()}.{uuid.uuid4().hex}.partial")
+        self._file = open(self._tmp_path, "x", encoding="utf8", buffering=self.buffer_size)
+
+    def add(self, segment: str, *, num_tokens: int | None = None, metadata: Dict[str, Any] | None = None):
+        """
+        Args:
+            segment: 分片文本
+            num_tokens: 分片的 token 数，文本卡片不使用，留给结构化的存储后端
+            metadata: 分片的标题等元数据，同上
+        """
+        if self._closed:
+            raise RuntimeError("CardWriter is already committed or aborted")
+
+        if self.num_segments:
+            self.num_chars += len(self.separator)
+        self.num_chars += len(segment)
+        self.num_segments += 1
+
+        if self.fdr_out is None:
+            self._segments.append(segment)
+            return
+        if self._file is None:
+            self._open()
+        if self.num_segments > 1:
+            self._file.write(self.separator)
+        self._file.write(segment)
+
+    def commit(self, name: str) -> KnowledgeCard:
+        """
+        完成写入
+
+        Args:
+            name: 卡片文件名，写入 fdr_out / name
+
+        Returns: 卡片句柄
+        """
+        if self._closed:
+            raise RuntimeError("CardWriter is already committed or aborted")
+        self._closed = True
+
+        if self.fdr_out is None:
+            text = self.separator.join(self._segments)
+            self._segments = []
+            return KnowledgeCard(text=text, num_segments=self.num_segments)
+
+        if self._file is None:
+            self._open()
+        try:
+            self._file.close()
+            fp_out = self.fdr_out / name
+            try:
+                os.replace(self._tmp_path, fp_out)
+            except OSError as err:
+                # 卡片名可能指向 fdr_out 之外的其他文件系统
+                if err.errno != errno.EXDEV:
+                    raise
+                shutil.move(self._tmp_path, fp_out)
+        except BaseException:
+            self._remove_tmp()
+            raise
+        return KnowledgeCard(fp_out, num_segments=self.num_segments)
+
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._segments = []
+        if self._file is not None:
+            with suppress(OSError):
+                self._file.close()
+            self._remove_tmp()
+
+    def _remove_tmp(self):
+        with suppress(OSError):
+            os.unlink(self._tmp_path)
+
+    def __enter__(self) -> CardWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.abort()
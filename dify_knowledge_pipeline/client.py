@@ -1,15 +1,17 @@
 from __future__ import annotations
 
-import json
 import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Literal, Dict, Any
+from typing import List, Literal, Dict, Any, Iterable, Iterator
 
 import httpx
-from loguru import logger
 
+from dify_knowledge_pipeline.bulk import BulkSegmentReport, SegmentBulkWriter
 from dify_knowledge_pipeline.models import Segment
+from dify_knowledge_pipeline.pagination import paginate
+from dify_knowledge_pipeline.recorder import RecorderMode, ResponseRecorder, make_recorder
+from dify_knowledge_pipeline.transport import DifyRetryTransport, RetryPolicy
 
 
 @dataclass
@@ -22,32 +24,39 @@ class KnowledgeDatasetsClient:
     base_url: str = "http://192.168.1.180/v1"
     dataset_id: str = ""
     document_id: str = ""
+    retry: RetryPolicy | None = None
+    rate_limit: float | None = None
+    transport: httpx.BaseTransport | None = None
+    # off 不记录接口响应；background 后台线程保存每个接口最近一次的响应；jsonl 追加写入压缩日志
+    recorder: RecorderMode | ResponseRecorder | None = "off"
 
     storage_dir = Path(".cache/knowledge/")
 
     def __post_init__(self):
         headers = {"Authorization": f"Bearer {self.api_key}"}
-        self.client = httpx.Client(base_url=self.base_url, headers=headers)
-
-        self.storage_dir.mkdir(exist_ok=True, parents=True)
+        transport = DifyRetryTransport(self.transport, retry=self.retry, rate_limit=self.rate_limit)
+        self.client = httpx.Client(base_url=self.base_url, headers=headers, transport=transport)
+        self.recorder = make_recorder(self.recorder, self.storage_dir)
 
     @classmethod
     def from_env(
-        cls, api_key: str | None = None, base_url: str | None = None, dataset_id: str = "", document_id: str = ""
+        cls,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        dataset_id: str = "",
+        document_id: str = "",
+        **kwargs,
     ):
         base_url = base_url or os.environ["DIFY_BASE_URL"]
         api_key = api_key or os.environ["DIFY_KNOWLEDGE_API_KEY"]
-        return cls(api_key=api_key, base_url=base_url, dataset_id=dataset_id, document_id=document_id)
+        return cls(api_key=api_key, base_url=base_url, dataset_id=dataset_id, document_id=document_id, **kwargs)
 
-    def _cache_interface_response(self, response: httpx.Response, filename: str | None = None):
-        if not filename or not isinstance(filename, str):
-            return
+    def close(self):
+        self.client.close()
+        self.recorder.close()
 
-        try:
-            fp = self.storage_dir / filename
-            fp.write_text(json.dumps(response.json(), ensure_ascii=False, indent=2), encoding="utf8")
-        except Exception as err:
-            logger.error(f"Failed to save knowledge dataset to disk: {err}")
+    def _cache_interface_response(self, response: httpx.Response, filename: str | None = None):
+        self.recorder.record(response, filename)
 
     def _send_request(
         self, request_method: str, url: str, *, files=None, json=None, params=None, **kwargs
@@ -153,6 +162,13 @@ class KnowledgeDatasetsClient:
         """
         新增分段
 
+        ```
+        curl --location --request POST 'http://192.168.1.180/v1/datasets/{dataset_id}/documents/{document_id}/segments' \
+        --header 'Authorization: Bearer {api_key}' \
+        --header 'Content-Type: application/json' \
+        --data-raw '{"segments": [{"content": "1","answer": "1","keywords": ["a"]}]}'
+        ```
+
         Args:
             document_id: 文档 ID
             segments: 分段信息
@@ -160,8 +176,50 @@ class KnowledgeDatasetsClient:
 
         Returns:
 
+        """
+        dataset_id = dataset_id or self.dataset_id
+        payload = {"segments": [segment.model_dump() for segment in segments]}
+        urlpath = f"/datasets/{dataset_id}/documents/{document_id}/segments"
+        return self._send_request(
+            "POST", urlpath, payload=payload, dataset_id=dataset_id, cache_log="create_segments.json"
+        )
+
+    def bulk_create_segments(
+        self, document_id: str, segments: Iterable[Segment], *, dataset_id: str | None = "", **kwargs
+    ) -> BulkSegmentReport:
+        """
+        批量新增分段，自动打包请求并发发送
+
+        Args:
+            document_id: 文档 ID
+            segments: 分段信息，可以是生成器
+            dataset_id: 知识库 ID
+            **kwargs: SegmentBulkWriter 的参数 max_batch_bytes, max_batch_tokens, max_concurrency ...
+
+        Returns: 逐个分段的写入结果
+
+        """
+        return SegmentBulkWriter(self, **kwargs).write(document_id, segments, dataset_id=dataset_id)
+
+    def iter_datasets(self, limit: int = 100, *, prefetch: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        逐页遍历全部知识库
+
+        Args:
+            limit: 每页条数，范围 1-100
+            prefetch: 处理当前页时在后台预取下一页
+
+        Returns:
+
         """
 
+        def fetch_page(page: int) -> Dict[str, Any]:
+            response = self.list_datasets(page=str(page), limit=str(limit))
+            response.raise_for_status()
+            return response.json()
+
+        return paginate(fetch_page, prefetch=prefetch)
+
     def list_datasets(self, page: str = "1", limit: str = "20") -> httpx.Response:
         """
         知识库列表
@@ -175,8 +233,8 @@ class KnowledgeDatasetsClient:
         Returns:
 
         """
-        payload = {"page": page, "limit": limit}
-        return self._send_request("GET", "/datasets", payload=payload, cache_log="list_datasets.json")
+        params = {"page": page, "limit": limit}
+        return self._send_request("GET", "/datasets", params=params, cache_log="list_datasets.json")
 
     def list_documents(
         self, keyword: str | None = "", page: str | None = "", limit: str | None = "", *, dataset_id: str | None = ""
@@ -203,6 +261,29 @@ class KnowledgeDatasetsClient:
         urlpath = f"/datasets/{dataset_id}/documents"
         return self._send_request("GET", urlpath, params=params, dataset_id=dataset_id, cache_log="list_documents.json")
 
+    def iter_documents(
+        self, keyword: str | None = "", limit: int = 100, *, dataset_id: str | None = "", prefetch: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐页遍历知识库中的全部文档，不会一次性加载所有文档
+
+        Args:
+            keyword: 搜索关键词，可选，目前仅搜索文档名称
+            limit: 每页条数，范围 1-100
+            dataset_id: 知识库 ID
+            prefetch: 处理当前页时在后台预取下一页
+
+        Returns:
+
+        """
+
+        def fetch_page(page: int) -> Dict[str, Any]:
+            response = self.list_documents(keyword, page=str(page), limit=str(limit), dataset_id=dataset_id)
+            response.raise_for_status()
+            return response.json()
+
+        return paginate(fetch_page, prefetch=prefetch)
+
     def list_segments(
         self,
         document_id: str,
@@ -310,7 +391,15 @@ class KnowledgeDatasetsClient:
 
         """
 
-    def update_segments(self, segment_id: str, segments: List[Segment], *, dataset_id: str | None = ""):
+    def update_segments(
+        self,
+        segment_id: str,
+        segment: Segment,
+        *,
+        enabled: bool = True,
+        document_id: str | None = "",
+        dataset_id: str | None = "",
+    ):
         """
         更新文档分段
 
@@ -322,13 +411,20 @@ class KnowledgeDatasetsClient:
         ```
 
         Args:
-            dataset_id: 知识库 ID
             segment_id: 文档分段ID
-            segments:
+            segment: 分段的新内容
+            enabled: 是否启用该分段
+            document_id: 文档 ID
+            dataset_id: 知识库 ID
 
         Returns:
 
         """
+        dataset_id = dataset_id or self.dataset_id
+        document_id = document_id or self.document_id
+        payload = {"segment": {**segment.model_dump(), "enabled": enabled}}
+        urlpath = f"/datasets/{dataset_id}/documents/{document_id}/segments/{segment_id}"
+        return self._send_request("POST", urlpath, payload=payload, dataset_id=dataset_id)
 
     def delete_documents(self, document_id: str, *, dataset_id: str | None = ""):
         """
@@ -341,7 +437,7 @@ class KnowledgeDatasetsClient:
 
         """
 
-    def delete_segments(self, segment_id: str, *, dataset_id: str | None = ""):
+    def delete_segments(self, segment_id: str, *, document_id: str | None = "", dataset_id: str | None = ""):
         """
         删除文档分段
 
@@ -352,9 +448,14 @@ class KnowledgeDatasetsClient:
         ```
 
         Args:
-            dataset_id: 知识库 ID
             segment_id: 文档分段ID
+            document_id: 文档 ID
+            dataset_id: 知识库 ID
 
         Returns:
 
         """
+        dataset_id = dataset_id or self.dataset_id
+        document_id = document_id or self.document_id
+        urlpath = f"/datasets/{dataset_id}/documents/{document_id}/segments/{segment_id}"
+        return self._send_request("DELETE", urlpath, dataset_id=dataset_id)
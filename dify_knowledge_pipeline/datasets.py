@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+from loguru import logger
+
+
+def dataset_cache_key(base_url: str, api_key: str, db_name: str) -> str:
+    """同名知识库在不同的 Dify 实例、不同的 API 密钥下是不同的知识库，键中不保存密钥本身"""
+    fingerprint = hashlib.blake2b(api_key.encode("utf8"), digest_size=8).hexdigest()
+    return f"{base_url.rstrip('/')}|{fingerprint}|{db_name}"
+
+
+class DatasetCache:
+    """
+    知识库名称 -> dataset_id 的缓存
+
+    - 进程内缓存，ttl 秒后过期；传入 path 时同时写入磁盘，新进程在 ttl 内不需要重新查询
+    - lock(key) 返回该键的锁，并发解析同一个知识库时只有一个调用方发起查询或创建请求
+    """
+
+    def __init__(self, ttl: float = 600, path: Path | str | os.PathLike | None = None):
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+        if self.path and self.path.is_file():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf8"))
+                self._entries = {k: (v["id"], v["resolved_at"]) for k, v in data.items()}
+            except (OSError, ValueError, KeyError, TypeError) as err:
+                logger.warning(f"知识库缓存文件损坏，将重新查询 - {self.path=} {err=}")
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return
+            dataset_id, resolved_at = entry
+            if time.time() - resolved_at > self.ttl:
+                self._entries.pop(key, None)
+                return
+            return dataset_id
+
+    def set(self, key: str, dataset_id: str):
+        with self._lock:
+            self._entries[key] = (dataset_id, time.time())
+        self._save()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return
+        self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._save()
+
+    def lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {k: {"id": i, "resolved_at": t} for k, (i, t) in self._entries.items()}
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf8")
+        os.replace(tmp, self.path)
+
+
+# 未指定 dataset_cache 的 DifyFireDrop 共享同一个进程内缓存
+DEFAULT_DATASET_CACHE = DatasetCache()
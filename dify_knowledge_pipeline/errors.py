@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from enum import Enum
 
 
@@ -42,3 +44,29 @@ class DifyClientError(Enum):
         400,
         "The metadata content is incorrect. Please check and verify.",
     )
+
+    @property
+    def code(self) -> str:
+        return self.value[0]
+
+    @property
+    def status_code(self) -> int:
+        return self.value[1]
+
+    @property
+    def message(self) -> str:
+        return self.value[2]
+
+    @property
+    def retryable(self) -> bool:
+        """知识库仍在初始化、文档仍在处理中，稍后重试即可成功"""
+        return self in (
+            DifyClientError.KNOWLEDGE_400_DATASET_NOT_INITIALIZED,
+            DifyClientError.KNOWLEDGE_400_DOCUMENT_INDEXING,
+        )
+
+    @classmethod
+    def from_code(cls, code: str | None) -> DifyClientError | None:
+        for error in cls:
+            if error.code == code:
+                return error
@@ -6,7 +6,10 @@
 import os
 import sys
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from functools import partial
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Literal, Mapping, Tuple, TypeVar
 from urllib.parse import urlparse
 
 import dotenv
@@ -15,14 +18,80 @@ from loguru import logger
 from pydantic import BaseModel, Field
 from tqdm import tqdm
 
+from dify_knowledge_pipeline.cards import KnowledgeCard
+from dify_knowledge_pipeline.datasets import DEFAULT_DATASET_CACHE, DatasetCache, dataset_cache_key
+from dify_knowledge_pipeline.index import DocumentIndex
+from dify_knowledge_pipeline.indexing import BatchStatus, IndexingTracker
+from dify_knowledge_pipeline.journal import RunJournal
+from dify_knowledge_pipeline.metrics import Metrics, current_metrics
+from dify_knowledge_pipeline.models import Segment
+from dify_knowledge_pipeline.pagination import paginate
+from dify_knowledge_pipeline.plan import PlannedDocument, SyncPlan
+from dify_knowledge_pipeline.scheduler import UploadScheduler
+from dify_knowledge_pipeline.segments import SegmentDiff, diff_segments, split_card
+from dify_knowledge_pipeline.state import SyncState, card_digest
+from dify_knowledge_pipeline.streaming import buffered
+from dify_knowledge_pipeline.tokens import TokenCounter
+from dify_knowledge_pipeline.transport import DifyRetryTransport, RetryPolicy
+
 dotenv.load_dotenv()
 
+T = TypeVar("T")
+
 
 class UploadDocumentResponse(BaseModel):
     document: Dict[str, Any] = Field(default_factory=dict)
     batch: str = Field(...)
 
 
+class DocumentSyncResult(BaseModel):
+    table_name: str
+    action: Literal["created", "updated", "skipped", "deleted", "failed"]
+    document_id: str | None = None
+    batch: str | None = Field(None, description="上传批次号，用于查询嵌入状态")
+    error: str | None = None
+    segments: Dict[str, int] | None = Field(None, description="分段差量同步时各类分段的数量")
+
+
+class SyncReport(BaseModel):
+    dataset_id: str | None = None
+    created: int = Field(0, description="新建的文档数量")
+    updated: int = Field(0, description="更新（或删除后重建）的文档数量")
+    skipped: int = Field(0, description="内容未变化、未发起请求的文档数量")
+    deleted: int = Field(0, description="删除的过期文档数量")
+    failed: int = Field(0, description="请求失败的文档数量")
+    results: List[DocumentSyncResult] = Field(default_factory=list, description="逐个文档的同步结果")
+
+    @property
+    def uploaded(self) -> int:
+        return self.created + self.updated
+
+    @property
+    def batches(self) -> List[str]:
+        return [r.batch for r in self.results if r.batch]
+
+    @property
+    def errors(self) -> List[DocumentSyncResult]:
+        return [r for r in self.results if r.action == "failed"]
+
+    def add(self, result: DocumentSyncResult):
+        self.results.append(result)
+        setattr(self, result.action, getattr(self, result.action) + 1)
+
+
+class DeleteReport(BaseModel):
+    dataset_id: str | None = None
+    total: int = Field(0, description="待删除的文档数量")
+    deleted: int = Field(0, description="删除成功（或已不存在）的文档数量")
+    failed: int = Field(0, description="重试后仍删除失败的文档数量")
+    elapsed: float = Field(0.0, description="耗时（秒）")
+    results: List[DocumentSyncResult] = Field(default_factory=list, description="逐个文档的删除结果")
+
+    @property
+    def errors(self) -> List[DocumentSyncResult]:
+        return [r for r in self.results if r.action == "failed"]
+
+
 class DifyFireDrop:
     def __init__(
         self,
@@ -30,9 +99,43 @@ class DifyFireDrop:
         dify_base_url: str = "http://192.168.1.180/v1",
         api_key: str | None = None,
         max_tokens: int | None = None,
+        state_path: Path | str | os.PathLike | None = None,
+        max_concurrency: int = 1,
+        page_size: int = 100,
+        retry: RetryPolicy | None = None,
+        rate_limit: float | None = None,
+        transport: httpx.BaseTransport | None = None,
+        metrics: Metrics | None = None,
+        dataset_cache: DatasetCache | None = None,
+        scheduler: UploadScheduler | None = None,
+        journal_dir: Path | str | os.PathLike | None = None,
     ):
+        """
+        Args:
+            separator: 分段标识符
+            dify_base_url:
+            api_key: 知识库 API 密钥，默认读取环境变量 DIFY_DATABASE_API_KEY
+            max_tokens: 分段最大长度
+            state_path: 本地同步状态文件
+            max_concurrency: 并发上传的文档数量
+            page_size: 列表接口每页条数，范围 1-100
+            retry: 重试策略，默认对 429/5xx/网络错误以及 Dify 的可重试错误码做指数退避重试
+            rate_limit: 客户端限流，每秒最多发出的请求数
+            transport: 实际发送请求的 httpx transport，默认 httpx.HTTPTransport
+            metrics: 记录同步各阶段耗时与请求计数，默认使用 use_metrics 设置的当前 Metrics
+            dataset_cache: 知识库名称 -> dataset_id 的缓存，默认使用进程内共享的缓存
+            scheduler: 上传顺序、token 与请求预算以及嵌入积压的调度，默认按输入顺序直接上传
+            journal_dir: 同步运行日志（run_id）的存放目录
+        """
         self.my_separator = separator or "\n\n------------\n\n"
         self.my_max_tokens = max_tokens or 4096
+        self._state_path = state_path or Path(".cache/knowledge/sync_state.json")
+        self._state: SyncState | None = None
+        self._journal_dir = Path(journal_dir or ".cache/knowledge/runs")
+        self.max_concurrency = max(1, max_concurrency)
+        self.page_size = min(max(1, page_size), 100)
+        self.metrics = metrics or current_metrics()
+        self.dataset_cache = dataset_cache or DEFAULT_DATASET_CACHE
 
         if not (_dify_dataset_api_key := os.getenv("DIFY_DATABASE_API_KEY", api_key)):
             parser = urlparse(dify_base_url)
@@ -42,7 +145,83 @@ class DifyFireDrop:
 
         self._headers = {"Authorization": f"Bearer {_dify_dataset_api_key}"}
         self._dify_base_url = dify_base_url
-        self._client = httpx.Client(base_url=self._dify_base_url, headers=self._headers)
+        self._dataset_key = partial(dataset_cache_key, dify_base_url, _dify_dataset_api_key)
+        # 并发上传共享同一个连接池，保持 keep-alive 连接
+        limits = httpx.Limits(
+            max_connections=max(self.max_concurrency, 10), max_keepalive_connections=max(self.max_concurrency, 10)
+        )
+        self._transport = DifyRetryTransport(
+            transport or httpx.HTTPTransport(limits=limits), retry=retry, rate_limit=rate_limit, metrics=self.metrics
+        )
+        self._client = httpx.Client(base_url=self._dify_base_url, headers=self._headers, transport=self._transport)
+        self.scheduler = (scheduler or UploadScheduler()).bind(
+            self._get_indexing_status, separator=self.my_separator, metrics=self.metrics
+        )
+
+    @property
+    def state(self) -> SyncState:
+        if self._state is None:
+            self._state = SyncState(self._state_path)
+        return self._state
+
+    def _card_digest(self, knowledge_card: str) -> str:
+        return card_digest(knowledge_card, separator=self.my_separator, max_tokens=self.my_max_tokens)
+
+    def _run_tasks(
+        self, fn: Callable[..., DocumentSyncResult], items: Iterable[Tuple[str, str | KnowledgeCard]], *, desc: str = ""
+    ) -> SyncReport:
+        """
+        以 max_concurrency 的并发度执行逐文档任务，单个文档失败不会中断整批同步
+
+        Args:
+            fn: fn(table_name, knowledge_card) -> DocumentSyncResult
+            items: (table_name, knowledge_card)，KnowledgeCard 句柄在任务开始时才读取为文本
+            desc: 进度条描述
+
+        Returns:
+
+        """
+        report = SyncReport()
+        progress = tqdm(items, desc=desc) if self.max_concurrency == 1 else tqdm(desc=desc)
+
+        def run(table_name: str, knowledge_card: str | KnowledgeCard) -> DocumentSyncResult:
+            try:
+                with self.metrics.timer("sync.document"):
+                    result = fn(table_name, str(knowledge_card))
+            except Exception as err:
+                # 除网络错误外，响应体不符合预期时的 ValidationError、KeyError 等同样只记为该文档失败
+                logger.error(f"同步文档失败 - {table_name=} {err=}")
+                result = DocumentSyncResult(table_name=table_name, action="failed", error=repr(err))
+            self.metrics.incr(f"sync.{result.action}")
+            return result
+
+        if self.max_concurrency == 1:
+            for table_name, knowledge_card in progress:
+                progress.postfix = f"{table_name=}"
+                report.add(run(table_name, knowledge_card))
+            return report
+
+        # 限制在途任务数量，生成器输入时不会被一次性读完
+        max_pending = self.max_concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = set()
+            for table_name, knowledge_card in items:
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        report.add(result := future.result())
+                        progress.update()
+                        progress.postfix = f"table_name={result.table_name!r}"
+                pending.add(executor.submit(run, table_name, knowledge_card))
+                progress.total = (progress.total or 0) + 1
+                progress.refresh()
+            for future in as_completed(pending):
+                report.add(result := future.result())
+                progress.update()
+                progress.postfix = f"table_name={result.table_name!r}"
+        progress.close()
+
+        return report
 
     def _document_preprocess_payload(self, *, name: str = "", text: str = ""):
         payload = {
@@ -67,6 +246,72 @@ class DifyFireDrop:
         res = self._client.delete(url)
         res.raise_for_status()
 
+    def _delete_documents(
+        self, dataset_id: str, documents: List[Dict[str, Any]], *, retry_rounds: int = 1, desc: str = ""
+    ) -> DeleteReport:
+        """
+        以 max_concurrency 的并发度批量删除文档
+
+        - 单个请求的 429/5xx/网络错误先由 transport 退避重试，仍然失败的文档在本轮结束后重新提交，最多 retry_rounds 轮
+        - 404 视为已删除，重复执行是安全的
+
+        Args:
+            dataset_id: 知识库 ID
+            documents: 待删除的文档 {id, name}
+            retry_rounds: 失败文档的重试轮数
+            desc: 进度条描述
+
+        Returns: 删除汇总，不会修改本地同步状态
+
+        """
+        report = DeleteReport(dataset_id=dataset_id, total=len(documents))
+        start = time.perf_counter()
+        progress = tqdm(total=len(documents), desc=desc)
+
+        def delete(document: Dict[str, Any]) -> Tuple[DocumentSyncResult, bool]:
+            """Returns: (result, retryable)"""
+            table_name = DocumentIndex.table_name(document["name"])
+            try:
+                with self.metrics.timer("sync.delete"):
+                    self._delete_document(dataset_id, document["id"])
+            except httpx.HTTPStatusError as err:
+                status = err.response.status_code
+                if status != 404:
+                    result = DocumentSyncResult(
+                        table_name=table_name, action="failed", document_id=document["id"], error=repr(err)
+                    )
+                    return result, status == 429 or status >= 500
+            except httpx.HTTPError as err:
+                result = DocumentSyncResult(
+                    table_name=table_name, action="failed", document_id=document["id"], error=repr(err)
+                )
+                return result, True
+            return DocumentSyncResult(table_name=table_name, action="deleted", document_id=document["id"]), False
+
+        pending = documents
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for attempt in range(retry_rounds + 1):
+                retry = []
+                for document, (result, retryable) in zip(pending, executor.map(delete, pending)):
+                    if result.action == "failed" and retryable and attempt < retry_rounds:
+                        retry.append(document)
+                        continue
+                    if result.action == "failed":
+                        logger.warning(f"Failed to delete document - {document['name']=} error={result.error}")
+                    self.metrics.incr(f"sync.{result.action}")
+                    report.results.append(result)
+                    setattr(report, result.action, getattr(report, result.action) + 1)
+                    progress.update()
+                    progress.postfix = f"failed={report.failed}"
+                if not (pending := retry):
+                    break
+                self.metrics.incr("sync.delete_retries", len(retry))
+                logger.debug(f"Retry failed deletions - round={attempt + 1} count={len(retry)}")
+        progress.close()
+
+        report.elapsed = time.perf_counter() - start
+        return report
+
     def _update_document_by_text(
         self, dataset_id: str, document_id: str, *, table_name: str, text: str
     ) -> UploadDocumentResponse | None:
@@ -106,33 +351,162 @@ class DifyFireDrop:
         # logger.success(f"通过文本创建知识库文档 - {document_name=}")
         return udr
 
-    def _hook_knowledge_dataset(self, db_name: str) -> str:
-        res = self._client.get("/datasets", params={"limit": "100"})
-        datasets = res.json()["data"]
-        for dataset in datasets:
+    def _list_segments(self, dataset_id: str, document_id: str) -> List[Dict[str, Any]]:
+        url = f"/datasets/{dataset_id}/documents/{document_id}/segments"
+        return list(paginate(partial(self._get_page, url)))
+
+    def _sync_segments(
+        self,
+        dataset_id: str,
+        document_id: str,
+        *,
+        knowledge_card: str,
+        before_write: Callable[[SegmentDiff], None] | None = None,
+    ) -> SegmentDiff:
+        """
+        只新增、更新、删除内容发生变化的分段，Dify 只会重新嵌入这些分段
+
+        Args:
+            before_write: 计算出差异后、发出写请求前调用，例如按差异申请上传预算；分段没有变化时不调用
+
+        Returns: 分段差异
+
+        """
+        url = f"/datasets/{dataset_id}/documents/{document_id}/segments"
+        diff = diff_segments(
+            self._list_segments(dataset_id, document_id), split_card(knowledge_card, self.my_separator)
+        )
+        if diff.changed and before_write is not None:
+            before_write(diff)
+
+        for segment_id, content in diff.update:
+            res = self._client.post(
+                f"{url}/{segment_id}", json={"segment": {**Segment(content=content).model_dump(), "enabled": True}}
+            )
+            res.raise_for_status()
+        if diff.create:
+            res = self._client.post(url, json={"segments": [Segment(content=c).model_dump() for c in diff.create]})
+            res.raise_for_status()
+        for segment_id in diff.delete:
+            res = self._client.delete(f"{url}/{segment_id}")
+            res.raise_for_status()
+
+        for name, value in diff.summary().items():
+            self.metrics.incr(f"sync.segments_{name}", value)
+        return diff
+
+    def _hook_knowledge_dataset(self, db_name: str, *, create: bool = True) -> str | None:
+        """
+        Args:
+            db_name: 知识库名称
+            create: 知识库不存在时是否创建，为 False 时返回 None
+        """
+        key = self._dataset_key(db_name)
+        if dataset_id := self.dataset_cache.get(key):
+            self.metrics.incr("sync.dataset_cache_hits")
+            return dataset_id
+
+        # 并发解析同一个知识库时只有一个调用方查询、创建，其余调用方等待后直接读取缓存
+        with self.dataset_cache.lock(key), self.metrics.timer("sync.resolve_dataset"):
+            if dataset_id := self.dataset_cache.get(key):
+                self.metrics.incr("sync.dataset_cache_hits")
+                return dataset_id
+            if not (dataset_id := self._find_dataset_id(db_name)):
+                if not create:
+                    return
+                dataset_id = self._create_dataset(db_name)
+            self.dataset_cache.set(key, dataset_id)
+            return dataset_id
+
+    def _find_dataset_id(self, db_name: str) -> str | None:
+        for dataset in self.iter_datasets():
             if dataset["name"] == db_name:
                 dataset_id = dataset["id"]
                 logger.success(f"获取知识库Id - Name={db_name} Id={dataset_id}")
                 return dataset_id
 
+    def _create_dataset(self, db_name: str) -> str:
         logger.warning(
             "知识库不存在！使用 RootAPI 创建的知识库在 Dify 中不可见，请使用 ROOT 账号手动将知识库权限设为<团队成员可见>"
         )
         res = self._client.post("/datasets", json={"name": db_name})
+        if res.status_code == 409 and (dataset_id := self._find_dataset_id(db_name)):
+            # 其他进程抢先创建了同名知识库
+            return dataset_id
+        res.raise_for_status()
         logger.success(f"创建知识库 - {res.json()}")
+        return res.json()["id"]
+
+    def _on_dataset(self, db_name: str, fn: Callable[[str], T], *, create: bool = True) -> Tuple[str | None, T | None]:
+        """
+        解析知识库并执行 fn(dataset_id)
+
+        缓存的知识库已被删除（fn 返回 404）时，使缓存失效并重新解析、执行一次。fn 应当一次性完成请求，不能返回惰性的生成器。
 
-        return self._hook_knowledge_dataset(db_name)
+        Returns: (dataset_id, fn 的返回值)，create=False 且知识库不存在时为 (None, None)
+
+        """
+        if not (dataset_id := self._hook_knowledge_dataset(db_name, create=create)):
+            return None, None
+        try:
+            return dataset_id, fn(dataset_id)
+        except httpx.HTTPStatusError as err:
+            if err.response.status_code != 404:
+                raise
+
+        logger.warning(f"知识库已不存在，重新解析 - {db_name=} {dataset_id=}")
+        self.dataset_cache.invalidate(self._dataset_key(db_name))
+        if not (dataset_id := self._hook_knowledge_dataset(db_name, create=create)):
+            return None, None
+        return dataset_id, fn(dataset_id)
 
     def _sync_document_id(self, dataset_id: str, table_name: str) -> str | None:
-        documents = self._list_documents(dataset_id, table_name)
         document_name = f"{table_name}.txt"
 
-        for document in documents:
+        for document in self.iter_documents(dataset_id, keyword=table_name):
             if document["name"] == document_name:
                 document_id = document["id"]
                 # logger.debug(f"获取知识库文档Id - {document_name=} {document_id=}")
                 return document_id
 
+    def _build_document_index(self, dataset_id: str) -> DocumentIndex:
+        return DocumentIndex(self.iter_documents(dataset_id, prefetch=True))
+
+    def _get_page(self, url: str, page: int, **params) -> Dict[str, Any]:
+        res = self._client.get(url, params={**params, "page": page, "limit": self.page_size})
+        res.raise_for_status()
+        return res.json()
+
+    def iter_datasets(self, *, prefetch: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        逐页遍历全部知识库
+
+        Args:
+            prefetch: 处理当前页时在后台预取下一页
+
+        Returns:
+
+        """
+        return paginate(partial(self._get_page, "/datasets"), prefetch=prefetch)
+
+    def iter_documents(
+        self, dataset_id: str, *, keyword: str | None = None, prefetch: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐页遍历知识库中的全部文档，不会一次性加载所有文档
+
+        Args:
+            dataset_id: 知识库 ID
+            keyword: 按文档名称搜索
+            prefetch: 处理当前页时在后台预取下一页
+
+        Returns:
+
+        """
+        url = f"/datasets/{dataset_id}/documents"
+        params = {"keyword": keyword} if keyword else {}
+        return paginate(partial(self._get_page, url, **params), prefetch=prefetch)
+
     def _list_documents(self, dataset_id: str, table_name: str | None = None) -> List[Dict[str, Any]]:
         """
 
@@ -164,41 +538,64 @@ class DifyFireDrop:
           "doc_form": "text_model"
         }
         """
-        params = {"keyword": table_name, "limit": "100"}
-        res = self._client.get(f"/datasets/{dataset_id}/documents", params=params)
-
-        documents = res.json()["data"]
+        documents = list(self.iter_documents(dataset_id, keyword=table_name))
         # logger.success("获取知识库文档列表")
         return documents
 
-    def _sync_indexing_status(self, dataset_id: str, batch: str):
+    def _get_indexing_status(self, dataset_id: str, batch: str) -> List[Dict[str, Any]]:
         url = f"/datasets/{dataset_id}/documents/{batch}/indexing-status"
+        res = self._client.get(url)
+        res.raise_for_status()
+        return res.json()["data"]
 
-        progress = tqdm(total=1, desc="Embedding")
+    def _sync_indexing_status(self, dataset_id: str, batch: str) -> BatchStatus:
+        return self.await_indexed(dataset_id, [batch])[0]
 
-        while True:
-            res = self._client.get(url)
-            data = res.json()["data"][0]
-            progress.total = data["total_segments"]
-            progress.update(data["completed_segments"])
-            status = data["indexing_status"]
+    def await_indexed(
+        self, dataset_id: str, batches: Iterable[str], *, timeout: float | None = None, **kwargs
+    ) -> List[BatchStatus]:
+        """
+        阻塞直到批次全部嵌入完成，知识库可被检索
 
-            progress.postfix = f"Indexing Status: {status}"
-            time.sleep(1)
+        Args:
+            dataset_id: 知识库 ID
+            batches: 上传文档返回的批次号，例如 SyncReport.batches
+            timeout: 总超时时间（秒）
+            **kwargs: IndexingTracker 的轮询参数 min_interval, max_interval, backoff ...
 
-            if status in ["error", "completed"]:
-                break
+        Returns: 每个批次的最终状态、耗时与错误信息
+
+        """
+        kwargs.setdefault("max_concurrency", self.max_concurrency)
+        tracker = IndexingTracker(self._get_indexing_status, **kwargs)
+        with self.metrics.timer("sync.await_indexed"):
+            statuses = tracker.await_indexed([(dataset_id, batch) for batch in batches], timeout=timeout)
+        self.metrics.incr("sync.indexing_polls", sum(s.polls for s in statuses))
+        if failed := [s for s in statuses if s.indexing_status != "completed"]:
+            logger.warning(f"部分批次未完成嵌入 - count={len(failed)} {[(s.batch, s.indexing_status) for s in failed]}")
+        return statuses
 
     def list_documents(self, *, db_name: str, table_name: str | None = None):
-        if dataset_id := self._hook_knowledge_dataset(db_name=db_name):
-            return self._list_documents(dataset_id, table_name=table_name)
+        _, documents = self._on_dataset(db_name, partial(self._list_documents, table_name=table_name))
+        return documents
 
     def delete_document(self, *, db_name: str, document_name: str):
-        if dataset_id := self._hook_knowledge_dataset(db_name=db_name):
-            if document_id := self._sync_document_id(dataset_id, document_name):
-                return self._delete_document(dataset_id, document_id)
+        dataset_id, document_id = self._on_dataset(db_name, partial(self._sync_document_id, table_name=document_name))
+        if document_id:
+            self._delete_document(dataset_id, document_id)
+            self.state.discard(dataset_id, document_name)
+            self.state.save()
 
-    def embed_knowledge(self, table_to_knowledge: Dict[str, str], *, db_name: str, force_override: bool = False):
+    def embed_knowledge(
+        self,
+        table_to_knowledge: Dict[str, str | KnowledgeCard],
+        *,
+        db_name: str,
+        force_override: bool = False,
+        skip_unchanged: bool = False,
+        differential: bool = False,
+        run_id: str | None = None,
+    ) -> SyncReport | None:
         """
         通过文本更新文档。
 
@@ -211,83 +608,448 @@ class DifyFireDrop:
             force_override: 删除文档再创建
             table_to_knowledge: (table_name, KnowledgeCard) .to_knowledge_card() 返回的已编排好的知识卡片
             db_name: 统一存放数据集市业务数据的知识库名称，默认为 "数据集市"
+            skip_unchanged: 对比本地同步状态（state_path）中记录的卡片哈希，内容未变化且仍存在于知识库中的文档不发起任何请求。
+            differential: 已存在且嵌入完成的文档按分段差量同步，只重新嵌入内容变化的分段，而不是整篇 update_by_text
+            run_id: 同步运行 ID。传入时在 journal_dir 中记录运行日志，运行中断后使用相同的 run_id 重新调用，
+                已完成的文档直接跳过，中断时已经生效的新建不会重复执行
 
-        Returns:
+        Returns: 新建、更新、跳过的文档数量
 
         """
         if not table_to_knowledge:
             logger.error("不可以添加空的文档")
             return
 
+        return self._embed(
+            self.scheduler.order(table_to_knowledge.items()),
+            db_name=db_name,
+            force_override=force_override,
+            skip_unchanged=skip_unchanged,
+            differential=differential,
+            run_id=run_id,
+        )
+
+    def embed_knowledge_stream(
+        self,
+        items: Iterable[Tuple[str, str]],
+        *,
+        db_name: str,
+        force_override: bool = False,
+        skip_unchanged: bool = False,
+        differential: bool = False,
+        queue_size: int = 64,
+        run_id: str | None = None,
+    ) -> SyncReport:
+        """
+        边分片边上传，参数同 embed_knowledge
+
+        items 在后台线程中被消费，经由容量为 queue_size 的有界队列交给上传线程，
+        分片与上传同时进行，内存中只保留队列与在途请求中的卡片。
+
+        ```python
+        cards = fork_tech_docs_markdown_to_chunks(fdr_docs, fdr_out, offload=False)
+        report = DifyFireDrop(max_concurrency=8).embed_knowledge_stream(cards, db_name=db_name)
+        ```
+
+        Args:
+            items: (table_name, KnowledgeCard) 可迭代对象，通常是 fork_*_to_chunks 返回的生成器
+            queue_size: 已分片、待上传的卡片数量上限
+
+        Returns:
+
+        """
+        return self._embed(
+            buffered(items, maxsize=queue_size, name="chunker", metrics=self.metrics),
+            db_name=db_name,
+            force_override=force_override,
+            skip_unchanged=skip_unchanged,
+            differential=differential,
+            run_id=run_id,
+        )
+
+    def _embed(
+        self,
+        items: Iterable[Tuple[str, str]],
+        *,
+        db_name: str,
+        force_override: bool = False,
+        skip_unchanged: bool = False,
+        differential: bool = False,
+        run_id: str | None = None,
+    ) -> SyncReport:
         # [操作/新建] 知识库，获取操作句柄
-        dataset_id = self._hook_knowledge_dataset(db_name=db_name)
+        with self.metrics.timer("sync.document_index"):
+            dataset_id, index = self._on_dataset(db_name, self._build_document_index)
+
+        journal = RunJournal.open(self._journal_dir, run_id, db_name=db_name) if run_id else None
 
         # 通过文本 [更新/创建] 文档，获取操作句柄
-        response_seq = []
-        tasks = tqdm(table_to_knowledge.items())
-        for table_name, knowledge_card in tasks:
-            tasks.postfix = f"{db_name=} {table_name=}"
-            if document_id := self._sync_document_id(dataset_id, table_name):
+        state = self.state
+
+        def write_document(table_name: str, knowledge_card: str, digest: str) -> DocumentSyncResult:
+            if skip_unchanged and state.is_unchanged(dataset_id, table_name, digest) and table_name in index:
+                return DocumentSyncResult(table_name=table_name, action="skipped")
+
+            document = index.get(table_name)
+            if document and differential and not force_override and document.get("indexing_status") == "completed":
+                # 分段接口在请求内完成嵌入、不返回批次号，不计入嵌入积压；只按变化的分段申请预算
+                diff = self._sync_segments(
+                    dataset_id,
+                    document["id"],
+                    knowledge_card=knowledge_card,
+                    before_write=lambda d: self.scheduler.admit(
+                        segments=[content for _, content in d.update] + d.create,
+                        requests=len(d.update) + bool(d.create) + len(d.delete),
+                    ),
+                )
+                state.set(dataset_id, table_name, digest=digest, document_id=document["id"])
+                return DocumentSyncResult(
+                    table_name=table_name,
+                    action="updated" if diff.changed else "skipped",
+                    document_id=document["id"],
+                    segments=diff.summary(),
+                )
+
+            self.scheduler.admit(knowledge_card, requests=2 if document and force_override else 1)
+            if document_id := index.get_id(table_name):
                 if force_override:
                     self._delete_document(dataset_id, document_id)
+                    index.remove(table_name)
                     response = self._create_document_by_text(dataset_id, table_name=table_name, text=knowledge_card)
                 else:
                     response = self._update_document_by_text(
                         dataset_id, document_id, table_name=table_name, text=knowledge_card
                     )
+                if not response:
+                    return DocumentSyncResult(
+                        table_name=table_name, action="failed", document_id=document_id, error="update_by_text failed"
+                    )
+                action = "updated"
             else:
                 response = self._create_document_by_text(dataset_id, table_name=table_name, text=knowledge_card)
-            response_seq.append(response)
+                action = "created"
+
+            self.scheduler.track(dataset_id, response.batch)
+            index.add({"name": index.document_name(table_name), **response.document})
+            state.set(dataset_id, table_name, digest=digest, document_id=response.document.get("id"))
+            return DocumentSyncResult(
+                table_name=table_name, action=action, document_id=response.document.get("id"), batch=response.batch
+            )
+
+        def sync_document(table_name: str, knowledge_card: str) -> DocumentSyncResult:
+            digest = self._card_digest(knowledge_card)
+            if journal is None:
+                return write_document(table_name, knowledge_card, digest)
+
+            # 恢复中断的运行：跳过已完成的文档，采用中断时已经生效的新建
+            document_id = index.get_id(table_name)
+            if record := journal.completed(table_name, digest):
+                # 中断前的运行可能没来得及保存同步状态，与 adopted 一样重新记录
+                document_id = record.get("document_id") or document_id
+                state.set(dataset_id, table_name, digest=digest, document_id=document_id)
+                return DocumentSyncResult(table_name=table_name, action="skipped", document_id=document_id)
+            if journal.adoptable(table_name, digest, document_id):
+                journal.done(table_name, digest=digest, action="adopted", document_id=document_id)
+                state.set(dataset_id, table_name, digest=digest, document_id=document_id)
+                return DocumentSyncResult(table_name=table_name, action="skipped", document_id=document_id)
+
+            journal.begin(table_name, digest=digest, action="sync", document_id=document_id)
+            result = write_document(table_name, knowledge_card, digest)
+            if result.action != "failed":
+                journal.done(
+                    table_name, digest=digest, action=result.action, document_id=result.document_id, batch=result.batch
+                )
+            return result
+
+        try:
+            report = self._run_tasks(sync_document, items, desc=db_name)
+            report.dataset_id = dataset_id
+            if journal is not None and not report.failed:
+                journal.finish(created=report.created, updated=report.updated, skipped=report.skipped)
+        finally:
+            state.save()
+            if journal is not None:
+                journal.close()
+
+        logger.success(
+            f"同步知识库文档 - {db_name=} uploaded={report.uploaded} skipped={report.skipped} failed={report.failed}"
+        )
+        return report
+
+    def plan_sync(
+        self,
+        table_to_knowledge: Mapping[str, str | KnowledgeCard],
+        *,
+        db_name: str,
+        force_override: bool = False,
+        skip_unchanged: bool = False,
+        prune: bool = False,
+        encoding_name: str = "gpt2",
+    ) -> SyncPlan:
+        """
+        计算同步计划，不修改知识库与本地同步状态
+
+        与 embed_knowledge 使用相同的判定规则：对比一次拉取的文档列表与本地同步状态中的卡片哈希，
+        逐个文档给出 create/update/skip/delete，并按 Dify 的分段规则统计需要嵌入的 token 数。
+        知识库不存在时不会创建，全部文档计划为 create。
+
+        Args:
+            table_to_knowledge: {table_name: KnowledgeCard}
+            db_name: 知识库名称
+            force_override: 同 embed_knowledge，已存在的文档删除后重建
+            skip_unchanged: 同 embed_knowledge，跳过哈希未变化的文档
+            prune: 计划删除知识库中存在、但 table_to_knowledge 中不存在的文档
+            encoding_name: 统计 token 使用的 tiktoken 编码
+
+        Returns: 可序列化的同步计划，交给 apply_plan 执行
+
+        """
+        counter = TokenCounter.from_encoding_name(encoding_name)
+        with self.metrics.timer("sync.plan"):
+            dataset_id, index = self._on_dataset(db_name, self._build_document_index, create=False)
+            index = index or DocumentIndex()
+            state = self.state
+
+            documents = []
+            for table_name in sorted(table_to_knowledge):
+                text = str(table_to_knowledge[table_name])
+                digest = self._card_digest(text)
+                document_id = index.get_id(table_name)
+                if skip_unchanged and document_id and state.is_unchanged(dataset_id, table_name, digest):
+                    documents.append(
+                        PlannedDocument(table_name=table_name, action="skip", document_id=document_id, digest=digest)
+                    )
+                    continue
+                documents.append(
+                    PlannedDocument(
+                        table_name=table_name,
+                        action="update" if document_id else "create",
+                        document_id=document_id,
+                        digest=digest,
+                        num_tokens=sum(counter.count(segment) for segment in split_card(text, self.my_separator)),
+                        nbytes=len(text.encode("utf8")),
+                        requests=2 if document_id and force_override else 1,
+                    )
+                )
+
+            if prune:
+                for document in index.documents():
+                    if (table_name := index.table_name(document["name"])) not in table_to_knowledge:
+                        documents.append(
+                            PlannedDocument(
+                                table_name=table_name, action="delete", document_id=document["id"], requests=1
+                            )
+                        )
+                documents.sort(key=lambda d: d.table_name)
+
+        plan = SyncPlan(
+            db_name=db_name,
+            dataset_id=dataset_id,
+            force_override=force_override,
+            skip_unchanged=skip_unchanged,
+            prune=prune,
+            encoding_name=encoding_name,
+            documents=documents,
+        )
+        logger.info(f"同步计划 - {plan.summary()}")
+        return plan
+
+    def apply_plan(
+        self, plan: SyncPlan, table_to_knowledge: Mapping[str, str | KnowledgeCard], *, max_tokens: int | None = None
+    ) -> SyncReport:
+        """
+        执行 plan_sync 生成的同步计划
+
+        - 更新、删除直接使用计划中的 document_id，不再拉取文档列表
+        - 卡片内容与规划时不一致（哈希变化）或缺失的文档记为失败，需要重新规划
+        - 计划中跳过的文档不发起请求
+
+        Args:
+            plan: 同步计划
+            table_to_knowledge: {table_name: KnowledgeCard}，与规划时的卡片相同
+            max_tokens: 本次执行的嵌入 token 预算，超出预算的文档推迟到下一次执行，见 SyncPlan.split
+
+        Returns:
+
+        """
+        if max_tokens is not None:
+            plan, deferred = plan.split(max_tokens)
+            if deferred.documents:
+                logger.info(
+                    f"超出 token 预算，推迟执行 - {max_tokens=} count={len(deferred.documents)} tokens={deferred.num_tokens}"
+                )
+
+        dataset_id = plan.dataset_id or self._hook_knowledge_dataset(plan.db_name)
+        planned = {document.table_name: document for document in plan.documents}
+        state = self.state
+
+        def apply(table_name: str, knowledge_card: str) -> DocumentSyncResult:
+            entry = planned[table_name]
+            if entry.action == "delete":
+                self._delete_document(dataset_id, entry.document_id)
+                state.discard(dataset_id, table_name)
+                return DocumentSyncResult(table_name=table_name, action="deleted", document_id=entry.document_id)
+
+            if self._card_digest(knowledge_card) != entry.digest:
+                return DocumentSyncResult(
+                    table_name=table_name,
+                    action="failed",
+                    document_id=entry.document_id,
+                    error="knowledge card changed since the plan was made",
+                )
+
+            self.scheduler.admit(knowledge_card, requests=entry.requests, num_tokens=entry.num_tokens)
+            if entry.action == "update" and not plan.force_override:
+                response = self._update_document_by_text(
+                    dataset_id, entry.document_id, table_name=table_name, text=knowledge_card
+                )
+                if not response:
+                    return DocumentSyncResult(
+                        table_name=table_name,
+                        action="failed",
+                        document_id=entry.document_id,
+                        error="update_by_text failed",
+                    )
+            else:
+                if entry.action == "update":
+                    self._delete_document(dataset_id, entry.document_id)
+                response = self._create_document_by_text(dataset_id, table_name=table_name, text=knowledge_card)
+
+            self.scheduler.track(dataset_id, response.batch)
+            state.set(dataset_id, table_name, digest=entry.digest, document_id=response.document.get("id"))
+            return DocumentSyncResult(
+                table_name=table_name,
+                action="created" if entry.action == "create" else "updated",
+                document_id=response.document.get("id"),
+                batch=response.batch,
+            )
+
+        skipped, missing, items = [], [], []
+        for entry in plan.documents:
+            if entry.action == "skip":
+                skipped.append(entry)
+            elif entry.action == "delete":
+                items.append((entry.table_name, ""))
+            elif entry.table_name not in table_to_knowledge:
+                missing.append(entry)
+            else:
+                items.append((entry.table_name, table_to_knowledge[entry.table_name]))
+
+        try:
+            report = self._run_tasks(apply, self.scheduler.order(items), desc=plan.db_name)
+            report.dataset_id = dataset_id
+        finally:
+            state.save()
+
+        for entry in skipped:
+            report.add(DocumentSyncResult(table_name=entry.table_name, action="skipped", document_id=entry.document_id))
+        for entry in missing:
+            report.add(
+                DocumentSyncResult(
+                    table_name=entry.table_name,
+                    action="failed",
+                    document_id=entry.document_id,
+                    error="knowledge card is missing",
+                )
+            )
+
+        logger.success(
+            f"执行同步计划 - db_name={plan.db_name} uploaded={report.uploaded} deleted={report.deleted} "
+            f"skipped={report.skipped} failed={report.failed}"
+        )
+        return report
 
     def embed_knowledge_incremental_updates(
-        self, table_to_knowledge: Dict[str, str], table_to_update_time: Dict[str, int], *, db_name: str
-    ):
+        self, table_to_knowledge: Dict[str, str | KnowledgeCard], table_to_update_time: Dict[str, int], *, db_name: str
+    ) -> SyncReport | None:
         if not table_to_knowledge:
             logger.error("不可以添加空的文档")
             return
 
         # [操作/新建] 知识库，获取操作句柄
-        dataset_id = self._hook_knowledge_dataset(db_name=db_name)
-        docs = self._list_documents(dataset_id)
-        id2doc = {doc["id"]: doc for doc in docs}
+        dataset_id, index = self._on_dataset(db_name, self._build_document_index)
 
         # 通过文本 [更新/创建] 文档，获取操作句柄
-        tasks = tqdm(table_to_knowledge.items())
-        for document_name, knowledge_card in tasks:
-            tasks.postfix = f"{db_name=} {document_name=}"
-            if document_id := self._sync_document_id(dataset_id, document_name):
+        state = self.state
+
+        def sync_document(document_name: str, knowledge_card: str) -> DocumentSyncResult:
+            if document := index.get(document_name):
                 # 对比更新时间
-                dify_doc_update_time = id2doc[document_id]["created_at"]
+                document_id = document["id"]
+                dify_doc_update_time = document["created_at"]
                 external_docs_update_time = table_to_update_time[document_name]
-                if external_docs_update_time > dify_doc_update_time + 3:
-                    # 重建知识库文档，更新创建时间，添加 +3s 的节拍同步
-                    self._delete_document(dataset_id, document_id)
-                    self._create_document_by_text(dataset_id, table_name=document_name, text=knowledge_card)
-                    logger.success(f"重建知识库文档: {document_name}")
+                if external_docs_update_time <= dify_doc_update_time + 3:
+                    return DocumentSyncResult(table_name=document_name, action="skipped", document_id=document_id)
+                # 重建知识库文档，更新创建时间，添加 +3s 的节拍同步
+                self.scheduler.admit(knowledge_card, requests=2)
+                self._delete_document(dataset_id, document_id)
+                index.remove(document_name)
+                response = self._create_document_by_text(dataset_id, table_name=document_name, text=knowledge_card)
+                action = "updated"
+                logger.success(f"重建知识库文档: {document_name}")
             else:
                 # 新建知识库文档
-                self._create_document_by_text(dataset_id, table_name=document_name, text=knowledge_card)
+                self.scheduler.admit(knowledge_card)
+                response = self._create_document_by_text(dataset_id, table_name=document_name, text=knowledge_card)
+                action = "created"
                 logger.success(f"新建知识库文档: {document_name}")
 
-        for doc in docs:
+            self.scheduler.track(dataset_id, response.batch)
+            index.add({"name": index.document_name(document_name), **response.document})
+            state.set(
+                dataset_id,
+                document_name,
+                digest=self._card_digest(knowledge_card),
+                document_id=response.document.get("id"),
+            )
+            return DocumentSyncResult(
+                table_name=document_name, action=action, document_id=response.document.get("id"), batch=response.batch
+            )
+
+        try:
+            report = self._run_tasks(sync_document, self.scheduler.order(table_to_knowledge.items()), desc=db_name)
+            report.dataset_id = dataset_id
+
             # 移除多余的知识库文档
-            document_name = doc["name"]
-            if document_name.endswith(".txt"):
-                document_name = document_name[:-4]
-            if document_name not in table_to_knowledge:
-                if document_id := self._sync_document_id(dataset_id, document_name):
-                    self._delete_document(dataset_id, document_id)
-                    logger.success(f"删除过期的知识库文档: {document_name}")
+            stale = [doc for doc in index.documents() if index.table_name(doc["name"]) not in table_to_knowledge]
+            if stale:
+                deletion = self._delete_documents(dataset_id, stale, desc=f"{db_name} (prune)")
+                for result in deletion.results:
+                    if result.action == "deleted":
+                        index.remove(result.table_name)
+                        state.discard(dataset_id, result.table_name)
+                    report.add(result)
+                logger.success(f"删除过期的知识库文档 - deleted={deletion.deleted} failed={deletion.failed}")
+        finally:
+            state.save()
 
-    def delete_all_document(self, *, db_name: str):
-        # [操作/新建] 知识库，获取操作句柄
-        dataset_id = self._hook_knowledge_dataset(db_name=db_name)
+        return report
 
-        docs = self._list_documents(dataset_id)
-        for doc in docs:
-            try:
-                self._delete_document(dataset_id, doc["id"])
-                logger.debug(f"Delete document - {doc=}")
-            except httpx.HTTPStatusError as err:
-                logger.warning(f"Failed to delete document - {doc['name']=} {err=}")
-        logger.success(f"Delete all document - count={len(docs)}")
+    def delete_all_document(self, *, db_name: str, retry_rounds: int = 1) -> DeleteReport:
+        """
+        并发删除知识库中的全部文档
+
+        Args:
+            db_name: 知识库名称
+            retry_rounds: 失败文档的重试轮数
+
+        Returns: 删除、失败的文档数量与耗时
+
+        """
+
+        def list_all(dataset_id: str) -> List[Dict[str, Any]]:
+            return [{"id": doc["id"], "name": doc["name"]} for doc in self.iter_documents(dataset_id, prefetch=True)]
+
+        # [操作/新建] 知识库，获取操作句柄
+        # 先遍历完整列表再删除，边翻页边删除会导致后续页码错位
+        dataset_id, docs = self._on_dataset(db_name, list_all)
+        report = self._delete_documents(dataset_id, docs, retry_rounds=retry_rounds, desc=db_name)
+        for result in report.results:
+            if result.action == "deleted":
+                self.state.discard(dataset_id, result.table_name)
+        self.state.save()
+        logger.success(
+            f"Delete all document - count={report.total} deleted={report.deleted} "
+            f"failed={report.failed} elapsed={report.elapsed:.1f}s"
+        )
+        return report
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+class DocumentIndex:
+    """
+    知识库文档索引 name -> {id, name, created_at, indexing_status}
+
+    每次同步只拉取一次文档列表，之后的新建、更新、删除都在本地同步更新索引，
+    所有按名称查找文档的操作都经过索引，不再逐个文档发起关键词搜索。
+    """
+
+    fields = ("id", "name", "created_at", "indexing_status")
+
+    def __init__(self, documents: Iterable[Dict[str, Any]] = ()):
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        for document in documents:
+            # 同名文档保留列表中的第一个，与关键词搜索的匹配规则一致
+            self._by_name.setdefault(document["name"], self._slim(document))
+
+    @classmethod
+    def _slim(cls, document: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: document.get(k) for k in cls.fields}
+
+    @staticmethod
+    def document_name(table_name: str) -> str:
+        return f"{table_name}.txt"
+
+    @staticmethod
+    def table_name(document_name: str) -> str:
+        return document_name.removesuffix(".txt")
+
+    def get(self, table_name: str) -> Dict[str, Any] | None:
+        return self._by_name.get(self.document_name(table_name))
+
+    def get_id(self, table_name: str) -> str | None:
+        if document := self.get(table_name):
+            return document["id"]
+
+    def add(self, document: Dict[str, Any]):
+        with self._lock:
+            self._by_name[document["name"]] = self._slim(document)
+
+    def remove(self, table_name: str):
+        with self._lock:
+            self._by_name.pop(self.document_name(table_name), None)
+
+    def documents(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._by_name.values())
+
+    def __contains__(self, table_name: str) -> bool:
+        return self.document_name(table_name) in self._by_name
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.documents())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
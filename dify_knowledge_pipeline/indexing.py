@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Literal
+
+import httpx
+from loguru import logger
+from pydantic import BaseModel, Field
+from tqdm import tqdm
+
+TERMINAL_STATUSES = {"completed", "error", "paused", "timeout"}
+
+
+class BatchStatus(BaseModel):
+    dataset_id: str
+    batch: str
+    indexing_status: Literal[
+        "waiting", "parsing", "cleaning", "splitting", "indexing", "completed", "error", "paused", "timeout"
+    ] = "waiting"
+    completed_segments: int = 0
+    total_segments: int = 0
+    error: str | None = None
+    polls: int = Field(0, description="查询嵌入状态的次数")
+    started_at: float = Field(default_factory=time.time)
+    finished_at: float | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.indexing_status in TERMINAL_STATUSES
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class IndexingTracker:
+    """
+    同时追踪多个上传批次的嵌入状态
+
+    - 每个批次独立退避：进度有变化时恢复最短轮询间隔，否则按 backoff 倍数放大直到 max_interval
+    - 多个批次的分段进度汇总到同一个进度条
+    - 连续 max_poll_errors 次查询失败（包括批次已不存在）的批次标记为 error，不会阻塞其它批次
+    """
+
+    def __init__(
+        self,
+        fetch_status: Callable[[str, str], List[Dict[str, Any]]],
+        *,
+        min_interval: float = 0.5,
+        max_interval: float = 15.0,
+        backoff: float = 1.5,
+        max_concurrency: int = 4,
+        max_poll_errors: int = 5,
+        show_progress: bool = True,
+    ):
+        """
+        Args:
+            fetch_status: fetch_status(dataset_id, batch) -> indexing-status 接口返回的 data 列表
+        """
+        self.fetch_status = fetch_status
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_poll_errors = max_poll_errors
+        self.show_progress = show_progress
+
+    @staticmethod
+    def _merge(status: BatchStatus, documents: List[Dict[str, Any]]):
+        # 批次中的文档被删除后接口返回空列表，计为一次查询失败，连续失败 max_poll_errors 次后标记为 error
+        if not documents:
+            raise ValueError("indexing-status returned no documents for the batch")
+        # 一个批次可能包含多个文档，全部完成才算完成，任一文档出错即视为出错
+        statuses = [doc.get("indexing_status") for doc in documents]
+        status.completed_segments = sum(doc.get("completed_segments") or 0 for doc in documents)
+        status.total_segments = sum(doc.get("total_segments") or 0 for doc in documents)
+        if errors := [doc["error"] for doc in documents if doc.get("error")]:
+            status.error = "; ".join(errors)
+        if "error" in statuses:
+            status.indexing_status = "error"
+        elif "paused" in statuses:
+            status.indexing_status = "paused"
+        elif all(s == "completed" for s in statuses):
+            status.indexing_status = "completed"
+        else:
+            status.indexing_status = next(s for s in statuses if s != "completed")
+
+    def await_indexed(self, batches: Iterable[tuple[str, str]], *, timeout: float | None = None) -> List[BatchStatus]:
+        """
+        阻塞直到所有批次嵌入完成、出错或超时
+
+        Args:
+            batches: [(dataset_id, batch), ...]
+            timeout: 总超时时间（秒），超时后仍未完成的批次标记为 timeout
+
+        Returns: 与 batches 顺序一致的批次状态
+
+        """
+        statuses = [BatchStatus(dataset_id=dataset_id, batch=batch) for dataset_id, batch in batches]
+        if not statuses:
+            return statuses
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        interval = {id(s): self.min_interval for s in statuses}
+        next_poll = {id(s): time.monotonic() for s in statuses}
+        poll_errors = {id(s): 0 for s in statuses}
+
+        def poll(status: BatchStatus):
+            key = id(status)
+            last_completed = status.completed_segments
+            status.polls += 1
+            try:
+                self._merge(status, self.fetch_status(status.dataset_id, status.batch))
+            except (httpx.HTTPError, KeyError, IndexError, ValueError) as err:
+                poll_errors[key] += 1
+                if poll_errors[key] >= self.max_poll_errors:
+                    status.indexing_status = "error"
+                    status.error = f"indexing-status polling failed: {err!r}"
+                    logger.warning(f"查询嵌入状态失败 - {status.batch=} {err=}")
+            else:
+                poll_errors[key] = 0
+
+            if status.done:
+                status.finished_at = time.time()
+                return
+            if status.completed_segments > last_completed:
+                interval[key] = self.min_interval
+            else:
+                interval[key] = min(interval[key] * self.backoff, self.max_interval)
+            next_poll[key] = time.monotonic() + interval[key]
+
+        progress = tqdm(total=0, desc="Embedding", disable=not self.show_progress)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while pending := [s for s in statuses if not s.done]:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    for status in pending:
+                        status.indexing_status = "timeout"
+                        status.finished_at = time.time()
+                    break
+
+                if due := [s for s in pending if next_poll[id(s)] <= now]:
+                    list(executor.map(poll, due))
+
+                    # 进度条展示所有批次的累计分段，直接赋值而不是累加
+                    progress.total = sum(s.total_segments for s in statuses)
+                    progress.n = sum(s.completed_segments for s in statuses)
+                    completed = sum(s.indexing_status == "completed" for s in statuses)
+                    progress.postfix = f"batches={completed}/{len(statuses)}"
+                    progress.refresh()
+                    continue
+
+                wake_at = min(next_poll[id(s)] for s in pending)
+                if deadline is not None:
+                    wake_at = min(wake_at, deadline)
+                time.sleep(max(0.0, wake_at - now))
+        progress.close()
+
+        return statuses
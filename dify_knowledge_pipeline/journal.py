@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from loguru import logger
+
+
+class RunJournal:
+    """
+    同步运行的追加写日志
+
+    以 run_id 为文件名，每个文档写入前记录 begin（含写入前的 document_id），写入成功后记录 done。
+    使用相同的 run_id 重新运行时：
+
+    - done 且卡片哈希相同的文档直接跳过
+    - 只有 begin 的文档，如果知识库中同名文档的 id 已经不是写入前的 id，说明新建（或删除后重建）已经生效，
+      直接采用该文档，不会重复创建；否则按正常流程重新写入
+    """
+
+    def __init__(self, path: Path | str | os.PathLike, run_id: str, *, db_name: str, fsync: bool = True):
+        self.path = Path(path)
+        self.run_id = run_id
+        self.db_name = db_name
+        self.fsync = fsync
+
+        self._done: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._finished = False
+        self._lock = threading.Lock()
+
+        resumed = self.path.is_file()
+        if resumed:
+            self._load()
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._file = self.path.open("a", encoding="utf8")
+        if resumed:
+            logger.info(
+                f"恢复同步运行 - run_id={run_id} done={len(self._done)} pending={len(self._pending)} "
+                f"finished={self._finished}"
+            )
+        else:
+            self._append({"op": "run", "run_id": run_id, "db_name": db_name})
+
+    @classmethod
+    def open(cls, directory: Path | str | os.PathLike, run_id: str, *, db_name: str) -> RunJournal:
+        if not re.fullmatch(r"[\w.-]+", run_id):
+            raise ValueError(f"run_id may only contain letters, digits, '_', '-' and '.', got {run_id!r}")
+        return cls(Path(directory) / f"{run_id}.jsonl", run_id, db_name=db_name)
+
+    def _load(self):
+        with self.path.open("r", encoding="utf8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程在写入最后一行时退出
+                    continue
+                op = record.get("op")
+                if op == "run" and record.get("db_name") != self.db_name:
+                    raise ValueError(
+                        f"run_id={self.run_id!r} belongs to db_name={record.get('db_name')!r}, not {self.db_name!r}"
+                    )
+                if op == "begin":
+                    self._pending[record["table_name"]] = record
+                elif op == "done":
+                    self._pending.pop(record["table_name"], None)
+                    self._done[record["table_name"]] = record
+                elif op == "end":
+                    self._finished = True
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps({**record, "ts": time.time()}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def completed(self, table_name: str, digest: str) -> Dict[str, Any] | None:
+        """本次运行中已经写入相同内容的文档"""
+        if (record := self._done.get(table_name)) and record.get("digest") == digest:
+            return record
+
+    def adoptable(self, table_name: str, digest: str, document_id: str | None) -> bool:
+        """
+        写入中断的文档是否已经生效
+
+        Args:
+            table_name:
+            digest: 当前卡片哈希，与中断时的卡片不同时需要重新写入
+            document_id: 当前知识库中同名文档的 id
+        """
+        record = self._pending.get(table_name)
+        if not record or record.get("digest") != digest or not document_id:
+            return False
+        return document_id != record.get("document_id")
+
+    def begin(self, table_name: str, *, digest: str, action: str, document_id: str | None):
+        record = {
+            "op": "begin",
+            "table_name": table_name,
+            "digest": digest,
+            "action": action,
+            "document_id": document_id,
+        }
+        self._append(record)
+        with self._lock:
+            self._pending[table_name] = record
+
+    def done(self, table_name: str, *, digest: str, action: str, document_id: str | None, batch: str | None = None):
+        record = {
+            "op": "done",
+            "table_name": table_name,
+            "digest": digest,
+            "action": action,
+            "document_id": document_id,
+            "batch": batch,
+        }
+        self._append(record)
+        with self._lock:
+            self._pending.pop(table_name, None)
+            self._done[table_name] = record
+
+    def finish(self, **summary):
+        self._append({"op": "end", **summary})
+        self._finished = True
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> RunJournal:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+from loguru import logger
+
+from dify_knowledge_pipeline.cards import KnowledgeCard
+from dify_knowledge_pipeline.store import ChunkStore
+
+
+def hash_file(fp: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with fp.open("rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ChunkManifest:
+    """
+    增量分片清单
+
+    存放在 fdr_out 同级目录的 `<fdr_out>.manifest.json` 中，记录每个源文件的内容哈希、分片参数与输出的知识卡片。
+    源文件 mtime/size 未变化时直接复用记录，否则重新计算内容哈希；哈希与分片参数都一致且卡片仍在磁盘上时，
+    该文件无需再次读取、编码与写入。
+
+    卡片写入 ChunkStore 时，清单记录的卡片从 store 中检查与读取；源文件被删除或重新分片后不再被任何记录引用的卡片，
+    在 save 时从 store 中删除，store.items() 只会返回仍有来源的卡片。
+    """
+
+    def __init__(self, path: Path, fdr_out: Path, params: Dict[str, Any], *, store: ChunkStore | None = None):
+        self.path = path
+        self.fdr_out = fdr_out
+        self.params = params
+        self.store = store
+
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._seen: set[str] = set()
+        self._orphans: set[str] = set()
+
+        if self.path.is_file():
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf8"))
+            except (OSError, ValueError) as err:
+                logger.warning(f"分片清单损坏，重新构建 - {self.path=} {err=}")
+
+    @classmethod
+    def for_output(cls, fdr_out: Path, params: Dict[str, Any], *, store: ChunkStore | None = None) -> ChunkManifest:
+        return cls(fdr_out.parent / f"{fdr_out.name}.manifest.json", fdr_out, params, store=store)
+
+    def lookup(self, fp: Path) -> Dict[str, Any] | None:
+        """
+        Returns: 源文件未变化时返回清单记录，否则返回 None 并暂存新的哈希，供 record 使用
+        """
+        key = str(fp)
+        self._seen.add(key)
+
+        stat = fp.stat()
+        entry = self._entries.get(key)
+        if not entry or entry.get("params") != self.params:
+            self._replace(key, {"digest": hash_file(fp), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+            return
+
+        if entry.get("mtime_ns") != stat.st_mtime_ns or entry.get("size") != stat.st_size:
+            digest = hash_file(fp)
+            if digest != entry.get("digest"):
+                self._replace(key, {"digest": digest, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+                return
+            entry.update({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+
+        if (card := entry.get("card")) and not self._card_exists(card):
+            entry.pop("params", None)
+            return
+
+        return entry
+
+    def _replace(self, key: str, entry: Dict[str, Any]):
+        # 源文件重新分片后标题可能变化，旧卡片在 save 时确认无人引用再删除
+        if (old := self._entries.get(key)) and old.get("card"):
+            self._orphans.add(old["card"])
+        self._entries[key] = entry
+
+    def record(self, fp: Path, table_name: str | None = None):
+        """
+        记录源文件的分片结果，table_name 为空表示该文件没有产出知识卡片（例如内容过短）
+        """
+        entry = self._entries.setdefault(str(fp), {"digest": hash_file(fp)})
+        entry["params"] = self.params
+        entry["table_name"] = table_name
+        entry["card"] = f"{table_name}.txt" if table_name else None
+
+    def _card_exists(self, card: str) -> bool:
+        if self.store is not None:
+            return card in self.store
+        return (self.fdr_out / card).is_file()
+
+    def load_card(self, entry: Dict[str, Any]) -> KnowledgeCard:
+        if self.store is not None:
+            return self.store.get(entry["card"])
+        return KnowledgeCard(self.fdr_out / entry["card"])
+
+    def save(self, *, prune: bool = False):
+        """
+        原子写入清单
+
+        Args:
+            prune: 移除本次运行未遍历到、且分片参数相同的记录（源文件已被删除），写入 ChunkStore 的卡片一并删除
+
+        Returns:
+
+        """
+        if prune:
+            for key in [k for k, v in self._entries.items() if k not in self._seen and v.get("params") == self.params]:
+                if card := self._entries.pop(key).get("card"):
+                    self._orphans.add(card)
+        self._delete_orphans()
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        tmp.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf8")
+        os.replace(tmp, self.path)
+
+    def _delete_orphans(self):
+        if self.store is None:
+            return
+        live = {entry.get("card") for entry in self._entries.values()}
+        for card in self._orphans - live:
+            self.store.delete(card)
+        self._orphans.clear()
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import bisect
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+# 0.1ms ~ 14min 的对数分桶，足够覆盖单次 tiktoken 调用到整批嵌入等待
+BUCKETS = tuple(0.0001 * 2**i for i in range(24))
+
+
+class Histogram:
+    """固定分桶的耗时直方图，可在进程之间合并"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+    def quantile(self, q: float) -> float:
+        """返回分位数所在分桶的上界，不超过观测到的最大值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+        return self.max
+
+    def merge(self, snapshot: Dict[str, Any]):
+        self.count += snapshot["count"]
+        self.total += snapshot["total"]
+        self.min = min(self.min, snapshot["min"])
+        self.max = max(self.max, snapshot["max"])
+        self.buckets = [a + b for a, b in zip(self.buckets, snapshot["buckets"])]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"count": self.count, "total": self.total, "min": self.min, "max": self.max, "buckets": self.buckets}
+
+
+class StageStats(BaseModel):
+    count: int
+    total: float = Field(..., description="累计耗时（秒），并行阶段为各线程、进程耗时之和")
+    mean: float
+    min: float
+    max: float
+    p50: float
+    p90: float
+    p99: float
+
+
+class MetricsReport(BaseModel):
+    elapsed: float = Field(0.0, description="从创建 Metrics 到生成报告的墙钟时间（秒）")
+    counters: Dict[str, float] = Field(default_factory=dict)
+    stages: Dict[str, StageStats] = Field(default_factory=dict)
+
+    def summary(self) -> str:
+        lines = [f"elapsed={self.elapsed:.3f}s"]
+        for name, stats in sorted(self.stages.items(), key=lambda kv: -kv[1].total):
+            lines.append(
+                f"{name:<28} count={stats.count:<8} total={stats.total:.3f}s "
+                f"p50={stats.p50 * 1000:.1f}ms p99={stats.p99 * 1000:.1f}ms max={stats.max * 1000:.1f}ms"
+            )
+        lines.extend(f"{name:<28} {value:g}" for name, value in sorted(self.counters.items()))
+        return "\n".join(lines)
+
+
+MetricsExporter = Callable[[MetricsReport], None]
+
+
+class Metrics:
+    """
+    分阶段计时、计数器与耗时直方图
+
+    ```python
+    metrics = Metrics(exporters=[log_exporter])
+    with metrics.timer("chunk.read"):
+        text = fp.read_text()
+    metrics.incr("chunk.files")
+    metrics.export()
+    ```
+    """
+
+    enabled = True
+
+    def __init__(self, exporters: List[MetricsExporter] | None = None):
+        self.exporters: List[MetricsExporter] = list(exporters or [])
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            if (histogram := self._histograms.get(name)) is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """可序列化的原始数据，用于从工作进程传回主进程"""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        with self._lock:
+            for name, value in snapshot["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for name, data in snapshot["histograms"].items():
+                self._histograms.setdefault(name, Histogram()).merge(data)
+
+    def report(self) -> MetricsReport:
+        with self._lock:
+            stages = {
+                name: StageStats(
+                    count=h.count,
+                    total=h.total,
+                    mean=h.total / h.count,
+                    min=h.min,
+                    max=h.max,
+                    p50=h.quantile(0.5),
+                    p90=h.quantile(0.9),
+                    p99=h.quantile(0.99),
+                )
+                for name, h in self._histograms.items()
+                if h.count
+            }
+            return MetricsReport(
+                elapsed=time.perf_counter() - self._started_at, counters=dict(self._counters), stages=stages
+            )
+
+    def export(self) -> MetricsReport:
+        report = self.report()
+        for exporter in self.exporters:
+            try:
+                exporter(report)
+            except Exception as err:
+                logger.warning(f"Failed to export metrics - {exporter=} {err=}")
+        return report
+
+
+class NullMetrics(Metrics):
+    """未启用统计时的默认实现，所有记录操作都是空操作"""
+
+    enabled = False
+
+    def incr(self, name: str, value: float = 1):
+        pass
+
+    def observe(self, name: str, seconds: float):
+        pass
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        yield
+
+
+NULL_METRICS = NullMetrics()
+
+_current: contextvars.ContextVar[Metrics] = contextvars.ContextVar("dify_knowledge_pipeline_metrics")
+
+
+def current_metrics() -> Metrics:
+    return _current.get(NULL_METRICS)
+
+
+@contextmanager
+def use_metrics(metrics: Metrics) -> Iterator[Metrics]:
+    """在当前上下文中启用 metrics，分片函数未显式传入 metrics 时使用它"""
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def log_exporter(report: MetricsReport):
+    logger.info(f"Pipeline metrics\n{report.summary()}")
+
+
+class JsonlExporter:
+    """每次导出向文件追加一行 JSON"""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+    def __call__(self, report: MetricsReport):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf8") as file:
+            file.write(json.dumps({"ts": time.time(), **report.model_dump()}, ensure_ascii=False) + "\n")
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator
+
+
+def paginate(fetch_page: Callable[[int], Dict[str, Any]], *, prefetch: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    逐页遍历 Dify 列表接口，直到 has_more 为 False
+
+    Args:
+        fetch_page: fetch_page(page) -> {"data": [...], "has_more": bool, ...}，页码从 1 开始
+        prefetch: 调用方处理当前页时，在后台线程中预取下一页
+
+    Returns: 逐条返回 data 中的元素，内存中最多保留两页数据
+
+    """
+    if not prefetch:
+        page = 1
+        while True:
+            body = fetch_page(page)
+            yield from (data := body.get("data") or [])
+            if not body.get("has_more") or not data:
+                return
+            page += 1
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = 1
+        future = executor.submit(fetch_page, page)
+        while future is not None:
+            body = future.result()
+            data = body.get("data") or []
+            future = None
+            if body.get("has_more") and data:
+                page += 1
+                future = executor.submit(fetch_page, page)
+            yield from data
+
+
+async def apaginate(fetch_page: Callable[[int], Awaitable[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+    """paginate 的 asyncio 版本"""
+    page = 1
+    while True:
+        body = await fetch_page(page)
+        for item in (data := body.get("data") or []):
+            yield item
+        if not body.get("has_more") or not data:
+            return
+        page += 1
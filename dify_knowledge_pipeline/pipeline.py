@@ -1,22 +1,39 @@
 import json
 import os
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from contextlib import suppress
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Literal, Mapping, Tuple
 
-import tiktoken
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter, Language
 from loguru import logger
 from tqdm import tqdm
 
-from dify_knowledge_pipeline.fire_drop import DifyFireDrop
-
-SEPARATOR = "\n\n------------\n\n"
+from dify_knowledge_pipeline.cards import SEPARATOR, CardWriter, KnowledgeCard
+from dify_knowledge_pipeline.fire_drop import DeleteReport, DifyFireDrop, SyncReport
+from dify_knowledge_pipeline.indexing import BatchStatus
+from dify_knowledge_pipeline.manifest import ChunkManifest
+from dify_knowledge_pipeline.metrics import Metrics, MetricsExporter, MetricsReport, current_metrics, use_metrics
+from dify_knowledge_pipeline.plan import SyncPlan
+from dify_knowledge_pipeline.reader import (
+    LARGE_FILE_THRESHOLD,
+    STREAM_WINDOW_CHARS,
+    MarkdownSectionStream,
+    collapse_blank_lines,
+    iter_code_windows,
+    iter_lines,
+)
+from dify_knowledge_pipeline.store import ChunkStore, ChunkStoreWriter
+from dify_knowledge_pipeline.tokens import TokenCounter, TokenWindowSplitter
 
 MAX_TOKENS = 4096
 
+HEADERS_TO_SPLIT_ON = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3"), ("####", "Header 4")]
+
 
 def normalize_path(path: str | os.PathLike | Path) -> Path:
     if isinstance(path, Path):
@@ -45,6 +62,15 @@ def fork_tech_docs_markdown_to_chunks(
     encoding_name: str = "gpt2",
     chunk_size: int = 4096,
     chunk_overlap_ratio: float = 0.15,
+    workers: int = 1,
+    ordered: bool = True,
+    splitter: Literal["recursive", "token"] = "recursive",
+    incremental: bool = False,
+    yield_unchanged: bool = True,
+    offload: bool = True,
+    large_file_threshold: int | None = LARGE_FILE_THRESHOLD,
+    store: ChunkStore | str | os.PathLike | None = None,
+    metrics: Metrics | None = None,
     **kwargs,
 ):
     """
@@ -58,70 +84,359 @@ def fork_tech_docs_markdown_to_chunks(
         encoding_name: ['gpt2', 'r50k_base', 'p50k_base', 'p50k_edit', 'cl100k_base', 'o200k_base']
         chunk_size:
         chunk_overlap_ratio:
+        workers: 分片进程数，大于 1 时将文件分发到进程池中并行处理
+        ordered: 并行模式下是否按文件遍历顺序返回结果，False 则按完成顺序返回
+        splitter: 过长章节的切分方式
+            - recursive 按段落、句子递归切分，保持语义完整
+            - token 按 token 窗口切分，只编码一次，适合大量超长章节的 API 参考文档
+        incremental: 使用 fdr_out 同级目录下的分片清单，跳过内容与分片参数均未变化的源文件
+        yield_unchanged: 增量模式下是否返回未变化文件的已有卡片（直接读取 fdr_out，不经过 tiktoken）
+        offload: 是否将卡片写入 fdr_out，流式上传时可以关闭；增量模式依赖 fdr_out 中的卡片，不能关闭
+        large_file_threshold: 超过该大小（字节）的源文件逐行流式分片，内存占用与文件大小无关；None 表示关闭
+        store: 将卡片写入单文件的 ChunkStore（或其路径），替代 fdr_out 下的 .txt 卡片，此时忽略 offload
+        metrics: 记录各阶段耗时与计数，默认使用 use_metrics 设置的当前 Metrics
 
     Returns:
 
     """
     fdr_docs = normalize_path(fdr_docs)
     fdr_out = normalize_path(fdr_out)
+    store = _resolve_store(store)
+    _check_offload(incremental, offload or store is not None)
 
-    encoding = tiktoken.get_encoding(encoding_name)
     focus_ext = kwargs.get("ext", "*.md")
+    split_file = partial(
+        _split_tech_docs_file,
+        fdr_out=fdr_out,
+        encoding_name=encoding_name,
+        chunk_size=chunk_size,
+        chunk_overlap_ratio=chunk_overlap_ratio,
+        focus_ext=focus_ext,
+        splitter=splitter,
+        prefix_name=kwargs.get("prefix_name"),
+        offload=offload,
+        large_file_threshold=large_file_threshold,
+        store=store,
+    )
 
-    headers_to_split_on = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3"), ("####", "Header 4")]
-    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on, strip_headers=True)
+    manifest = None
+    if incremental:
+        params = {
+            "chunker": "tech_docs_markdown",
+            "ext": focus_ext,
+            "encoding_name": encoding_name,
+            "chunk_size": chunk_size,
+            "chunk_overlap_ratio": chunk_overlap_ratio,
+            "splitter": splitter,
+            "prefix_name": kwargs.get("prefix_name"),
+            "large_file_threshold": large_file_threshold,
+        }
+        if store is not None:
+            params["store"] = str(store.path)
+        manifest = ChunkManifest.for_output(fdr_out, params, store=store)
 
     # 文档文件作为一个独立的 embed 对象
-    for fp in tqdm(fdr_docs.rglob(focus_ext), desc="splitting", postfix="embedding"):
-        header_1_title = ""
-        segments = []
+    yield from _iter_chunk_results(
+        split_file,
+        fdr_docs.rglob(focus_ext),
+        workers=workers,
+        ordered=ordered,
+        encoding_name=encoding_name,
+        manifest=manifest,
+        yield_unchanged=yield_unchanged,
+        metrics=metrics or current_metrics(),
+    )
 
-        # ｛｛# 数据分片规则 #｝｝
-        if not (text := fp.read_text(encoding="utf8").strip()):
-            continue
 
-        text = text.replace("\n\n", "\n")
+@lru_cache
+def _get_token_counter(encoding_name: str) -> TokenCounter:
+    return TokenCounter.from_encoding_name(encoding_name)
 
-        # 1. IF 源文档总长度 max_tokens < MAX_TOKENS，无需分块直接嵌入
-        # 去掉过短的片段，切分过长的片段
-        num_tokens = len(encoding.encode(text))
-        if num_tokens < 50:
-            continue
-        if num_tokens < chunk_size:
-            segments.append(text)
 
-        mdx_schema_info = clean_mdx_schema_info(text) if focus_ext == "*.mdx" else {}
+@lru_cache
+def _get_markdown_splitter() -> MarkdownHeaderTextSplitter:
+    return MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON, strip_headers=True)
 
-        # 2. 自定义的分块规则
-        md_header_splits = markdown_splitter.split_text(text)
-        for i, doc in enumerate(md_header_splits):
-            metadata = doc.metadata
-            content = doc.page_content.strip()
 
-            if not header_1_title:
+@lru_cache(maxsize=256)
+def _get_text_splitter(
+    encoding_name: str, chunk_size: int, chunk_overlap: int, splitter: Literal["recursive", "token"] = "recursive"
+) -> RecursiveCharacterTextSplitter | TokenWindowSplitter:
+    counter = _get_token_counter(encoding_name)
+    if splitter == "token":
+        return TokenWindowSplitter(counter, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    # 等价于 RecursiveCharacterTextSplitter.from_tiktoken_encoder，但复用进程内已加载的 encoding
+    return RecursiveCharacterTextSplitter(
+        length_function=counter.count, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+
+
+class _TimedTokenCounter:
+    """记录 tiktoken 调用耗时的 TokenCounter 代理，只在启用 Metrics 时使用"""
+
+    def __init__(self, counter: TokenCounter, metrics: Metrics):
+        self.counter = counter
+        self.metrics = metrics
+
+    def count(self, text: str, *, limit: int | None = None) -> int:
+        with self.metrics.timer("chunk.tokenize"):
+            num_tokens = self.counter.count(text, limit=limit)
+        self.metrics.incr("chunk.tokens_counted", num_tokens)
+        return num_tokens
+
+    def overhead(self, template: str) -> int:
+        with self.metrics.timer("chunk.tokenize"):
+            return self.counter.overhead(template)
+
+
+def _stage_token_counter(encoding_name: str, metrics: Metrics) -> TokenCounter | _TimedTokenCounter:
+    counter = _get_token_counter(encoding_name)
+    return _TimedTokenCounter(counter, metrics) if metrics.enabled else counter
+
+
+def _init_worker(encoding_name: str):
+    # 每个工作进程只加载一次 encoding 与 splitter
+    _get_token_counter(encoding_name)
+    _get_markdown_splitter()
+
+
+def _call_with_metrics(fn: Callable[[Path], Any], fp: Path) -> Tuple[Any, Dict[str, Any]]:
+    # 在工作进程中单独统计，结果随分片一起传回主进程合并
+    metrics = Metrics()
+    with use_metrics(metrics), metrics.timer("chunk.file"):
+        result = fn(fp)
+    return result, metrics.snapshot()
+
+
+def _iter_chunk_results(
+    split_file: Callable[[Path], Any],
+    files: Iterable[Path],
+    *,
+    workers: int,
+    ordered: bool,
+    encoding_name: str,
+    manifest: ChunkManifest | None = None,
+    yield_unchanged: bool = True,
+    metrics: Metrics | None = None,
+):
+    metrics = metrics or current_metrics()
+
+    def map_files(fs: Iterable[Path]) -> Iterator[Tuple[Path, Any]]:
+        if not metrics.enabled:
+            yield from _map_files(split_file, fs, workers=workers, ordered=ordered, encoding_name=encoding_name)
+            return
+        fn = partial(_call_with_metrics, split_file)
+        for fp, (result, snapshot) in _map_files(fn, fs, workers=workers, ordered=ordered, encoding_name=encoding_name):
+            metrics.merge(snapshot)
+            yield fp, result
+
+    if manifest is None:
+        for _, result in tqdm(map_files(files), desc="splitting", postfix="embedding"):
+            if result:
+                yield result
+        return
+
+    # 未变化的文件不进入分片流程，已有卡片在遍历到时直接返回
+    unchanged = deque()
+
+    def changed_files():
+        for fp in files:
+            if (entry := manifest.lookup(fp)) is None:
+                yield fp
+            else:
+                metrics.incr("chunk.files_unchanged")
+                if yield_unchanged and entry.get("table_name"):
+                    unchanged.append(entry)
+
+    def load_card(entry: Dict[str, Any]) -> str:
+        with metrics.timer("chunk.load_unchanged"):
+            return manifest.load_card(entry)
+
+    completed = False
+    try:
+        for fp, result in tqdm(map_files(changed_files()), desc="splitting", postfix="embedding"):
+            manifest.record(fp, result[0] if result else None)
+            while unchanged:
+                entry = unchanged.popleft()
+                yield entry["table_name"], load_card(entry)
+            if result:
+                yield result
+        while unchanged:
+            entry = unchanged.popleft()
+            yield entry["table_name"], load_card(entry)
+        completed = True
+    finally:
+        manifest.save(prune=completed)
+
+
+def _map_files(
+    fn: Callable[[Path], Any], files: Iterable[Path], *, workers: int, ordered: bool, encoding_name: str
+) -> Iterator[Tuple[Path, Any]]:
+    if workers <= 1:
+        for fp in files:
+            yield fp, fn(fp)
+        return
+
+    # 限制在途任务数量，避免一次性提交数万个文件导致结果堆积在内存中
+    max_pending = workers * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(encoding_name,)) as executor:
+        if ordered:
+            pending = deque()
+            for fp in files:
+                if len(pending) >= max_pending:
+                    done_fp, future = pending.popleft()
+                    yield done_fp, future.result()
+                pending.append((fp, executor.submit(fn, fp)))
+            while pending:
+                done_fp, future = pending.popleft()
+                yield done_fp, future.result()
+        else:
+            pending = {}
+            for fp in files:
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+                pending[executor.submit(fn, fp)] = fp
+            for future in as_completed(pending):
+                yield pending[future], future.result()
+
+
+def _split_tech_docs_file(
+    fp: Path,
+    *,
+    fdr_out: Path,
+    encoding_name: str,
+    chunk_size: int,
+    chunk_overlap_ratio: float,
+    focus_ext: str,
+    splitter: Literal["recursive", "token"] = "recursive",
+    prefix_name: str | None = None,
+    offload: bool = True,
+    large_file_threshold: int | None = LARGE_FILE_THRESHOLD,
+    store: ChunkStore | None = None,
+):
+    if _is_large_file(fp, large_file_threshold):
+        return _stream_tech_docs_file(
+            fp,
+            fdr_out=fdr_out,
+            encoding_name=encoding_name,
+            chunk_size=chunk_size,
+            chunk_overlap_ratio=chunk_overlap_ratio,
+            focus_ext=focus_ext,
+            splitter=splitter,
+            prefix_name=prefix_name,
+            offload=offload,
+            store=store,
+        )
+
+    metrics = current_metrics()
+    counter = _stage_token_counter(encoding_name, metrics)
+    markdown_splitter = _get_markdown_splitter()
+
+    segments = []
+
+    # ｛｛# 数据分片规则 #｝｝
+    with metrics.timer("chunk.read"):
+        text = fp.read_text(encoding="utf8").strip()
+    metrics.incr("chunk.files")
+    metrics.incr("chunk.chars_in", len(text))
+    if not text:
+        metrics.incr("chunk.files_skipped")
+        return
+
+    text = text.replace("\n\n", "\n")
+
+    # 1. IF 源文档总长度 max_tokens < MAX_TOKENS，无需分块直接嵌入
+    # 去掉过短的片段，切分过长的片段
+    num_tokens = counter.count(text, limit=max(chunk_size, 50))
+    if num_tokens < 50:
+        metrics.incr("chunk.files_skipped")
+        return
+    if num_tokens < chunk_size:
+        segments.append((text, num_tokens, None))
+
+    mdx_schema_info = clean_mdx_schema_info(text) if focus_ext == "*.mdx" else {}
+
+    # 2. 自定义的分块规则
+    with metrics.timer("chunk.header_split"):
+        md_header_splits = markdown_splitter.split_text(text)
+    sections = _TechDocsSections(
+        counter,
+        mdx_schema_info,
+        encoding_name=encoding_name,
+        chunk_size=chunk_size,
+        chunk_overlap_ratio=chunk_overlap_ratio,
+        splitter=splitter,
+        fp_name=fp.name,
+    )
+    segments.extend(sections.segments((doc.metadata, doc.page_content) for doc in md_header_splits))
+
+    header_1_title = _tech_docs_title(fp, sections.header_1_title)
+    return _offload(header_1_title, segments, fp, fdr_out, prefix_name=prefix_name, write=offload, store=store)
+
+
+class _TechDocsSections:
+    """将按标题切分的章节格式化为分片，过长的章节按 chunk_size 二次切分"""
+
+    def __init__(
+        self,
+        counter: TokenCounter | _TimedTokenCounter,
+        mdx_schema_info: dict,
+        *,
+        encoding_name: str,
+        chunk_size: int,
+        chunk_overlap_ratio: float,
+        splitter: Literal["recursive", "token"],
+        fp_name: str,
+    ):
+        self.counter = counter
+        self.mdx_schema_info = mdx_schema_info
+        self.encoding_name = encoding_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap_ratio = chunk_overlap_ratio
+        self.splitter = splitter
+        self.fp_name = fp_name
+        self.header_1_title = ""
+
+    def segments(
+        self, md_header_splits: Iterable[Tuple[Dict[str, str], str]]
+    ) -> Iterator[Tuple[str, int, Dict[str, str] | None]]:
+        """
+        Returns: (segment, num_tokens, metadata)，metadata 为分片所属章节的标题
+        """
+        metrics = current_metrics()
+        counter = self.counter
+        mdx_schema_info = self.mdx_schema_info
+
+        for i, (metadata, content) in enumerate(md_header_splits):
+            content = content.strip()
+
+            if not self.header_1_title:
                 # 将 FIRST 标题设为文件名
                 for h in [1, 2, 3, 4]:
                     if header := metadata.get(f"Header {h}"):
-                        header_1_title = header
+                        self.header_1_title = header
                         break
 
             if metadata:
                 # 格式化 Q&A
                 metadata_str = " / ".join(list(metadata.values()))
                 mdx_schema_info.update({"section": metadata_str, "content": content})
-                segment = json.dumps(mdx_schema_info, ensure_ascii=False)
+                with metrics.timer("chunk.json_encode"):
+                    segment = json.dumps(mdx_schema_info, ensure_ascii=False)
             else:
                 # 无法自动解析 Question，则仅存储文本块
                 metadata_str = ""
                 segment = content
 
-            if (num_tokens := len(encoding.encode(segment))) < MAX_TOKENS:
+            if (num_tokens := counter.count(segment, limit=MAX_TOKENS)) < MAX_TOKENS:
                 if num_tokens < 50 and ("toc: menu" in segment or "toc: content" in segment):
                     continue
                 if num_tokens < 50 and not metadata_str:
                     continue
                 # 如果 Q&A 问答对符合 max_tokens 长度规范，无需进一步预处理
-                segments.append(segment)
+                yield segment, num_tokens, metadata or None
                 continue
 
             # 拟合块状态，动态调整参数
@@ -129,32 +444,125 @@ def fork_tech_docs_markdown_to_chunks(
                 _tmp = mdx_schema_info.copy()
                 _tmp["content"] = ""
                 _segment_tmp = json.dumps(_tmp, ensure_ascii=False)
-                schema_num_tokens = len(encoding.encode(_segment_tmp))
-                fixed_chunk_size = int((chunk_size - schema_num_tokens) * 0.98)
+                schema_num_tokens = counter.overhead(_segment_tmp)
+                fixed_chunk_size = int((self.chunk_size - schema_num_tokens) * 0.98)
             else:
                 fixed_chunk_size = MAX_TOKENS
-            chunk_overlap = int(fixed_chunk_size * chunk_overlap_ratio)
-            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                encoding_name=encoding_name, chunk_size=fixed_chunk_size, chunk_overlap=chunk_overlap
-            )
+            chunk_overlap = int(fixed_chunk_size * self.chunk_overlap_ratio)
+            text_splitter = _get_text_splitter(self.encoding_name, fixed_chunk_size, chunk_overlap, self.splitter)
 
             # 切分过长的块，保持结构化切片
-            chunks = text_splitter.split_text(content)
+            with metrics.timer("chunk.text_split"):
+                chunks = text_splitter.split_text(content)
             for sid, chunk in enumerate(chunks):
                 chunk = chunk.strip()
                 if metadata_str:
                     mdx_schema_info.update({"section": metadata_str, "content": chunk})
-                    chunk = json.dumps(mdx_schema_info, ensure_ascii=False)
-                segments.append(chunk)
-                _validate_max_tokens(encoding, chunk, fp.name, sid=i)
+                    with metrics.timer("chunk.json_encode"):
+                        chunk = json.dumps(mdx_schema_info, ensure_ascii=False)
+                num_tokens = counter.count(chunk)
+                _validate_max_tokens(counter, chunk, self.fp_name, sid=i, num_tokens=num_tokens)
+                yield chunk, num_tokens, metadata or None
+
+
+def _tech_docs_title(fp: Path, header_1_title: str) -> str:
+    # {{# 文件命名 #}}
+    header_1_title = f"{fp.name}_{header_1_title}" if header_1_title else fp.name
+    for ext_ in [".md", ".mdx"]:
+        if header_1_title.endswith(ext_):
+            header_1_title = header_1_title.replace(ext_, ".txt")
+    return header_1_title
 
-        # {{# 文件命名 #}}
-        header_1_title = f"{fp.name}_{header_1_title}" if header_1_title else fp.name
-        for ext_ in [".md", ".mdx"]:
-            if header_1_title.endswith(ext_):
-                header_1_title = header_1_title.replace(ext_, ".txt")
 
-        yield _offload(header_1_title, segments, fp, fdr_out, prefix_name=kwargs.get("prefix_name"))
+def _is_large_file(fp: Path, large_file_threshold: int | None) -> bool:
+    return bool(large_file_threshold) and fp.stat().st_size >= large_file_threshold
+
+
+def _stream_tech_docs_file(
+    fp: Path,
+    *,
+    fdr_out: Path,
+    encoding_name: str,
+    chunk_size: int,
+    chunk_overlap_ratio: float,
+    focus_ext: str,
+    splitter: Literal["recursive", "token"] = "recursive",
+    prefix_name: str | None = None,
+    offload: bool = True,
+    store: ChunkStore | None = None,
+):
+    """
+    超大文档的分片流程，产出与 _split_tech_docs_file 相同的卡片
+
+    逐行读取并流式切分章节，分片逐个写入卡片文件，不在内存中保留整份文档。
+    超过 STREAM_WINDOW_CHARS 的章节会先截断再二次切分，截断处的分片边界与一次性读取时略有不同。
+    """
+    metrics = current_metrics()
+    counter = _stage_token_counter(encoding_name, metrics)
+
+    # 文档前缀的 token 数不足 chunk_size 时（例如大量空白），按常规流程处理
+    head_text = "\n".join(_take_chars(collapse_blank_lines(iter_lines(fp)), STREAM_WINDOW_CHARS)).strip()
+    if counter.count(head_text, limit=chunk_size) < chunk_size:
+        return _split_tech_docs_file(
+            fp,
+            fdr_out=fdr_out,
+            encoding_name=encoding_name,
+            chunk_size=chunk_size,
+            chunk_overlap_ratio=chunk_overlap_ratio,
+            focus_ext=focus_ext,
+            splitter=splitter,
+            prefix_name=prefix_name,
+            offload=offload,
+            large_file_threshold=None,
+            store=store,
+        )
+
+    metrics.incr("chunk.files")
+    metrics.incr("chunk.large_files")
+
+    # frontmatter 位于文档开头，从前缀中解析即可
+    mdx_schema_info = clean_mdx_schema_info(head_text) if focus_ext == "*.mdx" else {}
+    del head_text
+
+    lines = _count_chars(collapse_blank_lines(iter_lines(fp)), metrics)
+    sections = _TechDocsSections(
+        counter,
+        mdx_schema_info,
+        encoding_name=encoding_name,
+        chunk_size=chunk_size,
+        chunk_overlap_ratio=chunk_overlap_ratio,
+        splitter=splitter,
+        fp_name=fp.name,
+    )
+    with _card_writer(fdr_out, fp, offload=offload, store=store) as writer:
+        for segment, num_tokens, metadata in sections.segments(
+            MarkdownSectionStream(HEADERS_TO_SPLIT_ON).split_lines(lines)
+        ):
+            writer.add(segment, num_tokens=num_tokens, metadata=metadata)
+        # 卡片标题取决于文档中的第一个标题，分片全部写完后才能确定
+        header_1_title = _tech_docs_title(fp, sections.header_1_title)
+        with metrics.timer("chunk.offload"):
+            return _commit_card(writer, header_1_title, fp, prefix_name=prefix_name)
+
+
+def _count_chars(lines: Iterable[str], metrics: Metrics) -> Iterator[str]:
+    chars = 0
+    try:
+        for line in lines:
+            chars += len(line) + 1
+            yield line
+    finally:
+        metrics.incr("chunk.chars_in", chars)
+
+
+def _take_chars(lines: Iterable[str], max_chars: int) -> List[str]:
+    head, chars = [], 0
+    for line in lines:
+        head.append(line)
+        chars += len(line) + 1
+        if chars >= max_chars:
+            break
+    return head
 
 
 ts_block = """
@@ -173,47 +581,198 @@ def fork_source_code_ts_to_chunks(
     encoding_name: str = "gpt2",
     chunk_size: int = 1500,
     chunk_overlap_ratio: float = 0.15,
+    workers: int = 1,
+    ordered: bool = True,
+    incremental: bool = False,
+    yield_unchanged: bool = True,
+    offload: bool = True,
+    large_file_threshold: int | None = LARGE_FILE_THRESHOLD,
+    store: ChunkStore | str | os.PathLike | None = None,
+    metrics: Metrics | None = None,
     **kwargs,
 ):
     fdr_docs = normalize_path(fdr_docs)
     fdr_out = normalize_path(fdr_out)
+    store = _resolve_store(store)
+    _check_offload(incremental, offload or store is not None)
+
+    split_file = partial(
+        _split_source_code_ts_file,
+        fdr_out=fdr_out,
+        encoding_name=encoding_name,
+        chunk_size=chunk_size,
+        chunk_overlap=int(chunk_size * chunk_overlap_ratio),
+        prefix_name=kwargs.get("prefix_name"),
+        offload=offload,
+        large_file_threshold=large_file_threshold,
+        store=store,
+    )
+
+    manifest = None
+    if incremental:
+        params = {
+            "chunker": "source_code_ts",
+            "encoding_name": encoding_name,
+            "chunk_size": chunk_size,
+            "chunk_overlap_ratio": chunk_overlap_ratio,
+            "prefix_name": kwargs.get("prefix_name"),
+            "large_file_threshold": large_file_threshold,
+        }
+        if store is not None:
+            params["store"] = str(store.path)
+        manifest = ChunkManifest.for_output(fdr_out, params, store=store)
+
+    yield from _iter_chunk_results(
+        split_file,
+        fdr_docs.rglob("*.ts"),
+        workers=workers,
+        ordered=ordered,
+        encoding_name=encoding_name,
+        manifest=manifest,
+        yield_unchanged=yield_unchanged,
+        metrics=metrics or current_metrics(),
+    )
 
-    chunk_overlap = int(chunk_size * chunk_overlap_ratio)
-    encoding = tiktoken.get_encoding(encoding_name)
 
-    text_splitter = RecursiveCharacterTextSplitter.from_language(
+@lru_cache
+def _get_ts_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter.from_language(
         chunk_size=chunk_size, language=Language.TS, chunk_overlap=chunk_overlap
     )
 
-    for fp in tqdm(fdr_docs.rglob("*.ts"), desc="splitting", postfix="embedding"):
-        text = fp.read_text(encoding="utf-8")
-        segments = []
 
-        code_path = f"{fp.parent}\\{fp.name}"
-        segment = ts_block.format(path=code_path, code=text)
+def _split_source_code_ts_file(
+    fp: Path,
+    *,
+    fdr_out: Path,
+    encoding_name: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    prefix_name: str | None = None,
+    offload: bool = True,
+    large_file_threshold: int | None = LARGE_FILE_THRESHOLD,
+    store: ChunkStore | None = None,
+):
+    if _is_large_file(fp, large_file_threshold):
+        return _stream_source_code_ts_file(
+            fp,
+            fdr_out=fdr_out,
+            encoding_name=encoding_name,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            prefix_name=prefix_name,
+            offload=offload,
+            store=store,
+        )
 
-        num_tokens = len(encoding.encode(segment))
-        if num_tokens < chunk_size:
-            segments.append(segment.strip())
-            continue
+    metrics = current_metrics()
+    counter = _stage_token_counter(encoding_name, metrics)
+    text_splitter = _get_ts_splitter(chunk_size, chunk_overlap)
 
-        # ｛｛# 数据分片规则 #｝｝
+    with metrics.timer("chunk.read"):
+        text = fp.read_text(encoding="utf-8")
+    metrics.incr("chunk.files")
+    metrics.incr("chunk.chars_in", len(text))
+    segments = []
+
+    code_path = f"{fp.parent}\\{fp.name}"
+    segment = ts_block.format(path=code_path, code=text)
+
+    num_tokens = counter.count(segment, limit=chunk_size)
+    if num_tokens < chunk_size:
+        segments.append(segment.strip())
+        metrics.incr("chunk.files_skipped")
+        return
+
+    # ｛｛# 数据分片规则 #｝｝
+    # 包装模板的开销对同一文件是常量，分片的 token 数按 模板开销 + 代码块 估算
+    block_num_tokens = counter.overhead(ts_block.format(path=code_path, code="").strip())
+    with metrics.timer("chunk.text_split"):
         chunks = text_splitter.split_text(text)
-        for i, chunk in enumerate(chunks):
-            segment = ts_block.format(path=code_path, code=chunk).strip()
-            _validate_max_tokens(encoding, segment, fp.name)
-            segments.append(segment)
+    for i, chunk in enumerate(chunks):
+        segment = ts_block.format(path=code_path, code=chunk).strip()
+        num_tokens = block_num_tokens + counter.count(chunk)
+        _validate_max_tokens(counter, segment, fp.name, num_tokens=num_tokens)
+        segments.append((segment, num_tokens, None))
+
+    return _offload(
+        _source_code_ts_title(fp), segments, fp, fdr_out, prefix_name=prefix_name, write=offload, store=store
+    )
 
-        # {{# 文件命名 #}}
-        header_1_title = fp.name
-        for _ext in [".ts", ".tsx"]:
-            if header_1_title.endswith(_ext):
-                header_1_title = header_1_title.replace(_ext, ".txt")
 
-        yield _offload(header_1_title, segments, fp, fdr_out, prefix_name=kwargs.get("prefix_name"))
+def _source_code_ts_title(fp: Path) -> str:
+    # {{# 文件命名 #}}
+    header_1_title = fp.name
+    for _ext in [".ts", ".tsx"]:
+        if header_1_title.endswith(_ext):
+            header_1_title = header_1_title.replace(_ext, ".txt")
+    return header_1_title
 
 
-def _offload(header_1_title: str, segments: List[str], fp: Path, fdr_out: Path, prefix_name=None):
+def _stream_source_code_ts_file(
+    fp: Path,
+    *,
+    fdr_out: Path,
+    encoding_name: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    prefix_name: str | None = None,
+    offload: bool = True,
+    store: ChunkStore | None = None,
+):
+    """
+    超大源码文件的分片流程
+
+    按顶层声明把源码聚合为 STREAM_WINDOW_CHARS 大小的窗口，逐个窗口切分并写入卡片文件。
+    """
+    metrics = current_metrics()
+    counter = _stage_token_counter(encoding_name, metrics)
+    text_splitter = _get_ts_splitter(chunk_size, chunk_overlap)
+
+    code_path = f"{fp.parent}\\{fp.name}"
+    head_text = "\n".join(_take_chars(iter_lines(fp), STREAM_WINDOW_CHARS))
+    if counter.count(ts_block.format(path=code_path, code=head_text), limit=chunk_size) < chunk_size:
+        return _split_source_code_ts_file(
+            fp,
+            fdr_out=fdr_out,
+            encoding_name=encoding_name,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            prefix_name=prefix_name,
+            offload=offload,
+            large_file_threshold=None,
+            store=store,
+        )
+    del head_text
+
+    metrics.incr("chunk.files")
+    metrics.incr("chunk.large_files")
+    block_num_tokens = counter.overhead(ts_block.format(path=code_path, code="").strip())
+    # 与 Language.TS 的顶层分隔符一致，另外允许在 export 声明前截断
+    boundaries = ("export ",) + tuple(
+        sep[1:] for sep in RecursiveCharacterTextSplitter.get_separators_for_language(Language.TS) if sep[1:].strip()
+    )
+
+    lines = _count_chars(iter_lines(fp), metrics)
+    with _card_writer(fdr_out, fp, offload=offload, store=store) as writer:
+        for window in iter_code_windows(lines, boundaries=boundaries):
+            with metrics.timer("chunk.text_split"):
+                chunks = text_splitter.split_text(window)
+            for chunk in chunks:
+                segment = ts_block.format(path=code_path, code=chunk).strip()
+                num_tokens = block_num_tokens + counter.count(chunk)
+                _validate_max_tokens(counter, segment, fp.name, num_tokens=num_tokens)
+                writer.add(segment, num_tokens=num_tokens)
+        with metrics.timer("chunk.offload"):
+            return _commit_card(writer, _source_code_ts_title(fp), fp, prefix_name=prefix_name)
+
+
+def _check_offload(incremental: bool, offload: bool):
+    if incremental and not offload:
+        raise ValueError("incremental=True requires offload=True, unchanged cards are read back from fdr_out")
+
+
+def _card_name(header_1_title: str, fp: Path, prefix_name=None) -> str:
     # 替换掉非法文件命名字符
     if not header_1_title.endswith(".txt"):
         header_1_title = f"{header_1_title}.txt"
@@ -221,25 +780,62 @@ def _offload(header_1_title: str, segments: List[str], fp: Path, fdr_out: Path,
     for i in inv:
         header_1_title = header_1_title.replace(i, "")
 
-    # 将分片压缩到一个卡片中，存储至单个文件
-    knowledge_card = SEPARATOR.join(segments)
-
     fp_name = f"{str(list(fp.parents)[0])}_{header_1_title}".replace("\\", "_")
     if prefix_name:
         fp_name = f"{prefix_name}_{fp_name}"
+    return fp_name
+
+
+def _offload(
+    header_1_title: str,
+    segments: Iterable[Tuple[str, int | None, Dict[str, str] | None]],
+    fp: Path,
+    fdr_out: Path,
+    prefix_name=None,
+    write: bool = True,
+    store: ChunkStore | None = None,
+):
+    # 分片逐个写入卡片文件，不在内存中拼接整张卡片
+    metrics = current_metrics()
+    with metrics.timer("chunk.offload"), _card_writer(fdr_out, fp, offload=write, store=store) as writer:
+        for segment, num_tokens, metadata in segments:
+            writer.add(segment, num_tokens=num_tokens, metadata=metadata)
+        return _commit_card(writer, header_1_title, fp, prefix_name=prefix_name)
 
-    # ｛｛# 数据存储 #｝｝
-    fdr_out.mkdir(exist_ok=True, parents=True)
-    fp_out = fdr_out / fp_name
-    fp_out.write_text(knowledge_card, encoding="utf8")
 
-    if knowledge_card:
-        table_name = fp_name.replace(".txt", "")
+def _resolve_store(store: ChunkStore | str | os.PathLike | None) -> ChunkStore | None:
+    if store is None or isinstance(store, ChunkStore):
+        return store
+    return ChunkStore.open(store)
+
+
+def _card_writer(fdr_out: Path, fp: Path, *, offload: bool, store: ChunkStore | None) -> CardWriter | ChunkStoreWriter:
+    if store is not None:
+        return store.writer(source=fp)
+    return CardWriter(fdr_out if offload else None)
+
+
+def _commit_card(
+    writer: CardWriter | ChunkStoreWriter, header_1_title: str, fp: Path, prefix_name=None
+) -> Tuple[str, KnowledgeCard] | None:
+    # ｛｛# 数据存储 #｝｝
+    fp_name = _card_name(header_1_title, fp, prefix_name)
+    knowledge_card = writer.commit(fp_name)
+
+    if writer.num_chars:
+        metrics = current_metrics()
+        metrics.incr("chunk.cards")
+        metrics.incr("chunk.segments", writer.num_segments)
+        metrics.incr("chunk.chars_out", writer.num_chars)
+        table_name = fp_name.removesuffix(".txt")
         return table_name, knowledge_card
 
 
-def _validate_max_tokens(encoding, segment: str, fp_name: str, *, max_tokens=MAX_TOKENS, sid=0):
-    num_tokens_after_splitting = len(encoding.encode(segment))
+def _validate_max_tokens(
+    counter: TokenCounter, segment: str, fp_name: str, *, max_tokens=MAX_TOKENS, sid=0, num_tokens: int | None = None
+):
+    # 复用分片阶段已统计的 token 数，避免重复编码
+    num_tokens_after_splitting = counter.count(segment) if num_tokens is None else num_tokens
     if num_tokens_after_splitting >= max_tokens:
         logger.warning(
             f"[{sid}] 块异常，max_tokens>={max_tokens} {len(segment)=} {num_tokens_after_splitting=} {fp_name=}"
@@ -253,6 +849,21 @@ class KnowledgePipline(ABC):
     db_name: str
     sync_to_dify: bool = False
     force_override: bool = False
+    skip_unchanged: bool = False
+    differential_sync: bool = False
+    max_concurrency: int = 1
+    wait_indexed: bool = False
+    indexing_timeout: float | None = 3600
+    plan_only: bool = False
+    token_budget: int | None = None
+    run_id: str | None = None
+    fire_drop_options: Dict[str, Any] = field(default_factory=dict)
+    metrics_exporters: List[MetricsExporter] = field(default_factory=list)
+    metrics: Metrics = field(default_factory=Metrics, init=False)
+    metrics_report: MetricsReport | None = field(default=None, init=False)
+    sync_plan: SyncPlan | None = field(default=None, init=False)
+    sync_report: SyncReport | None = field(default=None, init=False)
+    indexing_statuses: List[BatchStatus] = field(default_factory=list, init=False)
     separator = "\n\n------------\n\n"
 
     @abstractmethod
@@ -263,15 +874,80 @@ class KnowledgePipline(ABC):
         if sync_to_dify is not None:
             self.sync_to_dify = sync_to_dify
 
-        self._invoke()
+        # 每次运行重新统计，分片函数与 DifyFireDrop 通过 use_metrics 共享同一个 Metrics
+        self.metrics = Metrics(exporters=self.metrics_exporters)
+        with use_metrics(self.metrics):
+            try:
+                with self.metrics.timer("pipeline.invoke"):
+                    self._invoke()
+            finally:
+                self.metrics_report = self.metrics.export()
         return self
 
-    def delete_all(self):
-        dify_datasets = DifyFireDrop(separator=self.separator)
-        dify_datasets.delete_all_document(db_name=self.db_name)
-
-    def _sync_to_dify(self, table_to_knowledge: Dict[str, str]):
-        if self.sync_to_dify and table_to_knowledge:
-            dify_datasets = DifyFireDrop(separator=self.separator)
-            dify_datasets.embed_knowledge(table_to_knowledge, db_name=self.db_name, force_override=self.force_override)
+    def _create_fire_drop(self) -> DifyFireDrop:
+        # fire_drop_options 透传给 DifyFireDrop，例如 retry, rate_limit, dify_base_url
+        options = {"max_concurrency": self.max_concurrency, "metrics": self.metrics, **self.fire_drop_options}
+        return DifyFireDrop(separator=self.separator, **options)
+
+    def delete_all(self, retry_rounds: int = 1) -> DeleteReport:
+        """以 max_concurrency 的并发度删除知识库中的全部文档，返回删除汇总"""
+        dify_datasets = self._create_fire_drop()
+        return dify_datasets.delete_all_document(db_name=self.db_name, retry_rounds=retry_rounds)
+
+    def _sync_to_dify(self, table_to_knowledge: Dict[str, str] | Iterable[Tuple[str, str]]):
+        """
+        - plan_only: 只计算同步计划（self.sync_plan），不修改知识库
+        - run_id: 记录同步运行日志，中断后使用相同的 run_id 重新运行只处理剩余的文档，见 DifyFireDrop.embed_knowledge
+        - token_budget: 先规划再执行，本次运行最多嵌入 token_budget 个 token，其余文档留到下一次运行；
+          按整篇文档更新，不使用 differential_sync，也不记录 run_id 运行日志（设置时打印警告）
+
+        Args:
+            table_to_knowledge: 已收集的 {table_name: KnowledgeCard}；
+                也可以直接传入 fork_*_to_chunks 返回的生成器，边分片边上传，不在内存中保留全部卡片
+        """
+        sync_to_dify = self.sync_to_dify or self.plan_only
+        if not isinstance(table_to_knowledge, Mapping):
+            if not sync_to_dify:
+                # 不上传时仍然需要跑完分片流程
+                deque(table_to_knowledge, maxlen=0)
+                return self
+        elif not (sync_to_dify and table_to_knowledge):
+            return self
+
+        dify_datasets = self._create_fire_drop()
+        options = {
+            "db_name": self.db_name,
+            "force_override": self.force_override,
+            "skip_unchanged": self.skip_unchanged,
+            "differential": self.differential_sync,
+            "run_id": self.run_id,
+        }
+        if self.plan_only or self.token_budget is not None:
+            # 计划按整篇文档估算与执行，不记录运行日志，也不按分段差量同步
+            if ignored := [name for name in ("run_id", "differential_sync") if getattr(self, name)]:
+                logger.warning(f"plan_only/token_budget 不支持以下选项，本次运行忽略 - {ignored=}")
+            # 规划需要完整的卡片集合，生成器在这里收集为 {table_name: KnowledgeCard}
+            if not isinstance(table_to_knowledge, Mapping):
+                table_to_knowledge = dict(table_to_knowledge)
+            self.sync_plan = dify_datasets.plan_sync(
+                table_to_knowledge,
+                db_name=self.db_name,
+                force_override=self.force_override,
+                skip_unchanged=self.skip_unchanged,
+            )
+            if self.plan_only:
+                return self
+            self.sync_report = dify_datasets.apply_plan(
+                self.sync_plan, table_to_knowledge, max_tokens=self.token_budget
+            )
+        elif isinstance(table_to_knowledge, Mapping):
+            self.sync_report = dify_datasets.embed_knowledge(table_to_knowledge, **options)
+        else:
+            self.sync_report = dify_datasets.embed_knowledge_stream(table_to_knowledge, **options)
+
+        # 阻塞直到本次上传的文档全部可被检索，最多等待 indexing_timeout 秒，超时的批次标记为 timeout
+        if self.wait_indexed and self.sync_report and self.sync_report.batches:
+            self.indexing_statuses = dify_datasets.await_indexed(
+                self.sync_report.dataset_id, self.sync_report.batches, timeout=self.indexing_timeout
+            )
         return self
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import List, Literal, Tuple
+
+from pydantic import BaseModel, Field
+
+
+class PlannedDocument(BaseModel):
+    table_name: str
+    action: Literal["create", "update", "skip", "delete"]
+    document_id: str | None = None
+    digest: str | None = Field(None, description="规划时的卡片哈希，执行前校验卡片内容没有变化")
+    num_tokens: int = Field(0, description="需要重新嵌入的 token 数")
+    nbytes: int = Field(0, description="上传的卡片文本的 utf8 字节数")
+    requests: int = Field(0, description="预计发出的写请求数")
+
+
+class SyncPlan(BaseModel):
+    """
+    DifyFireDrop.plan_sync 生成的同步计划
+
+    规划阶段只发起只读请求。相同的卡片、文档列表与本地同步状态总是得到相同的计划，
+    可以保存为 JSON，在低峰期交给 DifyFireDrop.apply_plan 执行。
+
+    ```python
+    plan = drop.plan_sync(cards, db_name="docs", skip_unchanged=True)
+    print(plan.summary())
+    tonight, rest = plan.split(max_tokens=2_000_000)
+    tonight.save("plans/docs.json")
+    ```
+    """
+
+    db_name: str
+    dataset_id: str | None = Field(None, description="知识库不存在时为 None，执行时创建")
+    force_override: bool = False
+    skip_unchanged: bool = False
+    prune: bool = Field(False, description="是否删除本地已不存在的文档")
+    encoding_name: str = "gpt2"
+    documents: List[PlannedDocument] = Field(default_factory=list, description="按 table_name 排序")
+
+    def count(self, action: str) -> int:
+        return sum(1 for document in self.documents if document.action == action)
+
+    @property
+    def creates(self) -> int:
+        return self.count("create")
+
+    @property
+    def updates(self) -> int:
+        return self.count("update")
+
+    @property
+    def skips(self) -> int:
+        return self.count("skip")
+
+    @property
+    def deletes(self) -> int:
+        return self.count("delete")
+
+    @property
+    def num_tokens(self) -> int:
+        return sum(document.num_tokens for document in self.documents)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(document.nbytes for document in self.documents)
+
+    @property
+    def requests(self) -> int:
+        """预计发出的写请求数，包含知识库不存在时的创建请求"""
+        return sum(document.requests for document in self.documents) + (self.dataset_id is None)
+
+    def split(self, max_tokens: int) -> Tuple[SyncPlan, SyncPlan]:
+        """
+        按嵌入 token 预算拆分计划
+
+        依次纳入需要嵌入的文档，超出预算的文档留给下一个计划；删除、跳过的文档不消耗预算，总是纳入本次计划。
+        单个文档超过整个预算时，只在本次计划还没有纳入任何需要嵌入的文档时纳入，避免它永远无法执行。
+
+        Returns: (本次执行的计划, 推迟的计划)
+
+        """
+        selected, deferred = [], []
+        budget = max_tokens
+        for document in self.documents:
+            if not document.num_tokens or document.num_tokens <= budget:
+                selected.append(document)
+                budget -= document.num_tokens
+            elif budget == max_tokens:
+                selected.append(document)
+                budget = 0
+            else:
+                deferred.append(document)
+        return self.model_copy(update={"documents": selected}), self.model_copy(update={"documents": deferred})
+
+    def summary(self) -> str:
+        return (
+            f"db_name={self.db_name} create={self.creates} update={self.updates} skip={self.skips} "
+            f"delete={self.deletes} tokens={self.num_tokens} bytes={self.nbytes} requests={self.requests}"
+        )
+
+    def save(self, path: Path | str | os.PathLike):
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        tmp = path.with_name(f"{path.name}.tmp")
+        tmp.write_text(self.model_dump_json(indent=2), encoding="utf8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path | str | os.PathLike) -> SyncPlan:
+        return cls.model_validate_json(Path(path).read_text(encoding="utf8"))
@@ -0,0 +1,192 @@
+"""
+超大源文件的流式读取
+
+整份文档不会一次性读入内存：通过 mmap 逐行解码，按标题边界流式切分章节，过长的章节按窗口截断后再交给 text splitter。
+内存占用取决于窗口大小（STREAM_WINDOW_CHARS），与文件大小无关。
+"""
+
+from __future__ import annotations
+
+import codecs
+import mmap
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# 超过该大小（字节）的源文件走流式分片
+LARGE_FILE_THRESHOLD = 16 * 1024 * 1024
+
+# 单个章节（或代码窗口）在内存中的最大字符数，超过后截断为多个片段
+STREAM_WINDOW_CHARS = 1 << 20
+
+
+def iter_lines(fp: Path, *, encoding: str = "utf8") -> Iterator[str]:
+    """
+    逐行读取文件，不包含换行符
+
+    换行规则与 Path.read_text 的通用换行一致，`\\r\\n` 与 `\\r` 均视为换行。
+    """
+    with fp.open("rb") as file:
+        if not fp.stat().st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            while raw := mm.readline():
+                line = decoder.decode(raw)
+                if line.endswith("\n"):
+                    line = line[:-2] if line.endswith("\r\n") else line[:-1]
+                if "\r" in line:
+                    yield from line.split("\r")
+                else:
+                    yield line
+            if tail := decoder.decode(b"", final=True):
+                yield tail
+
+
+def collapse_blank_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    流式版本的 `text.replace("\\n\\n", "\\n")`：连续 k 个空行只保留 k // 2 个
+    """
+    blank = 0
+    for line in lines:
+        if not line:
+            blank += 1
+            continue
+        if blank:
+            yield from [""] * (blank // 2)
+            blank = 0
+        yield line
+    if blank:
+        yield from [""] * (blank // 2)
+
+
+class _SectionBuffer:
+    """合并元数据相同的相邻文本块，与 MarkdownHeaderTextSplitter.aggregate_lines_to_chunks 一致"""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.metadata: Dict[str, str] | None = None
+        self.parts: List[str] = []
+        self.chars = 0
+
+    def add(self, content: str, metadata: Dict[str, str]) -> Iterator[Tuple[Dict[str, str], str]]:
+        if self.parts and metadata != self.metadata:
+            yield self.flush()
+        self.metadata = metadata
+        self.parts.append(content)
+        self.chars += len(content)
+        if self.chars >= self.max_chars:
+            yield self.flush()
+
+    def flush(self) -> Tuple[Dict[str, str], str]:
+        section = (self.metadata, "  \n".join(self.parts))
+        self.parts = []
+        self.chars = 0
+        return section
+
+
+class MarkdownSectionStream:
+    """
+    MarkdownHeaderTextSplitter(strip_headers=True) 的流式实现
+
+    对同一份文本产出相同的 (metadata, content) 序列；仅当单个章节超过 max_section_chars 时，
+    该章节会被截断为多个元数据相同的片段。
+    """
+
+    def __init__(self, headers_to_split_on: Sequence[Tuple[str, str]], *, max_section_chars: int = STREAM_WINDOW_CHARS):
+        self.headers_to_split_on = sorted(headers_to_split_on, key=lambda split: len(split[0]), reverse=True)
+        self.max_section_chars = max_section_chars
+
+    def split_lines(self, lines: Iterable[str]) -> Iterator[Tuple[Dict[str, str], str]]:
+        sections = _SectionBuffer(self.max_section_chars)
+        block: List[str] = []
+        block_chars = 0
+        header_stack: List[Tuple[int, str]] = []
+        initial_metadata: Dict[str, str] = {}
+        current_metadata: Dict[str, str] = {}
+        in_code_block = False
+        opening_fence = ""
+        # 代码块中的空行暂存到下一个非空行出现时，文末的空行与 text.strip() 一样被丢弃
+        blank_code_lines = 0
+
+        for line in lines:
+            stripped_line = "".join(filter(str.isprintable, line.strip()))
+            if not in_code_block:
+                if stripped_line.startswith("```") and stripped_line.count("```") == 1:
+                    in_code_block = True
+                    opening_fence = "```"
+                elif stripped_line.startswith("~~~"):
+                    in_code_block = True
+                    opening_fence = "~~~"
+            elif stripped_line.startswith(opening_fence):
+                in_code_block = False
+                opening_fence = ""
+
+            if stripped_line and blank_code_lines:
+                block.extend([""] * blank_code_lines)
+                block_chars += blank_code_lines
+                blank_code_lines = 0
+
+            if in_code_block:
+                if not stripped_line:
+                    blank_code_lines += 1
+                    continue
+                block.append(stripped_line)
+                block_chars += len(stripped_line) + 1
+                if block_chars >= self.max_section_chars:
+                    yield from sections.add("\n".join(block), current_metadata.copy())
+                    block, block_chars = [], 0
+                continue
+
+            for sep, name in self.headers_to_split_on:
+                if stripped_line.startswith(sep) and (len(stripped_line) == len(sep) or stripped_line[len(sep)] == " "):
+                    level = sep.count("#")
+                    while header_stack and header_stack[-1][0] >= level:
+                        _, popped = header_stack.pop()
+                        initial_metadata.pop(popped, None)
+                    header_stack.append((level, name))
+                    initial_metadata[name] = stripped_line[len(sep) :].strip()
+
+                    if block:
+                        yield from sections.add("\n".join(block), current_metadata.copy())
+                        block, block_chars = [], 0
+                    break
+            else:
+                if stripped_line:
+                    block.append(stripped_line)
+                    block_chars += len(stripped_line) + 1
+                    if block_chars >= self.max_section_chars:
+                        yield from sections.add("\n".join(block), current_metadata.copy())
+                        block, block_chars = [], 0
+                elif block:
+                    yield from sections.add("\n".join(block), current_metadata.copy())
+                    block, block_chars = [], 0
+
+            current_metadata = initial_metadata.copy()
+
+        if block:
+            yield from sections.add("\n".join(block), current_metadata)
+        if sections.parts:
+            yield sections.flush()
+
+
+def iter_code_windows(
+    lines: Iterable[str], *, boundaries: Sequence[str] = (), max_chars: int = STREAM_WINDOW_CHARS
+) -> Iterator[str]:
+    """
+    将源码按行聚合为不超过约 max_chars 的窗口
+
+    窗口达到 max_chars 后，在下一个空行或以 boundaries 开头的行（顶层声明）之前截断；
+    一直没有合适的边界时，超过 2 * max_chars 直接在行边界截断。
+    """
+    boundaries = tuple(boundaries)
+    window: List[str] = []
+    chars = 0
+    for line in lines:
+        if window and chars >= max_chars:
+            if not line or line.startswith(boundaries) or chars >= max_chars * 2:
+                yield "\n".join(window)
+                window, chars = [], 0
+        window.append(line)
+        chars += len(line) + 1
+    if window:
+        yield "\n".join(window)
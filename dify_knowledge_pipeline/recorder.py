@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import atexit
+import gzip
+import json
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Literal
+
+import httpx
+from loguru import logger
+
+RecorderMode = Literal["off", "background", "jsonl"]
+
+
+class ResponseRecorder:
+    """
+    接口响应记录器，默认不记录任何内容
+
+    record 在请求线程中调用，只负责收集响应体与耗时，不做任何解析或磁盘写入
+    """
+
+    def record(self, response: httpx.Response, name: str | None = None):
+        pass
+
+    def flush(self, timeout: float | None = None):
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _entry(response: httpx.Response, name: str | None) -> Dict[str, Any]:
+        request = response.request
+        try:
+            elapsed_ms = round(response.elapsed.total_seconds() * 1000, 2)
+        except RuntimeError:
+            elapsed_ms = None
+        return {
+            "ts": time.time(),
+            "name": name,
+            "method": request.method,
+            "url": str(request.url),
+            "status_code": response.status_code,
+            "elapsed_ms": elapsed_ms,
+            "content": response.content,
+        }
+
+
+class _BackgroundRecorder(ResponseRecorder, ABC):
+    """由后台线程消费队列并写盘，队列写满时丢弃记录而不是阻塞请求"""
+
+    def __init__(self, storage_dir: Path | str, *, max_queue: int = 10000):
+        self.storage_dir = Path(storage_dir)
+        self.dropped = 0
+        self._queue: queue.Queue[Dict[str, Any] | None] = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def record(self, response: httpx.Response, name: str | None = None):
+        if self._closed:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(self._entry(response, name))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                self._write(entry)
+                if self._queue.empty():
+                    self._idle()
+            except Exception as err:
+                logger.error(f"Failed to save knowledge dataset to disk: {err}")
+            finally:
+                self._queue.task_done()
+
+    @abstractmethod
+    def _write(self, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _idle(self):
+        """队列清空时调用，用于刷新缓冲区"""
+
+    def _shutdown(self):
+        """后台线程退出后调用，用于关闭文件"""
+
+    def flush(self, timeout: float | None = None):
+        """等待已入队的记录全部写盘"""
+        if self._thread is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.01)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+            self._shutdown()
+        if self.dropped:
+            logger.warning(f"响应记录队列已满，丢弃了 {self.dropped} 条记录")
+
+
+class SnapshotRecorder(_BackgroundRecorder):
+    """
+    与旧版行为一致：每个接口只保留最近一次响应 <storage_dir>/<name>，
+    格式化写盘在后台线程中完成
+    """
+
+    def _write(self, entry: Dict[str, Any]):
+        if not (name := entry["name"]):
+            return
+        body = json.loads(entry["content"])
+        (self.storage_dir / name).write_text(json.dumps(body, ensure_ascii=False, indent=2), encoding="utf8")
+
+
+class JsonlRecorder(_BackgroundRecorder):
+    """
+    追加写入 gzip 压缩的 JSONL 日志 <storage_dir>/<filename>，每行一条响应及其耗时
+
+    压缩后的文件超过 max_bytes 时轮转为 <filename>.1 ... <filename>.<backup_count>
+    """
+
+    def __init__(
+        self,
+        storage_dir: Path | str,
+        *,
+        filename: str = "responses.jsonl.gz",
+        max_bytes: int = 64 * 1024 * 1024,
+        backup_count: int = 5,
+        max_queue: int = 10000,
+    ):
+        super().__init__(storage_dir, max_queue=max_queue)
+        self.path = self.storage_dir / filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._raw = None
+        self._gz: gzip.GzipFile | None = None
+
+    def _open(self):
+        # 每次打开追加一个新的 gzip member，多个 member 串联仍是合法的 gzip 文件
+        self._raw = open(self.path, "ab")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="ab")
+
+    def _close_file(self):
+        if self._gz is not None:
+            self._gz.close()
+            self._raw.close()
+            self._gz = self._raw = None
+
+    def _rotate(self):
+        self._close_file()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def _write(self, entry: Dict[str, Any]):
+        if self._gz is None:
+            self._open()
+        content = entry.pop("content")
+        try:
+            entry["body"] = json.loads(content)
+        except ValueError:
+            entry["body"] = content.decode("utf8", errors="replace")
+        self._gz.write(json.dumps(entry, ensure_ascii=False).encode("utf8") + b"\n")
+        if self._raw.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _idle(self):
+        if self._gz is not None:
+            self._gz.flush()
+
+    def _shutdown(self):
+        self._close_file()
+
+
+def make_recorder(mode: RecorderMode | ResponseRecorder | None, storage_dir: Path | str) -> ResponseRecorder:
+    """
+    Args:
+        mode: off 不记录（默认），background 在后台线程中保存每个接口最近一次的响应，jsonl 追加写入压缩日志
+        storage_dir: 记录文件所在目录，首次写入时才会创建
+
+    Returns:
+
+    """
+    if isinstance(mode, ResponseRecorder):
+        return mode
+    if mode in (None, "off"):
+        return ResponseRecorder()
+    if mode == "background":
+        return SnapshotRecorder(storage_dir)
+    if mode == "jsonl":
+        return JsonlRecorder(storage_dir)
+    raise ValueError(f"Unknown recorder mode: {mode!r}")
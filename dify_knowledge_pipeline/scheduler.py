@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import suppress
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import httpx
+from loguru import logger
+
+from dify_knowledge_pipeline.cards import KnowledgeCard
+from dify_knowledge_pipeline.indexing import TERMINAL_STATUSES
+from dify_knowledge_pipeline.metrics import NULL_METRICS, Metrics
+from dify_knowledge_pipeline.segments import split_card
+from dify_knowledge_pipeline.tokens import TokenCounter
+from dify_knowledge_pipeline.transport import TokenBucket
+
+Priority = Callable[[str, "str | KnowledgeCard"], Any]
+
+
+def smallest_first(table_name: str, knowledge_card: str | KnowledgeCard) -> int:
+    """小卡片先上传，尽快让更多文档可被检索"""
+    if isinstance(knowledge_card, KnowledgeCard):
+        return knowledge_card.nbytes
+    return len(knowledge_card.encode("utf8"))
+
+
+def recently_changed_first(table_name: str, knowledge_card: str | KnowledgeCard) -> float:
+    """最近写入的卡片先上传，按落盘卡片的修改时间排序，未落盘的卡片排在最后"""
+    if isinstance(knowledge_card, KnowledgeCard) and knowledge_card.path is not None:
+        with suppress(OSError):
+            return -knowledge_card.path.stat().st_mtime
+    return 0.0
+
+
+class UploadScheduler:
+    """
+    上传调度
+
+    - priority: 按 priority(table_name, knowledge_card) 升序上传，卡片句柄在排序时不会被读取
+    - tokens_per_minute / requests_per_minute: 按卡片的 token 数与写请求数限流，令牌桶允许的突发量为一秒的预算
+    - max_indexing_backlog: 已上传但尚未嵌入完成的批次达到上限时暂停上传，轮询嵌入状态直到积压回落
+
+    全部参数为空时不做任何调度，与直接上传相同。
+
+    ```python
+    scheduler = UploadScheduler(
+        priority=smallest_first, tokens_per_minute=1_000_000, requests_per_minute=600, max_indexing_backlog=16
+    )
+    DifyFireDrop(max_concurrency=8, scheduler=scheduler).embed_knowledge(cards, db_name="docs")
+    ```
+    """
+
+    def __init__(
+        self,
+        *,
+        priority: Priority | None = None,
+        tokens_per_minute: float | None = None,
+        requests_per_minute: float | None = None,
+        max_indexing_backlog: int | None = None,
+        poll_interval: float = 2.0,
+        encoding_name: str = "gpt2",
+    ):
+        """
+        Args:
+            priority: 排序键函数，值越小越先上传
+            tokens_per_minute: 每分钟最多提交嵌入的 token 数
+            requests_per_minute: 每分钟最多发出的上传请求数
+            max_indexing_backlog: 允许同时处于嵌入中的批次数量
+            poll_interval: 暂停期间轮询嵌入状态的间隔（秒）
+            encoding_name: 统计 token 使用的 tiktoken 编码
+        """
+        self.priority = priority
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_indexing_backlog = max_indexing_backlog
+        self.poll_interval = poll_interval
+        self.encoding_name = encoding_name
+
+        self._token_bucket = TokenBucket(tokens_per_minute / 60) if tokens_per_minute else None
+        self._request_bucket = TokenBucket(requests_per_minute / 60) if requests_per_minute else None
+        self._counter: TokenCounter | None = None
+        self._fetch_status: Callable[[str, str], List[Dict[str, Any]]] | None = None
+        self._separator = "\n\n------------\n\n"
+        self.metrics: Metrics = NULL_METRICS
+
+        # (dataset_id, batch)，按上传顺序排列
+        self._backlog: Dict[Tuple[str, str], None] = {}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+
+    def bind(
+        self, fetch_status: Callable[[str, str], List[Dict[str, Any]]], *, separator: str, metrics: Metrics
+    ) -> UploadScheduler:
+        """由 DifyFireDrop 设置查询嵌入状态的方法、分段标识符与 metrics"""
+        self._fetch_status = fetch_status
+        self._separator = separator
+        self.metrics = metrics
+        return self
+
+    def order(self, items: Iterable[Tuple[str, str | KnowledgeCard]]) -> Iterable[Tuple[str, str | KnowledgeCard]]:
+        if self.priority is None:
+            return items
+        # 稳定排序，优先级相同的文档保持输入顺序
+        return sorted(items, key=lambda item: self.priority(*item))
+
+    def count_tokens(self, knowledge_card: str | None = None, *, segments: Iterable[str] | None = None) -> int:
+        if self._counter is None:
+            self._counter = TokenCounter.from_encoding_name(self.encoding_name)
+        if segments is None:
+            segments = split_card(knowledge_card, self._separator)
+        return sum(self._counter.count(segment) for segment in segments)
+
+    def admit(
+        self,
+        knowledge_card: str | None = None,
+        *,
+        segments: Iterable[str] | None = None,
+        requests: int = 1,
+        num_tokens: int | None = None,
+    ):
+        """
+        阻塞直到嵌入积压与 token、请求预算允许上传该卡片
+
+        Args:
+            knowledge_card: 卡片文本
+            segments: 只重新嵌入部分分段时传入这些分段，代替 knowledge_card 统计 token 数
+            requests: 上传该卡片需要发出的写请求数
+            num_tokens: 已知的 token 数，例如 SyncPlan 中的估算，省去重新计数
+        """
+        self._await_backlog()
+
+        waited = 0.0
+        if self._token_bucket is not None:
+            if num_tokens is None:
+                num_tokens = self.count_tokens(knowledge_card, segments=segments)
+            waited += self._token_bucket.acquire(num_tokens)
+            self.metrics.incr("sync.scheduled_tokens", num_tokens)
+        if self._request_bucket is not None:
+            waited += self._request_bucket.acquire(requests)
+        if waited:
+            self.metrics.observe("sync.throttle_wait", waited)
+
+    def track(self, dataset_id: str, batch: str | None):
+        """记录已上传的批次，计入嵌入积压"""
+        if self.max_indexing_backlog and batch:
+            with self._lock:
+                self._backlog[(dataset_id, batch)] = None
+
+    @property
+    def backlog(self) -> int:
+        with self._lock:
+            return len(self._backlog)
+
+    def _await_backlog(self):
+        if not self.max_indexing_backlog:
+            return
+
+        paused_at = None
+        while self.backlog >= self.max_indexing_backlog:
+            if paused_at is None:
+                paused_at = time.perf_counter()
+                self.metrics.incr("sync.backlog_pauses")
+                logger.debug(f"嵌入积压，暂停上传 - backlog={self.backlog} max={self.max_indexing_backlog}")
+            # 只有一个线程轮询，其余线程等待轮询结果
+            with self._poll_lock:
+                if self.backlog < self.max_indexing_backlog:
+                    break
+                self._poll()
+                if self.backlog >= self.max_indexing_backlog:
+                    time.sleep(self.poll_interval)
+
+        if paused_at is not None:
+            self.metrics.observe("sync.backlog_wait", time.perf_counter() - paused_at)
+
+    def _poll(self):
+        with self._lock:
+            batches = list(self._backlog)
+
+        finished = []
+        for dataset_id, batch in batches:
+            self.metrics.incr("sync.indexing_polls")
+            try:
+                documents = self._fetch_status(dataset_id, batch)
+            except httpx.HTTPError as err:
+                # 查询失败的批次不再计入积压，避免上传永久暂停
+                logger.warning(f"查询嵌入状态失败，不再追踪该批次 - {batch=} {err=}")
+                finished.append((dataset_id, batch))
+                continue
+            if all(document.get("indexing_status") in TERMINAL_STATUSES for document in documents):
+                finished.append((dataset_id, batch))
+
+        with self._lock:
+            for key in finished:
+                self._backlog.pop(key, None)
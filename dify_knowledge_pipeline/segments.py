@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterable, List, Tuple
+
+from pydantic import BaseModel, Field
+
+
+def segment_digest(content: str) -> str:
+    # Dify 入库时会去掉分段首尾的空白
+    return hashlib.blake2b(content.strip().encode("utf8"), digest_size=16).hexdigest()
+
+
+def split_card(knowledge_card: str, separator: str) -> List[str]:
+    """按分段标识符切分知识卡片，与 Dify custom 分段规则一致，丢弃空白分段"""
+    return [segment for segment in knowledge_card.split(separator) if segment.strip()]
+
+
+class SegmentDiff(BaseModel):
+    """
+    文档现有分段与新卡片分段的差异
+
+    - unchanged: 内容哈希相同的分段，不发起请求
+    - update: 复用现有分段 id 写入新内容，只重新嵌入这一个分段
+    - create: 现有分段不够复用时新增的分段
+    - delete: 新卡片中不再需要的分段
+    """
+
+    unchanged: List[str] = Field(default_factory=list, description="segment_id")
+    update: List[Tuple[str, str]] = Field(default_factory=list, description="(segment_id, content)")
+    create: List[str] = Field(default_factory=list, description="content")
+    delete: List[str] = Field(default_factory=list, description="segment_id")
+
+    @property
+    def changed(self) -> int:
+        """需要重新嵌入或删除的分段数量"""
+        return len(self.update) + len(self.create) + len(self.delete)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "unchanged": len(self.unchanged),
+            "updated": len(self.update),
+            "created": len(self.create),
+            "deleted": len(self.delete),
+        }
+
+
+def diff_segments(existing: Iterable[Dict[str, Any]], contents: List[str]) -> SegmentDiff:
+    """
+    按内容哈希对比文档现有分段与新分段
+
+    相同内容的分段原样保留（重复内容按出现次数逐一匹配），其余分段按 position 顺序两两配对为 update，
+    多出的新分段 create，多出的旧分段 delete。
+
+    contents 中超过知识库分段长度（max_tokens）的分段，在整篇上传时会被 Dify 再次切分，
+    与远端的任何分段都不相同，每次同步都会被重写。分片阶段应保证分段不超过 max_tokens（见 _validate_max_tokens）。
+
+    Args:
+        existing: 分段列表接口返回的 segment，至少包含 id 与 content
+        contents: 新卡片按分段标识符切分后的分段内容
+
+    Returns:
+
+    """
+    existing = sorted(existing, key=lambda s: s.get("position") or 0)
+    by_digest: Dict[str, Deque[str]] = defaultdict(deque)
+    for segment in existing:
+        by_digest[segment_digest(segment["content"])].append(segment["id"])
+
+    diff = SegmentDiff()
+    unmatched_contents = []
+    for content in contents:
+        if ids := by_digest.get(segment_digest(content)):
+            diff.unchanged.append(ids.popleft())
+        else:
+            unmatched_contents.append(content)
+
+    matched = set(diff.unchanged)
+    reusable = [s["id"] for s in existing if s["id"] not in matched]
+    diff.update = list(zip(reusable, unmatched_contents))
+    diff.create = unmatched_contents[len(reusable) :]
+    diff.delete = reusable[len(unmatched_contents) :]
+    return diff
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+from loguru import logger
+
+
+def card_digest(text: str, *, separator: str, max_tokens: int) -> str:
+    """
+    知识卡片的内容哈希，分段规则（separator, max_tokens）变化时同样需要重新嵌入，一并计入哈希
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{max_tokens}\0{separator}\0".encode("utf8"))
+    h.update(text.encode("utf8"))
+    return h.hexdigest()
+
+
+class SyncState:
+    """
+    已上传知识卡片的本地状态
+
+    以 dataset_id / document_name 为键记录上传成功的卡片哈希与 document_id，
+    哈希未变化的卡片在下次同步时不会发起任何请求。
+    """
+
+    def __init__(self, path: Path | str | os.PathLike):
+        self.path = Path(path)
+        self._datasets: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+        if self.path.is_file():
+            try:
+                self._datasets = json.loads(self.path.read_text(encoding="utf8"))
+            except (OSError, ValueError) as err:
+                logger.warning(f"同步状态文件损坏，将重新上传全部文档 - {self.path=} {err=}")
+
+    def get(self, dataset_id: str, document_name: str) -> Dict[str, Any] | None:
+        return self._datasets.get(dataset_id, {}).get(document_name)
+
+    def is_unchanged(self, dataset_id: str, document_name: str, digest: str) -> bool:
+        return (record := self.get(dataset_id, document_name)) is not None and record.get("digest") == digest
+
+    def set(self, dataset_id: str, document_name: str, *, digest: str, document_id: str | None = None):
+        with self._lock:
+            self._datasets.setdefault(dataset_id, {})[document_name] = {"digest": digest, "document_id": document_id}
+
+    def discard(self, dataset_id: str, document_name: str):
+        with self._lock:
+            self._datasets.get(dataset_id, {}).pop(document_name, None)
+
+    def save(self):
+        with self._lock:
+            content = json.dumps(self._datasets, ensure_ascii=False)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        tmp.write_text(content, encoding="utf8")
+        os.replace(tmp, self.path)
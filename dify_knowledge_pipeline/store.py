@@ -0,0 +1,329 @@
+"""
+单文件的分片存储
+
+所有卡片的分片、token 数、来源路径、标题元数据与内容哈希写入同一个 SQLite 数据库，替代 fdr_out 下每个源文件一个 .txt 卡片。
+按卡片名随机读取走主键索引，遍历分片时游标逐行返回，不需要列目录、读文件再按分隔符切分。
+
+```python
+store = ChunkStore("knowledge/docs.chunks.db")
+for _ in fork_tech_docs_markdown_to_chunks(fdr_docs, fdr_out, store=store):
+    pass
+DifyFireDrop().embed_knowledge_stream(store.items(), db_name="docs")
+```
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+from dify_knowledge_pipeline.cards import SEPARATOR, KnowledgeCard
+from dify_knowledge_pipeline.segments import segment_digest
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    name TEXT PRIMARY KEY,
+    source TEXT,
+    num_segments INTEGER NOT NULL,
+    num_chars INTEGER NOT NULL,
+    num_tokens INTEGER,
+    digest TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    card TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    num_tokens INTEGER,
+    metadata TEXT,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (card, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS segments_content_hash ON segments (content_hash);
+"""
+
+# 写入中的卡片以该前缀暂存，commit 时在同一个事务里改名
+_PARTIAL_PREFIX = ".partial:"
+
+
+class StoredSegment(NamedTuple):
+    position: int
+    content: str
+    num_tokens: int | None
+    metadata: Dict[str, Any] | None
+    content_hash: str
+
+
+class ChunkStore:
+    """
+    基于 SQLite（WAL）的分片存储
+
+    - 每个进程的每个线程使用独立的连接，分片进程各自打开同一个数据库文件，写入由 SQLite 的文件锁串行化
+    - 卡片写入是原子的：分片分批写入暂存区，commit 时在一个事务里替换旧卡片，读者只会看到完整的卡片
+    """
+
+    def __init__(self, path: Path | str | os.PathLike, *, batch_size: int = 256, timeout: float = 60):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._local = threading.local()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, path: Path | str | os.PathLike) -> ChunkStore:
+        """进程内按路径复用同一个实例，供分片进程使用"""
+        return _open_store(str(Path(path).resolve()))
+
+    def __reduce__(self):
+        # 跨进程传递时只传路径，由接收方重新打开
+        return ChunkStore.open, (str(self.path.resolve()),)
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork 出的分片进程会继承父进程的 threading.local，继续使用父进程的连接会损坏数据库，按 pid 重新连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        if (conn := getattr(self._local, "conn", None)) is not None:
+            # 继承自父进程的连接不能在子进程中关闭
+            if self._local.pid == os.getpid():
+                conn.close()
+            self._local.conn = None
+
+    def writer(self, source: Path | str | None = None) -> ChunkStoreWriter:
+        return ChunkStoreWriter(self, source=str(source) if source is not None else None)
+
+    def __contains__(self, name: str) -> bool:
+        row = self._connect().execute("SELECT 1 FROM cards WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def get(self, name: str) -> StoredCard | None:
+        """
+        Args:
+            name: 卡片名，与写入 fdr_out 时的文件名相同（含 .txt 后缀）
+        """
+        row = self._connect().execute("SELECT num_segments FROM cards WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            return StoredCard(self, name, num_segments=row[0])
+
+    def names(self) -> List[str]:
+        return [name for (name,) in self._connect().execute("SELECT name FROM cards ORDER BY name")]
+
+    def items(self) -> Iterator[Tuple[str, StoredCard]]:
+        """
+        源文件被删除或标题变化后，旧卡片由增量分片（incremental=True）完整运行结束时从清单中清理；
+        未启用增量分片时 store 不知道卡片的来源是否仍然存在，需要调用方通过 delete 删除。
+
+        Returns: (table_name, StoredCard)，与 fork_*_to_chunks 的返回值相同，可以直接交给 DifyFireDrop 上传
+        """
+        rows = self._connect().execute("SELECT name, num_segments FROM cards WHERE num_chars > 0 ORDER BY name")
+        for name, num_segments in rows.fetchall():
+            yield name.removesuffix(".txt"), StoredCard(self, name, num_segments=num_segments)
+
+    def segment(self, name: str, position: int) -> StoredSegment | None:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT position, content, num_tokens, metadata, content_hash FROM segments"
+                " WHERE card = ? AND position = ?",
+                (name, position),
+            )
+            .fetchone()
+        )
+        return _to_segment(row) if row else None
+
+    def iter_segments(self, name: str) -> Iterator[StoredSegment]:
+        rows = self._connect().execute(
+            "SELECT position, content, num_tokens, metadata, content_hash FROM segments"
+            " WHERE card = ? ORDER BY position",
+            (name,),
+        )
+        for row in rows:
+            yield _to_segment(row)
+
+    def delete(self, name: str):
+        conn = self._connect()
+        with _transaction(conn):
+            conn.execute("DELETE FROM segments WHERE card = ?", (name,))
+            conn.execute("DELETE FROM cards WHERE name = ?", (name,))
+
+    def prune_partials(self):
+        """删除异常退出的写入留下的暂存分片，只应在没有其他写入者时调用"""
+        conn = self._connect()
+        with _transaction(conn):
+            conn.execute("DELETE FROM segments WHERE card LIKE ?", (f"{_PARTIAL_PREFIX}%",))
+
+
+@lru_cache(maxsize=None)
+def _open_store(path: str) -> ChunkStore:
+    return ChunkStore(path)
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _to_segment(row) -> StoredSegment:
+    position, content, num_tokens, metadata, content_hash = row
+    return StoredSegment(position, content, num_tokens, json.loads(metadata) if metadata else None, content_hash)
+
+
+class ChunkStoreWriter:
+    """与 CardWriter 相同的接口，分片写入 ChunkStore"""
+
+    def __init__(self, store: ChunkStore, *, source: str | None = None, separator: str = SEPARATOR):
+        self.store = store
+        self.source = source
+        self.separator = separator
+
+        self.num_segments = 0
+        self.num_chars = 0
+        self.num_tokens: int | None = 0
+        self._digest = hashlib.blake2b(digest_size=16)
+        self._staging = f"{_PARTIAL_PREFIX}{uuid.uuid4().hex}"
+        self._rows: List[tuple] = []
+        self._flushed = False
+        self._closed = False
+
+    def add(self, segment: str, *, num_tokens: int | None = None, metadata: Dict[str, Any] | None = None):
+        if self._closed:
+            raise RuntimeError("ChunkStoreWriter is already committed or aborted")
+
+        if self.num_segments:
+            self.num_chars += len(self.separator)
+            self._digest.update(self.separator.encode("utf8"))
+        self.num_chars += len(segment)
+        self._digest.update(segment.encode("utf8"))
+        if num_tokens is None or self.num_tokens is None:
+            self.num_tokens = None
+        else:
+            self.num_tokens += num_tokens
+
+        metadata = json.dumps(metadata, ensure_ascii=False) if metadata else None
+        self._rows.append((self._staging, self.num_segments, segment, num_tokens, metadata, segment_digest(segment)))
+        self.num_segments += 1
+        if len(self._rows) >= self.store.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        conn = self.store._connect()
+        with _transaction(conn):
+            conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?)", self._rows)
+        self._rows = []
+        self._flushed = True
+
+    def commit(self, name: str) -> StoredCard:
+        if self._closed:
+            raise RuntimeError("ChunkStoreWriter is already committed or aborted")
+        self._closed = True
+
+        conn = self.store._connect()
+        try:
+            with _transaction(conn):
+                conn.execute("DELETE FROM segments WHERE card = ?", (name,))
+                if self._flushed:
+                    conn.execute("UPDATE segments SET card = ? WHERE card = ?", (name, self._staging))
+                rows = [(name, *row[1:]) for row in self._rows]
+                conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        name,
+                        self.source,
+                        self.num_segments,
+                        self.num_chars,
+                        self.num_tokens,
+                        self._digest.hexdigest(),
+                        time.time(),
+                    ),
+                )
+        except BaseException:
+            self._discard()
+            raise
+        self._rows = []
+        return StoredCard(self.store, name, num_segments=self.num_segments)
+
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._discard()
+
+    def _discard(self):
+        self._rows = []
+        if self._flushed:
+            conn = self.store._connect()
+            with _transaction(conn):
+                conn.execute("DELETE FROM segments WHERE card = ?", (self._staging,))
+
+    def __enter__(self) -> ChunkStoreWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.abort()
+
+
+class StoredCard(KnowledgeCard):
+    """ChunkStore 中的卡片句柄，读取时才查询分片"""
+
+    __slots__ = ("store", "name")
+
+    def __init__(self, store: ChunkStore, name: str, *, num_segments: int | None = None):
+        self.store = store
+        self.name = name
+        self.path = None
+        self.num_segments = num_segments
+        self._text = None
+
+    def read(self) -> str:
+        return SEPARATOR.join(segment.content for segment in self.store.iter_segments(self.name))
+
+    def __repr__(self) -> str:
+        return f"StoredCard(store={str(self.store.path)!r}, name={self.name!r}, num_segments={self.num_segments})"
+
+    @property
+    def nbytes(self) -> int:
+        row = (
+            self.store._connect()
+            .execute("SELECT COUNT(*), SUM(LENGTH(CAST(content AS BLOB))) FROM segments WHERE card = ?", (self.name,))
+            .fetchone()
+        )
+        count, nbytes = row[0], row[1] or 0
+        return nbytes + max(count - 1, 0) * len(SEPARATOR.encode("utf8"))
+
+    def iter_segments(self, separator: str = SEPARATOR, *, block_size: int = 1 << 20) -> Iterator[str]:
+        for segment in self.store.iter_segments(self.name):
+            yield segment.content
+
+    def segments(self) -> Iterator[StoredSegment]:
+        """带 token 数、元数据与内容哈希的分片"""
+        return self.store.iter_segments(self.name)
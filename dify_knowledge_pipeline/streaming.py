@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import contextvars
+import queue
+import threading
+import time
+from typing import Iterable, Iterator, TypeVar
+
+from dify_knowledge_pipeline.metrics import Metrics, current_metrics
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _ProducerError:
+    def __init__(self, err: BaseException):
+        self.err = err
+
+
+def buffered(
+    iterable: Iterable[T], *, maxsize: int = 64, name: str = "producer", metrics: Metrics | None = None
+) -> Iterator[T]:
+    """
+    在后台线程中消费 iterable，经由有界队列交给调用方
+
+    生产（分片）与消费（上传）同时进行，队列写满时生产方阻塞，内存中最多保留 maxsize 个元素。
+    生产方抛出的异常在消费到该位置时重新抛出；调用方提前退出时生产方随之停止。
+
+    Args:
+        iterable: 通常是 fork_*_to_chunks 返回的 (table_name, knowledge_card) 生成器
+        maxsize: 队列容量
+        name: 后台线程名称
+        metrics: 记录消费方等待生产方的耗时（stream.wait_producer）
+
+    Returns:
+
+    """
+    q: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        it = iter(iterable)
+        try:
+            for item in it:
+                if not put(item):
+                    return
+        except BaseException as err:
+            put(_ProducerError(err))
+        else:
+            put(_DONE)
+        finally:
+            # 在生产线程中关闭生成器，触发其 finally（例如保存分片清单、关闭进程池）
+            if close := getattr(it, "close", None):
+                close()
+
+    metrics = metrics or current_metrics()
+    # 生产线程继承当前上下文，分片函数可以读取 use_metrics 设置的 Metrics
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(produce,), name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            start = time.perf_counter()
+            item = q.get()
+            metrics.observe("stream.wait_producer", time.perf_counter() - start)
+            if item is _DONE:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.err
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+
+import tiktoken
+
+
+class TokenCounter:
+    """
+    基于单个 tiktoken encoding 的计数器
+
+    - 每段文本只编码一次，计数结果由调用方沿着分片、校验流程传递
+    - 固定的包装模板（mdx schema、ts_block 等）开销只计算一次并缓存
+    - 使用 encode_ordinary，文本中出现 `<|endoftext|>` 之类的特殊 token 时按普通文本计数，不会抛出异常
+    """
+
+    def __init__(self, encoding: tiktoken.Encoding, *, overhead_cache_size: int = 1024):
+        self.encoding = encoding
+        self._overhead_cache: OrderedDict[str, int] = OrderedDict()
+        self._overhead_cache_size = overhead_cache_size
+
+    @classmethod
+    def from_encoding_name(cls, encoding_name: str = "gpt2") -> TokenCounter:
+        return cls(tiktoken.get_encoding(encoding_name))
+
+    def encode(self, text: str) -> list[int]:
+        return self.encoding.encode_ordinary(text)
+
+    def count(self, text: str, *, limit: int | None = None) -> int:
+        """
+        统计 text 的 token 数量
+
+        Args:
+            text:
+            limit: 只关心结果是否小于 limit 时传入。
+                byte-level BPE 的 token 数不会超过 utf8 字节数，字节数小于 limit 时仍返回精确值；
+                文本过长时仅编码足以越过 limit 的前缀，返回值 >= limit 但不是精确值。
+
+        Returns:
+
+        """
+        if not text:
+            return 0
+        if limit is None:
+            return len(self.encode(text))
+
+        # 每个 token 至少占用一个字节，每个字符最多占用 4 个字节
+        if len(text) * 4 < limit or len(text.encode("utf8")) < limit:
+            return len(self.encode(text))
+
+        # 从换行处截断前缀，越过 limit 即可停止编码。截断边界附近的 token 可能与整段编码不同，预留余量
+        margin = 8
+        window = (limit + margin) * 8
+        if len(text) > window * 2 and (cut := text.rfind("\n", 0, window)) > 0:
+            if (num_tokens := len(self.encode(text[:cut]))) >= limit + margin:
+                return num_tokens
+
+        return len(self.encode(text))
+
+    def overhead(self, template: str) -> int:
+        """
+        包装模板（填充空内容后的文本）的 token 开销，相同模板只编码一次
+
+        Args:
+            template: 例如 content 为空的 schema json，或 code 为空的 ts_block
+
+        Returns:
+
+        """
+        if (num_tokens := self._overhead_cache.get(template)) is not None:
+            self._overhead_cache.move_to_end(template)
+            return num_tokens
+
+        num_tokens = len(self.encode(template))
+        self._overhead_cache[template] = num_tokens
+        if len(self._overhead_cache) > self._overhead_cache_size:
+            self._overhead_cache.popitem(last=False)
+        return num_tokens
+
+
+class TokenWindowSplitter:
+    """
+    直接在 token 边界上切分文本
+
+    整段文本只编码一次，按 chunk_size 的窗口与 chunk_overlap 的重叠滑动切分 token 序列再解码。
+    窗口边界落在多字节字符中间时向前回退，保证每个分片都是合法的 utf8 文本。
+    """
+
+    def __init__(self, counter: TokenCounter, *, chunk_size: int, chunk_overlap: int = 0):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap must be in [0, {chunk_size}), got {chunk_overlap}")
+
+        self.counter = counter
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split_text(self, text: str) -> list[str]:
+        return [chunk for chunk, _ in self.split_text_with_counts(text)]
+
+    def split_text_with_counts(self, text: str) -> list[tuple[str, int]]:
+        """
+        Returns: [(chunk, num_tokens), ...] num_tokens 为分片在原文中占用的 token 数
+        """
+        tokens = self.counter.encode(text)
+        decode_bytes = self.counter.encoding.decode_bytes
+
+        chunks = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + self.chunk_size, len(tokens))
+            # 单个字符最多被拆成 4 个字节级 token
+            for cut in range(end, max(start, end - 4), -1):
+                try:
+                    chunk = decode_bytes(tokens[start:cut]).decode("utf8")
+                except UnicodeDecodeError:
+                    continue
+                end = cut
+                break
+            else:
+                chunk = decode_bytes(tokens[start:end]).decode("utf8", errors="replace")
+
+            chunks.append((chunk, end - start))
+            if end >= len(tokens):
+                break
+            start = self._align_start(tokens, max(end - self.chunk_overlap, start + 1), end)
+
+        return chunks
+
+    def _align_start(self, tokens: list[int], start: int, end: int) -> int:
+        # 重叠窗口的起点不能是 utf8 的后续字节（0b10xxxxxx）
+        decode_single = self.counter.encoding.decode_single_token_bytes
+        while start < end and (head := decode_single(tokens[start])) and head[0] & 0xC0 == 0x80:
+            start += 1
+        return start
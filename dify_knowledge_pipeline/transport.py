@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import FrozenSet
+
+import httpx
+from loguru import logger
+
+from dify_knowledge_pipeline.errors import DifyClientError
+from dify_knowledge_pipeline.metrics import Metrics, current_metrics
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class CircuitOpenError(httpx.TransportError):
+    """熔断器处于打开状态，请求未发出"""
+
+
+@dataclass
+class RetryPolicy:
+    """
+    重试策略
+
+    - 429/503 与 Dify 的 document_indexing、dataset_not_initialized 错误表示请求未被处理，任何方法都可以重试
+    - 502/504、读超时等错误发生时请求可能已被服务端处理，只重试幂等方法，避免 create_by_text 产生重复文档
+    - 连接阶段的错误（请求未发出）任何方法都可以重试
+    """
+
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    safe_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({429, 503}))
+    idempotent_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({500, 502, 504}))
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter: [0, min(backoff_max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def is_retryable_response(self, request: httpx.Request, response: httpx.Response) -> bool:
+        if response.status_code in self.safe_statuses:
+            return True
+        if response.status_code in self.idempotent_statuses:
+            return request.method in IDEMPOTENT_METHODS
+        if response.status_code == 400:
+            return (error := dify_error(response)) is not None and error.retryable
+        return False
+
+    def is_retryable_exception(self, request: httpx.Request, err: Exception) -> bool:
+        if isinstance(err, CircuitOpenError):
+            return False
+        if isinstance(err, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        if isinstance(err, httpx.TransportError):
+            return request.method in IDEMPOTENT_METHODS
+        return False
+
+
+def dify_error(response: httpx.Response) -> DifyClientError | None:
+    """从已读取的错误响应体 {"code": ..., "message": ..., "status": ...} 中解析 Dify 错误码"""
+    try:
+        body = json.loads(response.content)
+    except (ValueError, httpx.ResponseNotRead):
+        return
+    if isinstance(body, dict):
+        return DifyClientError.from_code(body.get("code"))
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    if not (value := response.headers.get("Retry-After")):
+        return
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return
+
+
+class TokenBucket:
+    """
+    客户端令牌桶限流，rate 为每秒补充的令牌数，capacity 为允许的突发量
+
+    reserve 立即扣减令牌并返回需要等待的秒数，同步与异步调用方各自负责等待
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        if (wait := self.reserve(tokens)) > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    连续 failure_threshold 次服务端故障（5xx、网络错误）后打开熔断器，
+    recovery_timeout 秒内的请求直接失败；之后放行一个探测请求，成功则关闭熔断器
+    """
+
+    def __init__(self, failure_threshold: int = 10, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return "half_open"
+        return "open"
+
+    def before_request(self, request: httpx.Request):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._probing):
+                raise CircuitOpenError(f"circuit breaker is open - {request.method} {request.url}", request=request)
+            if state == "half_open":
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Dify 服务连续失败，熔断 {self.recovery_timeout}s - failures={self._failures}")
+                self._opened_at = time.monotonic()
+
+
+class _RetryController:
+    """DifyRetryTransport 与 AsyncDifyRetryTransport 共用的重试、限流与熔断决策"""
+
+    def __init__(
+        self,
+        *,
+        retry: RetryPolicy | None = None,
+        rate_limit: float | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        metrics: Metrics | None = None,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.metrics = metrics or current_metrics()
+
+        self.retries = 0
+        self._stats_lock = threading.Lock()
+
+    def _before_request(self, request: httpx.Request) -> float:
+        """Returns: 限流需要等待的秒数"""
+        self.circuit_breaker.before_request(request)
+        self.metrics.incr("http.requests")
+        wait = self.limiter.reserve() if self.limiter else 0.0
+        if wait > 0:
+            self.metrics.observe("http.rate_limit_wait", wait)
+        return wait
+
+    def _on_error(self, request: httpx.Request, err: httpx.TransportError, attempt: int) -> float | None:
+        """Returns: 重试前需要等待的秒数，None 表示不再重试"""
+        self.circuit_breaker.record_failure()
+        self.metrics.incr("http.errors")
+        if attempt >= self.retry.max_retries or not self.retry.is_retryable_exception(request, err):
+            return
+        delay = self.retry.backoff(attempt)
+        logger.debug(f"请求失败，{delay:.2f}s 后重试 - {request.method} {request.url} {err=}")
+        self._count_retry()
+        return delay
+
+    def _on_response(self, request: httpx.Request, response: httpx.Response, attempt: int) -> float | None:
+        """Returns: 重试前需要等待的秒数，None 表示直接返回响应"""
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        if response.status_code >= 400:
+            self.metrics.incr(f"http.status_{response.status_code}")
+
+        if attempt >= self.retry.max_retries or not self.retry.is_retryable_response(request, response):
+            return
+
+        delay = retry_after(response)
+        delay = self.retry.backoff(attempt) if delay is None else min(delay, self.retry.backoff_max)
+        logger.debug(f"请求失败，{delay:.2f}s 后重试 - {request.method} {request.url} {response.status_code}")
+        self._count_retry()
+        return delay
+
+    def _count_retry(self):
+        with self._stats_lock:
+            self.retries += 1
+        self.metrics.incr("http.retries")
+
+
+class DifyRetryTransport(_RetryController, httpx.BaseTransport):
+    """
+    为 Dify API 调用提供重试、退避、限流与熔断的 httpx transport
+
+    ```python
+    transport = DifyRetryTransport(httpx.HTTPTransport(limits=limits), rate_limit=20)
+    client = httpx.Client(base_url=base_url, transport=transport)
+    ```
+    """
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport | None = None,
+        *,
+        retry: RetryPolicy | None = None,
+        rate_limit: float | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        metrics: Metrics | None = None,
+    ):
+        """
+        Args:
+            transport: 实际发送请求的 transport，默认 httpx.HTTPTransport()
+            retry: 重试策略，默认 RetryPolicy()
+            rate_limit: 每秒最多发出的请求数（包含重试），None 表示不限流
+            circuit_breaker: 熔断器，默认 CircuitBreaker()
+            metrics: 记录请求数、重试次数、状态码与单次请求耗时（http.request）
+        """
+        super().__init__(retry=retry, rate_limit=rate_limit, circuit_breaker=circuit_breaker, metrics=metrics)
+        self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            if (wait := self._before_request(request)) > 0:
+                time.sleep(wait)
+
+            try:
+                with self.metrics.timer("http.request"):
+                    response = self._transport.handle_request(request)
+            except httpx.TransportError as err:
+                if (delay := self._on_error(request, err, attempt)) is None:
+                    raise
+            else:
+                if response.status_code == 400:
+                    response.read()
+                if (delay := self._on_response(request, response, attempt)) is None:
+                    return response
+                response.close()
+
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncDifyRetryTransport(_RetryController, httpx.AsyncBaseTransport):
+    """DifyRetryTransport 的 asyncio 版本，等待不会阻塞事件循环"""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None = None,
+        *,
+        retry: RetryPolicy | None = None,
+        rate_limit: float | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        metrics: Metrics | None = None,
+    ):
+        super().__init__(retry=retry, rate_limit=rate_limit, circuit_breaker=circuit_breaker, metrics=metrics)
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            if (wait := self._before_request(request)) > 0:
+                await asyncio.sleep(wait)
+
+            try:
+                with self.metrics.timer("http.request"):
+                    response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as err:
+                if (delay := self._on_error(request, err, attempt)) is None:
+                    raise
+            else:
+                if response.status_code == 400:
+                    await response.aread()
+                if (delay := self._on_response(request, response, attempt)) is None:
+                    return response
+                await response.aclose()
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+import tiktoken
+from fake_dify import FakeDify
+
+from dify_knowledge_pipeline.datasets import DatasetCache
+from dify_knowledge_pipeline.fire_drop import DifyFireDrop
+from dify_knowledge_pipeline.tokens import TokenCounter
+
+
+@pytest.fixture(scope="session")
+def byte_counter() -> TokenCounter:
+    # 每个字节一个 token 的编码，多字节字符必然横跨多个 token，不依赖下载 BPE 词表
+    encoding = tiktoken.Encoding(
+        name="bytes", pat_str=r"[\s\S]+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={}
+    )
+    return TokenCounter(encoding)
+
+
+@pytest.fixture
+def fake_dify() -> FakeDify:
+    return FakeDify()
+
+
+@pytest.fixture
+def make_drop(tmp_path, fake_dify):
+    """构造连接 FakeDify（或指定 transport）的 DifyFireDrop，同步状态写入临时目录"""
+    dataset_cache = DatasetCache()
+
+    def factory(*, transport: httpx.BaseTransport | None = None, **kwargs) -> DifyFireDrop:
+        options = {
+            "api_key": "fake",
+            "transport": transport or fake_dify.transport(),
+            "state_path": tmp_path / "sync_state.json",
+            "journal_dir": tmp_path / "runs",
+            # 每个测试独立的缓存，避免复用其他测试中 FakeDify 的 dataset_id
+            "dataset_cache": dataset_cache,
+            **kwargs,
+        }
+        return DifyFireDrop(**options)
+
+    return factory
@@ -0,0 +1,185 @@
+"""
+进程内的 Dify 知识库 API 模拟，通过 transport 参数注入，不经过网络；测试与 benchmarks 共用
+
+```python
+fake = FakeDify(latency=0.05, error_rate=0.01)
+drop = DifyFireDrop(api_key="fake", transport=fake.transport())
+```
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List
+
+import httpx
+
+SEPARATOR = "\n\n------------\n\n"
+
+
+class FakeDify:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        indexing_polls: int = 0,
+        seed: int | None = 0,
+    ):
+        """
+        Args:
+            latency: 每个请求的固定延迟（秒）
+            jitter: 在 latency 上叠加 [0, jitter) 的随机延迟
+            error_rate: 返回 error_status 的概率
+            error_status: 注入的错误状态码，默认 503（可重试）
+            indexing_polls: 批次需要被查询多少次才会嵌入完成
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.indexing_polls = indexing_polls
+        self.rng = random.Random(seed)
+
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self.documents: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.segments: Dict[str, List[Dict[str, Any]]] = {}
+        self.polls: Counter = Counter()
+        self.requests: Counter = Counter()
+        self.embedded_segments = 0
+        self._lock = threading.Lock()
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    @staticmethod
+    def _page(items: List[Dict[str, Any]], params) -> Dict[str, Any]:
+        page = int(params.get("page") or 1)
+        limit = int(params.get("limit") or 20)
+        data = items[(page - 1) * limit : page * limit]
+        return {"data": data, "has_more": page * limit < len(items), "limit": limit, "total": len(items), "page": page}
+
+    def _embed(self, document: Dict[str, Any], text: str):
+        parts = [p.strip() for p in text.split(SEPARATOR) if p.strip()]
+        self.segments[document["id"]] = [
+            {"id": str(uuid.uuid4()), "position": i + 1, "content": p} for i, p in enumerate(parts)
+        ]
+        self.embedded_segments += len(parts)
+        document["indexing_status"] = "completed" if not self.indexing_polls else "indexing"
+        document["segments"] = len(parts)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.rng.random() * self.jitter)
+
+        path = request.url.path.split("/v1", 1)[-1]
+        method = request.method
+        params = request.url.params
+        with self._lock:
+            self.requests[method] += 1
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return httpx.Response(self.error_status, json={"code": "service_unavailable", "message": "injected"})
+            body = json.loads(request.content) if request.content else {}
+            return self._route(method, path, params, body)
+
+    def _route(self, method: str, path: str, params, body: Dict[str, Any]) -> httpx.Response:
+        if path == "/datasets":
+            if method == "GET":
+                items = [{"id": k, "name": v["name"]} for k, v in self.datasets.items()]
+                return httpx.Response(200, json=self._page(items, params))
+            dataset_id = str(uuid.uuid4())
+            self.datasets[dataset_id] = {"id": dataset_id, "name": body["name"]}
+            self.documents[dataset_id] = {}
+            return httpx.Response(200, json=self.datasets[dataset_id])
+
+        if m := re.fullmatch(r"/datasets/([^/]+)", path):
+            if self.datasets.pop(m[1], None) is None:
+                return httpx.Response(404, json={"code": "not_found"})
+            self.documents.pop(m[1], None)
+            return httpx.Response(204)
+
+        if not (m := re.match(r"/datasets/([^/]+)/", path)) or m[1] not in self.documents:
+            return httpx.Response(404, json={"code": "not_found", "message": path})
+        documents = self.documents[m[1]]
+
+        if re.fullmatch(r"/datasets/[^/]+/documents", path):
+            keyword = params.get("keyword") or ""
+            items = [
+                {k: v for k, v in d.items() if k != "segments"} for d in documents.values() if keyword in d["name"]
+            ]
+            return httpx.Response(200, json=self._page(items, params))
+
+        if re.fullmatch(r"/datasets/[^/]+/document/create_by_text", path):
+            document_id = str(uuid.uuid4())
+            document = {"id": document_id, "name": f"{body['name']}.txt", "created_at": int(time.time())}
+            self._embed(document, body["text"])
+            documents[document_id] = document
+            return httpx.Response(200, json={"document": document, "batch": document_id})
+
+        if m := re.fullmatch(r"/datasets/[^/]+/documents/([^/]+)/update_by_text", path):
+            if (document := documents.get(m[1])) is None:
+                return httpx.Response(404, json={"code": "not_found"})
+            self._embed(document, body["text"])
+            return httpx.Response(200, json={"document": document, "batch": m[1]})
+
+        if m := re.fullmatch(r"/datasets/[^/]+/documents/([^/]+)/indexing-status", path):
+            if (document := documents.get(m[1])) is None:
+                return httpx.Response(404, json={"code": "not_found"})
+            self.polls[m[1]] += 1
+            if self.polls[m[1]] >= self.indexing_polls:
+                document["indexing_status"] = "completed"
+            total = document.get("segments", 0)
+            completed = (
+                total
+                if document["indexing_status"] == "completed"
+                else total * self.polls[m[1]] // max(1, self.indexing_polls)
+            )
+            data = [
+                {
+                    "id": m[1],
+                    "indexing_status": document["indexing_status"],
+                    "completed_segments": completed,
+                    "total_segments": total,
+                }
+            ]
+            return httpx.Response(200, json={"data": data})
+
+        if m := re.fullmatch(r"/datasets/[^/]+/documents/([^/]+)/segments", path):
+            segments = self.segments.setdefault(m[1], [])
+            if method == "GET":
+                return httpx.Response(200, json=self._page(segments, params) | {"doc_form": "text_model"})
+            created = [
+                {"id": str(uuid.uuid4()), "position": len(segments) + i + 1, **segment}
+                for i, segment in enumerate(body["segments"])
+            ]
+            segments.extend(created)
+            self.embedded_segments += len(created)
+            return httpx.Response(200, json={"data": created, "doc_form": "text_model"})
+
+        if m := re.fullmatch(r"/datasets/[^/]+/documents/([^/]+)/segments/([^/]+)", path):
+            segments = self.segments.get(m[1], [])
+            if (segment := next((s for s in segments if s["id"] == m[2]), None)) is None:
+                return httpx.Response(404, json={"code": "not_found"})
+            if method == "DELETE":
+                segments.remove(segment)
+                return httpx.Response(200, json={"result": "success"})
+            segment.update({k: v for k, v in body["segment"].items() if k != "enabled"})
+            self.embedded_segments += 1
+            return httpx.Response(200, json={"data": segment})
+
+        if m := re.fullmatch(r"/datasets/[^/]+/documents/([^/]+)", path):
+            if method == "DELETE":
+                if documents.pop(m[1], None) is None:
+                    return httpx.Response(404, json={"code": "not_found"})
+                self.segments.pop(m[1], None)
+                return httpx.Response(200, json={"result": "success"})
+
+        return httpx.Response(404, json={"code": "not_found", "message": path})
@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+import pytest
+
+from dify_knowledge_pipeline.async_client import AsyncKnowledgeDatasetsClient
+from dify_knowledge_pipeline.transport import RetryPolicy
+
+
+def _client(transport: httpx.AsyncBaseTransport, **kwargs) -> AsyncKnowledgeDatasetsClient:
+    return AsyncKnowledgeDatasetsClient(api_key="fake", base_url="http://fake/v1", transport=transport, **kwargs)
+
+
+def test_concurrent_requests_share_one_client(fake_dify):
+    async def main():
+        async with _client(fake_dify.transport()) as client:
+            dataset_id = (await client.create_datasets("docs")).json()["id"]
+            client.dataset_id = dataset_id
+            responses = await asyncio.gather(
+                *[client.create_document_by_text(f"doc-{i:02d}", f"text {i}") for i in range(25)]
+            )
+            assert all(response.status_code == 200 for response in responses)
+            return [document["name"] async for document in client.iter_documents(limit=10)]
+
+    names = asyncio.run(main())
+    assert sorted(names) == [f"doc-{i:02d}.txt" for i in range(25)]
+
+
+def test_iter_datasets_follows_has_more(fake_dify):
+    async def main():
+        async with _client(fake_dify.transport()) as client:
+            for i in range(5):
+                await client.create_datasets(f"kb-{i}")
+            return [dataset["name"] async for dataset in client.iter_datasets(limit=2)]
+
+    assert asyncio.run(main()) == [f"kb-{i}" for i in range(5)]
+
+
+@pytest.mark.parametrize("method, expected_attempts", [("GET", 3), ("POST", 1)])
+def test_async_transport_retries_like_the_sync_one(method, expected_attempts):
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.method)
+        return httpx.Response(502)
+
+    async def main():
+        retry = RetryPolicy(max_retries=2, backoff_base=0)
+        async with _client(httpx.MockTransport(handler), retry=retry, dataset_id="d") as client:
+            if method == "GET":
+                return await client.list_documents()
+            return await client.create_document_by_text("a", "text")
+
+    assert asyncio.run(main()).status_code == 502
+    assert len(attempts) == expected_attempts
+
+
+def test_writes_require_a_dataset_id(fake_dify):
+    async def main():
+        async with _client(fake_dify.transport()) as client:
+            await client.create_document_by_text("a", "text")
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
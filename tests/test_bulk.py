@@ -0,0 +1,86 @@
+import json
+
+import httpx
+import pytest
+
+from dify_knowledge_pipeline.bulk import SegmentBulkWriter
+from dify_knowledge_pipeline.client import KnowledgeDatasetsClient
+from dify_knowledge_pipeline.models import Segment
+from dify_knowledge_pipeline.transport import RetryPolicy
+
+
+def _writer(handler, byte_counter, **kwargs) -> SegmentBulkWriter:
+    client = KnowledgeDatasetsClient(
+        api_key="fake",
+        base_url="http://fake/v1",
+        dataset_id="ds",
+        retry=RetryPolicy(max_retries=0),
+        transport=httpx.MockTransport(handler),
+    )
+    return SegmentBulkWriter(client, counter=byte_counter, show_progress=False, **kwargs)
+
+
+def _rejecting(bad: set[str], *, status_code: int = 400, code: str = "invalid_param"):
+    """批次中包含 bad 中的分段时以 status_code 拒绝整个请求，否则逐个返回分段 ID"""
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        contents = [segment["content"] for segment in json.loads(request.content)["segments"]]
+        sent.append(contents)
+        if bad & set(contents):
+            return httpx.Response(status_code, json={"code": code, "message": "rejected", "status": status_code})
+        return httpx.Response(200, json={"data": [{"id": f"id-{c}"} for c in contents]})
+
+    return handler, sent
+
+
+def test_pack_respects_segment_byte_and_token_budgets(byte_counter):
+    writer = _writer(_rejecting(set())[0], byte_counter, max_batch_segments=3, max_batch_tokens=10)
+    segments = [Segment(content=c) for c in ["aa", "bb", "cc", "dd", "eeeeeeeeeeee", "ff", "gggggg", "hhhhh"]]
+
+    batches = [batch.indexes for batch in writer.pack(segments)]
+
+    # 分段数达到 3 时换批；超出 token 预算的分段独占一个批次；累计 token 超出预算时换批
+    assert batches == [[0, 1, 2], [3], [4], [5, 6], [7]]
+
+    writer.max_batch_tokens, writer.max_batch_bytes = 1000, 60
+    assert all(batch.nbytes <= 60 for batch in writer.pack(segments))
+
+
+def test_write_preserves_input_order(byte_counter):
+    handler, sent = _rejecting(set())
+    writer = _writer(handler, byte_counter, max_batch_segments=2, max_concurrency=3)
+
+    report = writer.write("doc", (Segment(content=str(i)) for i in range(9)))
+
+    assert report.created == report.total == 9 and report.failed == 0
+    assert report.segment_ids == [f"id-{i}" for i in range(9)]
+    assert report.requests == len(sent) == 5
+
+
+@pytest.mark.parametrize("status_code, code", [(400, "invalid_param"), (413, "file_too_large")])
+def test_rejected_batch_is_bisected_to_the_bad_segment(byte_counter, status_code, code):
+    handler, sent = _rejecting({"3"}, status_code=status_code, code=code)
+    writer = _writer(handler, byte_counter, max_concurrency=1)
+
+    report = writer.write("doc", [Segment(content=str(i)) for i in range(8)])
+
+    assert report.created == 7 and report.failed == 1
+    assert [failure.index for failure in report.failures] == [3]
+    assert report.segment_ids[3] is None and report.segment_ids[4] == "id-4"
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1
+    assert report.requests == len(sent) == 7
+
+
+@pytest.mark.parametrize(
+    "status_code, code", [(401, "unauthorized"), (403, "forbidden"), (404, "not_found"), (400, "document_indexing")]
+)
+def test_errors_unrelated_to_segments_fail_the_whole_batch(byte_counter, status_code, code):
+    handler, sent = _rejecting({"3"}, status_code=status_code, code=code)
+    writer = _writer(handler, byte_counter, max_concurrency=1)
+
+    report = writer.write("doc", [Segment(content=str(i)) for i in range(8)])
+
+    assert report.created == 0 and report.failed == 8
+    assert report.requests == len(sent) == 1
+    assert all(str(status_code) in failure.error for failure in report.failures)
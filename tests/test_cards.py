@@ -0,0 +1,78 @@
+import pickle
+
+import pytest
+
+from dify_knowledge_pipeline.cards import SEPARATOR, CardWriter, KnowledgeCard
+
+
+def test_writer_commits_atomically(tmp_path):
+    with CardWriter(tmp_path) as writer:
+        writer.add("one")
+        writer.add("two")
+        # 提交前只有临时文件，不会出现写了一半的卡片
+        assert not (tmp_path / "card.txt").exists()
+        card = writer.commit("card.txt")
+
+    assert (tmp_path / "card.txt").read_text(encoding="utf8") == f"one{SEPARATOR}two"
+    assert [p.name for p in tmp_path.iterdir()] == ["card.txt"]
+    assert card.num_segments == 2 and writer.num_chars == len(str(card))
+    with pytest.raises(RuntimeError):
+        writer.add("three")
+
+
+def test_writer_removes_temp_file_without_commit(tmp_path):
+    with pytest.raises(ValueError):
+        with CardWriter(tmp_path) as writer:
+            writer.add("partial")
+            raise ValueError("chunker failed")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_writer_without_fdr_out_keeps_text_in_memory(tmp_path):
+    with CardWriter(None) as writer:
+        writer.add("a")
+        writer.add("b")
+        card = writer.commit("ignored.txt")
+
+    assert card.path is None and str(card) == f"a{SEPARATOR}b"
+    assert card.nbytes == len(f"a{SEPARATOR}b".encode("utf8"))
+
+
+def test_card_pickles_only_the_path(tmp_path):
+    fp = tmp_path / "card.txt"
+    fp.write_text("x" * 100_000, encoding="utf8")
+    card = KnowledgeCard(fp, num_segments=1)
+
+    assert len(pickle.dumps(card)) < 1000
+    assert str(pickle.loads(pickle.dumps(card))) == "x" * 100_000
+    assert card.nbytes == 100_000
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 1 << 20])
+def test_iter_segments_across_block_boundaries(tmp_path, block_size):
+    segments = ["第一段", "", "second 段落", "🥂" * 5]
+    fp = tmp_path / "card.txt"
+    fp.write_text(SEPARATOR.join(segments), encoding="utf8")
+
+    assert list(KnowledgeCard(fp).iter_segments(block_size=block_size)) == segments
+    assert list(KnowledgeCard(text=SEPARATOR.join(segments)).iter_segments()) == segments
+
+
+def test_card_requires_exactly_one_source(tmp_path):
+    with pytest.raises(ValueError):
+        KnowledgeCard()
+    with pytest.raises(ValueError):
+        KnowledgeCard(tmp_path / "card.txt", text="card")
+
+
+def test_fire_drop_uploads_card_handles(make_drop, fake_dify, tmp_path):
+    with CardWriter(tmp_path) as writer:
+        writer.add("segment")
+        card = writer.commit("doc.txt")
+
+    report = make_drop().embed_knowledge({"doc": card}, db_name="docs")
+
+    assert report.created == 1
+    (segments,) = fake_dify.segments.values()
+    assert [s["content"] for s in segments] == ["segment"]
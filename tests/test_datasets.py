@@ -0,0 +1,77 @@
+import threading
+import time
+
+import httpx
+
+from dify_knowledge_pipeline.datasets import DatasetCache, dataset_cache_key
+
+
+def test_entries_expire_after_ttl():
+    cache = DatasetCache(ttl=60)
+    cache.set("key", "ds-1")
+    assert cache.get("key") == "ds-1"
+
+    cache._entries["key"] = ("ds-1", time.time() - 61)
+    assert cache.get("key") is None
+
+
+def test_cache_persists_to_disk(tmp_path):
+    path = tmp_path / "datasets.json"
+    DatasetCache(path=path).set("key", "ds-1")
+    assert DatasetCache(path=path).get("key") == "ds-1"
+
+    DatasetCache(path=path).invalidate("key")
+    assert DatasetCache(path=path).get("key") is None
+
+    path.write_text("{not json", encoding="utf8")
+    assert DatasetCache(path=path).get("key") is None
+
+
+def test_key_separates_instances_and_hides_api_key():
+    key = dataset_cache_key("http://dify/v1/", "secret", "docs")
+    assert "secret" not in key
+    assert key == dataset_cache_key("http://dify/v1", "secret", "docs")
+    assert key != dataset_cache_key("http://dify/v1", "other", "docs")
+
+
+def test_concurrent_resolution_creates_the_dataset_once(make_drop, fake_dify):
+    drop = make_drop()
+    barrier = threading.Barrier(8)
+    resolved = []
+
+    def resolve():
+        barrier.wait()
+        resolved.append(drop._hook_knowledge_dataset("docs"))
+
+    threads = [threading.Thread(target=resolve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(resolved)) == 1 and len(fake_dify.datasets) == 1
+    assert fake_dify.requests["POST"] == 1
+
+
+def test_deleted_dataset_invalidates_the_cache(make_drop, fake_dify):
+    drop = make_drop()
+    first = drop.embed_knowledge({"doc": "text"}, db_name="docs").dataset_id
+
+    # 知识库在其他地方被删除后，缓存的 dataset_id 返回 404
+    drop._client.delete(f"/datasets/{first}")
+    report = drop.embed_knowledge({"doc": "text"}, db_name="docs")
+
+    assert report.created == 1
+    assert report.dataset_id != first and list(fake_dify.datasets) == [report.dataset_id]
+
+
+def test_resolution_skips_listing_when_cached(make_drop, fake_dify):
+    make_drop().embed_knowledge({"doc": "text"}, db_name="docs")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path != "/v1/datasets", "dataset id should come from the cache"
+        return fake_dify.handle(request)
+
+    report = make_drop(transport=httpx.MockTransport(handler)).embed_knowledge({"doc": "text 2"}, db_name="docs")
+    assert report.updated == 1
+    assert report.dataset_id in fake_dify.datasets
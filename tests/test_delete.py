@@ -0,0 +1,71 @@
+from collections import Counter
+
+import httpx
+
+from dify_knowledge_pipeline.transport import RetryPolicy
+
+
+def _seed(make_drop, n: int):
+    drop = make_drop()
+    drop.embed_knowledge({f"doc-{i}": f"text {i}" for i in range(n)}, db_name="docs")
+    return drop
+
+
+def _deleting(fake_dify, respond):
+    """respond(document_name, attempt) 返回 None 时交给 FakeDify 处理，否则直接作为删除请求的响应"""
+    attempts = Counter()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "DELETE" and "/documents/" in request.url.path:
+            document_id = request.url.path.rsplit("/", 1)[-1]
+            (name,) = [
+                d["name"] for docs in fake_dify.documents.values() for d in docs.values() if d["id"] == document_id
+            ]
+            attempts[name] += 1
+            if (response := respond(name, attempts[name])) is not None:
+                return response
+        return fake_dify.handle(request)
+
+    return handler, attempts
+
+
+def test_delete_all_document_concurrently(make_drop, fake_dify):
+    _seed(make_drop, 25)
+    drop = make_drop(max_concurrency=4)
+
+    report = drop.delete_all_document(db_name="docs")
+
+    assert report.total == report.deleted == 25 and report.failed == 0
+    (documents,) = fake_dify.documents.values()
+    assert documents == {}
+    assert not drop.state.is_unchanged(report.dataset_id, "doc-0", drop._card_digest("text 0"))
+
+
+def test_missing_document_counts_as_deleted(make_drop, fake_dify):
+    _seed(make_drop, 3)
+    handler, _ = _deleting(fake_dify, lambda name, attempt: httpx.Response(404) if name == "doc-1.txt" else None)
+
+    report = make_drop(transport=httpx.MockTransport(handler)).delete_all_document(db_name="docs")
+
+    assert report.deleted == 3 and report.failed == 0
+
+
+def test_transient_failures_are_retried_in_rounds(make_drop, fake_dify):
+    _seed(make_drop, 4)
+
+    def respond(name, attempt):
+        if name == "doc-0.txt" and attempt == 1:
+            return httpx.Response(503)
+        if name == "doc-1.txt":
+            return httpx.Response(403, json={"code": "forbidden"})
+
+    handler, attempts = _deleting(fake_dify, respond)
+    drop = make_drop(transport=httpx.MockTransport(handler), retry=RetryPolicy(max_retries=0), max_concurrency=2)
+
+    report = drop.delete_all_document(db_name="docs", retry_rounds=2)
+
+    assert report.deleted == 3 and report.failed == 1
+    (failed,) = report.errors
+    assert failed.table_name == "doc-1"
+    # 503 在下一轮重试成功；403 不会重试
+    assert attempts["doc-0.txt"] == 2 and attempts["doc-1.txt"] == 1
@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+
+def test_uploads_are_bounded_by_max_concurrency(make_drop, fake_dify):
+    lock = threading.Lock()
+    in_flight, peak = 0, 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        if not request.url.path.endswith("create_by_text"):
+            return fake_dify.handle(request)
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        return fake_dify.handle(request)
+
+    drop = make_drop(transport=httpx.MockTransport(handler), max_concurrency=4)
+    report = drop.embed_knowledge({f"doc-{i}": f"text {i}" for i in range(16)}, db_name="docs")
+
+    assert report.created == 16
+    assert 1 < peak <= 4
+    assert sorted(result.table_name for result in report.results) == sorted(f"doc-{i}" for i in range(16))
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+@pytest.mark.parametrize(
+    "response", [httpx.Response(500, json={"code": "internal"}), httpx.Response(200, json={"unexpected": True})]
+)
+def test_one_failed_document_does_not_abort_the_batch(make_drop, fake_dify, max_concurrency, response):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("create_by_text") and json.loads(request.content)["name"] == "bad":
+            return response
+        return fake_dify.handle(request)
+
+    drop = make_drop(transport=httpx.MockTransport(handler), max_concurrency=max_concurrency)
+    report = drop.embed_knowledge({name: f"{name} text" for name in ("a", "b", "bad", "c")}, db_name="docs")
+
+    assert report.created == 3 and report.failed == 1
+    (failed,) = [result for result in report.results if result.action == "failed"]
+    assert failed.table_name == "bad" and failed.error
+
+
+def test_differential_sync_rewrites_changed_segments_only(make_drop, fake_dify):
+    drop = make_drop()
+    sep = drop.my_separator
+    drop.embed_knowledge({"doc": sep.join(["one", "two", "three"])}, db_name="docs")
+    embedded = fake_dify.embedded_segments
+
+    report = drop.embed_knowledge({"doc": sep.join(["one", "TWO", "three", "four"])}, db_name="docs", differential=True)
+
+    (result,) = report.results
+    assert result.action == "updated"
+    assert result.segments == {"unchanged": 2, "updated": 1, "created": 1, "deleted": 0}
+    assert fake_dify.embedded_segments - embedded == 2
+    (segments,) = fake_dify.segments.values()
+    assert [s["content"] for s in sorted(segments, key=lambda s: s["position"])] == ["one", "TWO", "three", "four"]
+
+    report = drop.embed_knowledge({"doc": sep.join(["one", "TWO", "three", "four"])}, db_name="docs", differential=True)
+    assert report.results[0].action == "skipped"
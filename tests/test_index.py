@@ -0,0 +1,42 @@
+from dify_knowledge_pipeline.index import DocumentIndex
+
+
+def test_index_resolves_names_and_keeps_first_duplicate():
+    index = DocumentIndex(
+        [
+            {"id": "1", "name": "a.txt", "created_at": 1, "indexing_status": "completed", "tokens": 10},
+            {"id": "2", "name": "a.txt", "created_at": 2},
+            {"id": "3", "name": "b.txt.txt"},
+        ]
+    )
+    assert index.get_id("a") == "1"
+    assert index.get("a") == {"id": "1", "name": "a.txt", "created_at": 1, "indexing_status": "completed"}
+    # 只去掉末尾的 .txt
+    assert index.get_id("b.txt") == "3"
+    assert DocumentIndex.table_name("b.txt.txt") == "b.txt"
+    assert "missing" not in index and index.get_id("missing") is None
+    assert len(index) == 2
+
+
+def test_index_tracks_local_writes():
+    index = DocumentIndex()
+    index.add({"id": "1", "name": index.document_name("a")})
+    assert "a" in index and index.get_id("a") == "1"
+
+    index.add({"id": "2", "name": "a.txt"})
+    assert index.get_id("a") == "2"
+
+    index.remove("a")
+    assert "a" not in index and list(index) == []
+
+
+def test_sync_lists_documents_once(make_drop, fake_dify):
+    cards = {f"doc-{i}": f"text {i}" for i in range(5)}
+    drop = make_drop()
+    drop.embed_knowledge(cards, db_name="docs")
+
+    gets = fake_dify.requests["GET"]
+    report = drop.embed_knowledge(cards, db_name="docs")
+    assert report.updated == 5
+    # 知识库 id 已缓存，只有一次文档列表，与文档数量无关
+    assert fake_dify.requests["GET"] - gets == 1
@@ -0,0 +1,94 @@
+import httpx
+import pytest
+
+from dify_knowledge_pipeline.indexing import IndexingTracker
+
+
+def _tracker(fetch_status, **kwargs) -> IndexingTracker:
+    options = {"min_interval": 0.001, "max_interval": 0.01, "show_progress": False, **kwargs}
+    return IndexingTracker(fetch_status, **options)
+
+
+def _sequence(*responses):
+    """按顺序返回每次查询的结果，之后一直返回最后一个"""
+    calls = []
+
+    def fetch_status(dataset_id: str, batch: str):
+        calls.append(batch)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return fetch_status, calls
+
+
+def test_batch_completes_after_progress():
+    fetch_status, calls = _sequence(
+        [{"indexing_status": "indexing", "completed_segments": 1, "total_segments": 2}],
+        [{"indexing_status": "completed", "completed_segments": 2, "total_segments": 2}],
+    )
+    (status,) = _tracker(fetch_status).await_indexed([("d", "b")], timeout=5)
+    assert status.indexing_status == "completed"
+    assert status.completed_segments == status.total_segments == 2
+    assert status.polls == len(calls) == 2
+    assert status.finished_at is not None
+
+
+@pytest.mark.parametrize(
+    "documents, expected",
+    [
+        ([{"indexing_status": "completed"}, {"indexing_status": "error", "error": "boom"}], "error"),
+        ([{"indexing_status": "completed"}, {"indexing_status": "paused"}], "paused"),
+        ([{"indexing_status": "completed"}, {"indexing_status": "completed"}], "completed"),
+    ],
+)
+def test_batch_terminal_states(documents, expected):
+    (status,) = _tracker(lambda d, b: documents).await_indexed([("d", "b")], timeout=5)
+    assert status.indexing_status == expected
+    assert status.polls == 1
+    if expected == "error":
+        assert status.error == "boom"
+
+
+def test_empty_batch_is_an_error_not_a_hang():
+    (status,) = _tracker(lambda d, b: [], max_poll_errors=3).await_indexed([("d", "b")], timeout=5)
+    assert status.indexing_status == "error"
+    assert status.polls == 3
+    assert "no documents" in status.error
+
+
+def test_transient_poll_errors_reset_on_success():
+    fetch_status, _ = _sequence(httpx.ConnectError("x"), httpx.ConnectError("x"), [{"indexing_status": "completed"}])
+    (status,) = _tracker(fetch_status, max_poll_errors=3).await_indexed([("d", "b")], timeout=5)
+    assert status.indexing_status == "completed"
+    assert status.polls == 3
+
+
+def test_persistent_poll_errors_do_not_block_other_batches():
+    def fetch_status(dataset_id: str, batch: str):
+        if batch == "broken":
+            raise httpx.ConnectError("x")
+        return [{"indexing_status": "completed"}]
+
+    statuses = _tracker(fetch_status, max_poll_errors=2).await_indexed([("d", "broken"), ("d", "ok")], timeout=5)
+    assert [s.indexing_status for s in statuses] == ["error", "completed"]
+
+
+def test_timeout_marks_pending_batches():
+    statuses = _tracker(lambda d, b: [{"indexing_status": "indexing"}]).await_indexed([("d", "b")], timeout=0.05)
+    assert statuses[0].indexing_status == "timeout"
+
+
+def test_no_batches():
+    assert _tracker(lambda d, b: []).await_indexed([]) == []
+
+
+def test_await_indexed_against_fake_dify(make_drop, fake_dify):
+    fake_dify.indexing_polls = 3
+    drop = make_drop()
+    report = drop.embed_knowledge({"a": "alpha", "b": "beta"}, db_name="docs")
+
+    statuses = drop.await_indexed(report.dataset_id, report.batches, min_interval=0.001, show_progress=False)
+    assert [s.indexing_status for s in statuses] == ["completed", "completed"]
+    assert all(s.polls == 3 for s in statuses)
@@ -0,0 +1,133 @@
+import httpx
+import pytest
+from loguru import logger
+
+from dify_knowledge_pipeline.journal import RunJournal
+from dify_knowledge_pipeline.pipeline import KnowledgePipline
+
+
+def test_resume_skips_completed_documents(tmp_path):
+    with RunJournal.open(tmp_path, "run-1", db_name="docs") as journal:
+        journal.begin("a", digest="h1", action="sync", document_id=None)
+        journal.done("a", digest="h1", action="created", document_id="doc-a")
+        journal.begin("b", digest="h2", action="sync", document_id=None)
+
+    with RunJournal.open(tmp_path, "run-1", db_name="docs") as journal:
+        assert journal.completed("a", "h1")["document_id"] == "doc-a"
+        # 卡片内容变化后需要重新写入
+        assert journal.completed("a", "changed") is None
+        assert journal.completed("b", "h2") is None
+
+
+def test_adopt_only_interrupted_writes_that_took_effect(tmp_path):
+    with RunJournal.open(tmp_path, "run-1", db_name="docs") as journal:
+        journal.begin("new", digest="h1", action="sync", document_id=None)
+        journal.begin("old", digest="h2", action="sync", document_id="doc-old")
+
+    journal = RunJournal.open(tmp_path, "run-1", db_name="docs")
+    # 新建已经生效：知识库中出现了写入前不存在的文档
+    assert journal.adoptable("new", "h1", "doc-new")
+    assert not journal.adoptable("new", "h1", None)
+    assert not journal.adoptable("new", "changed", "doc-new")
+    # 同一个文档的更新无法从 id 判断是否生效，需要重新写入
+    assert not journal.adoptable("old", "h2", "doc-old")
+    # 删除后重建已经生效
+    assert journal.adoptable("old", "h2", "doc-recreated")
+    journal.close()
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    with RunJournal.open(tmp_path, "run-1", db_name="docs") as journal:
+        journal.done("a", digest="h1", action="created", document_id="doc-a")
+    with (tmp_path / "run-1.jsonl").open("a", encoding="utf8") as file:
+        file.write('{"op": "done", "table_name": "b"')
+
+    with RunJournal.open(tmp_path, "run-1", db_name="docs") as journal:
+        assert journal.completed("a", "h1")
+        assert journal.completed("b", "h1") is None
+
+
+def test_run_id_is_bound_to_db_name(tmp_path):
+    RunJournal.open(tmp_path, "run-1", db_name="docs").close()
+    with pytest.raises(ValueError):
+        RunJournal.open(tmp_path, "run-1", db_name="other")
+    with pytest.raises(ValueError):
+        RunJournal.open(tmp_path, "../escape", db_name="docs")
+
+
+class _Crash(BaseException):
+    """模拟进程退出，不会被逐文档的异常处理吞掉"""
+
+
+def test_embed_knowledge_resumes_without_duplicates(make_drop, fake_dify):
+    cards = {f"doc-{i:02d}": f"content {i}" for i in range(10)}
+    creates = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        response = fake_dify.handle(request)
+        if request.url.path.endswith("create_by_text"):
+            creates.append(request)
+            # 第 5 个文档已在服务端创建，但客户端在收到响应前退出
+            if len(creates) == 5:
+                raise _Crash
+        return response
+
+    with pytest.raises(_Crash):
+        make_drop(transport=httpx.MockTransport(handler)).embed_knowledge(cards, db_name="docs", run_id="nightly")
+
+    report = make_drop().embed_knowledge(cards, db_name="docs", run_id="nightly")
+    (documents,) = fake_dify.documents.values()
+    names = sorted(document["name"] for document in documents.values())
+    assert names == sorted(f"{name}.txt" for name in cards)
+    assert report.failed == 0
+    # 前 4 个已完成，第 5 个被采用，只新建剩余的 5 个
+    assert report.created == 5 and report.skipped == 5
+
+    # 已结束的运行再次执行时不发起写请求
+    writes = fake_dify.requests["POST"]
+    assert make_drop().embed_knowledge(cards, db_name="docs", run_id="nightly").skipped == len(cards)
+    assert fake_dify.requests["POST"] == writes
+
+
+def test_resume_restores_sync_state_lost_in_the_crash(make_drop, fake_dify, tmp_path):
+    cards = {f"doc-{i}": f"content {i}" for i in range(4)}
+    drop = make_drop()
+    with RunJournal.open(tmp_path / "runs", "nightly", db_name="docs") as journal:
+        # 运行日志已记录完成，但进程在保存同步状态之前被杀死
+        report = drop.embed_knowledge(cards, db_name="docs")
+        for result in report.results:
+            journal.done(
+                result.table_name,
+                digest=drop._card_digest(cards[result.table_name]),
+                action="created",
+                document_id=result.document_id,
+            )
+    (tmp_path / "sync_state.json").unlink()
+
+    resumed = make_drop()
+    assert resumed.embed_knowledge(cards, db_name="docs", run_id="nightly").skipped == len(cards)
+
+    writes = fake_dify.requests["POST"]
+    report = make_drop().embed_knowledge(cards, db_name="docs", skip_unchanged=True)
+    assert report.skipped == len(cards) and fake_dify.requests["POST"] == writes
+
+
+def test_plan_paths_warn_about_ignored_options(make_drop):
+    class Pipeline(KnowledgePipline):
+        def _invoke(self, **kwargs):
+            self._sync_to_dify({"doc": "content"})
+
+        def _create_fire_drop(self):
+            drop = make_drop()
+            # 只关心选项检查，不估算 token
+            drop.plan_sync = lambda *args, **kwargs: None
+            return drop
+
+    messages = []
+    sink = logger.add(messages.append, level="WARNING", format="{message}")
+    try:
+        Pipeline(db_name="docs", plan_only=True, run_id="nightly", differential_sync=True).invoke()
+    finally:
+        logger.remove(sink)
+
+    assert any("run_id" in m and "differential_sync" in m for m in messages)
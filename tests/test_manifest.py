@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from dify_knowledge_pipeline.manifest import ChunkManifest
+
+PARAMS = {"chunk_size": 600, "encoding_name": "gpt2"}
+
+
+@pytest.fixture
+def source(tmp_path):
+    fp = tmp_path / "docs" / "a.md"
+    fp.parent.mkdir()
+    fp.write_text("# A\ncontent", encoding="utf8")
+    return fp
+
+
+def _run(tmp_path, fp, params=PARAMS, *, table_name="docs_a.txt.v2"):
+    """模拟一次分片运行：未命中清单时写出卡片并记录"""
+    fdr_out = tmp_path / "out"
+    manifest = ChunkManifest.for_output(fdr_out, params)
+    entry = manifest.lookup(fp)
+    if entry is None:
+        fdr_out.mkdir(exist_ok=True)
+        (fdr_out / f"{table_name}.txt").write_text("card", encoding="utf8")
+        manifest.record(fp, table_name)
+    manifest.save(prune=True)
+    return entry, manifest
+
+
+def test_unchanged_source_hits_manifest(tmp_path, source):
+    assert _run(tmp_path, source)[0] is None
+    entry, manifest = _run(tmp_path, source)
+    # 名称中间出现 .txt 时卡片仍然能找到
+    assert entry["table_name"] == "docs_a.txt.v2"
+    assert str(manifest.load_card(entry)) == "card"
+    assert (tmp_path / "out.manifest.json").is_file()
+
+
+def test_touched_but_identical_source_hits_manifest(tmp_path, source):
+    _run(tmp_path, source)
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert _run(tmp_path, source)[0] is not None
+
+
+def test_changed_content_params_or_missing_card_misses(tmp_path, source):
+    _run(tmp_path, source)
+    source.write_text("# A\nchanged content", encoding="utf8")
+    assert _run(tmp_path, source)[0] is None
+
+    assert _run(tmp_path, source, {**PARAMS, "chunk_size": 300})[0] is None
+
+    _run(tmp_path, source)
+    (tmp_path / "out" / "docs_a.txt.v2.txt").unlink()
+    assert _run(tmp_path, source)[0] is None
+
+
+def test_source_without_card(tmp_path, source):
+    manifest = ChunkManifest.for_output(tmp_path / "out", PARAMS)
+    manifest.lookup(source)
+    manifest.record(source, None)
+    manifest.save()
+
+    entry = ChunkManifest.for_output(tmp_path / "out", PARAMS).lookup(source)
+    assert entry is not None and entry["card"] is None
+
+
+def test_prune_removes_deleted_sources(tmp_path, source):
+    other = source.with_name("b.md")
+    other.write_text("b", encoding="utf8")
+    manifest = ChunkManifest.for_output(tmp_path / "out", PARAMS)
+    for fp in (source, other):
+        manifest.lookup(fp)
+        manifest.record(fp, None)
+    manifest.save()
+
+    other.unlink()
+    manifest = ChunkManifest.for_output(tmp_path / "out", PARAMS)
+    manifest.lookup(source)
+    manifest.save(prune=True)
+    assert list(ChunkManifest.for_output(tmp_path / "out", PARAMS)._entries) == [str(source)]
+
+
+def test_corrupt_manifest_is_rebuilt(tmp_path, source):
+    (tmp_path / "out.manifest.json").write_text("{not json", encoding="utf8")
+    manifest = ChunkManifest.for_output(tmp_path / "out", PARAMS)
+    assert manifest.lookup(source) is None
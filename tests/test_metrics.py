@@ -0,0 +1,88 @@
+import json
+
+import httpx
+
+from dify_knowledge_pipeline.metrics import (
+    NULL_METRICS,
+    Histogram,
+    JsonlExporter,
+    Metrics,
+    current_metrics,
+    use_metrics,
+)
+
+
+def test_histogram_quantiles_are_bounded_by_max():
+    histogram = Histogram()
+    for value in [0.001] * 98 + [0.5, 2.0]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) <= 0.002
+    assert 0.5 <= histogram.quantile(0.99) <= 2.0
+    assert histogram.quantile(1.0) == histogram.max == 2.0
+
+
+def test_merge_snapshot_from_worker():
+    worker = Metrics()
+    worker.incr("chunk.files", 3)
+    worker.observe("chunk.split", 0.01)
+
+    main = Metrics()
+    main.incr("chunk.files")
+    main.merge(json.loads(json.dumps(worker.snapshot())))
+    main.merge(worker.snapshot())
+
+    report = main.report()
+    assert report.counters["chunk.files"] == 7
+    assert report.stages["chunk.split"].count == 2
+
+
+def test_use_metrics_is_scoped_and_default_is_noop():
+    assert current_metrics() is NULL_METRICS
+    NULL_METRICS.incr("ignored")
+    with NULL_METRICS.timer("ignored"):
+        pass
+    assert NULL_METRICS.report().counters == {}
+
+    metrics = Metrics()
+    with use_metrics(metrics):
+        assert current_metrics() is metrics
+    assert current_metrics() is NULL_METRICS
+
+
+def test_export_isolates_failing_exporters(tmp_path):
+    def broken(report):
+        raise RuntimeError("exporter down")
+
+    metrics = Metrics(exporters=[broken, JsonlExporter(tmp_path / "metrics.jsonl")])
+    metrics.incr("sync.created", 2)
+
+    report = metrics.export()
+    metrics.export()
+
+    lines = (tmp_path / "metrics.jsonl").read_text(encoding="utf8").splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["counters"] == report.counters == {"sync.created": 2}
+
+
+def test_fire_drop_records_sync_and_http_metrics(make_drop, fake_dify):
+    calls = 0
+
+    def flaky(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return fake_dify.handle(request)
+
+    metrics = Metrics()
+    drop = make_drop(transport=httpx.MockTransport(flaky), metrics=metrics)
+    drop.embed_knowledge({f"doc-{i}": f"text {i}" for i in range(3)}, db_name="docs")
+
+    report = metrics.report()
+    assert report.counters["sync.created"] == 3
+    assert report.counters["http.retries"] == 1
+    assert report.counters["http.status_429"] == 1
+    assert report.counters["http.requests"] == calls
+    assert report.stages["sync.document"].count == 3
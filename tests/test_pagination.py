@@ -0,0 +1,50 @@
+import pytest
+
+from dify_knowledge_pipeline.pagination import paginate
+
+
+def _pages(*pages):
+    calls = []
+
+    def fetch_page(page: int):
+        calls.append(page)
+        return pages[page - 1]
+
+    return fetch_page, calls
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_paginate_follows_has_more(prefetch):
+    fetch_page, calls = _pages(
+        {"data": [1, 2], "has_more": True}, {"data": [3], "has_more": True}, {"data": [4], "has_more": False}
+    )
+    assert list(paginate(fetch_page, prefetch=prefetch)) == [1, 2, 3, 4]
+    assert calls == [1, 2, 3]
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_paginate_stops_on_empty_page_with_has_more(prefetch):
+    # 服务端在最后一页仍返回 has_more=True 时不能无限翻页
+    fetch_page, calls = _pages({"data": [1], "has_more": True}, {"data": [], "has_more": True})
+    assert list(paginate(fetch_page, prefetch=prefetch)) == [1]
+    assert calls == [1, 2]
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_paginate_missing_fields(prefetch):
+    fetch_page, calls = _pages({"data": None})
+    assert list(paginate(fetch_page, prefetch=prefetch)) == []
+    assert calls == [1]
+
+
+def test_fire_drop_lists_past_the_first_page(make_drop, fake_dify):
+    drop = make_drop(page_size=7)
+    # 第 30 个知识库才是目标，超出第一页
+    for i in range(29):
+        drop._client.post("/datasets", json={"name": f"other-{i}"})
+    drop.embed_knowledge({f"doc-{i:02d}": f"text {i}" for i in range(23)}, db_name="docs")
+
+    assert len(fake_dify.datasets) == 30
+    documents = drop.list_documents(db_name="docs")
+    assert sorted(d["name"] for d in documents) == [f"doc-{i:02d}.txt" for i in range(23)]
+    assert drop.list_documents(db_name="docs", table_name="doc-07")[0]["name"] == "doc-07.txt"
@@ -0,0 +1,51 @@
+from dify_knowledge_pipeline.plan import PlannedDocument, SyncPlan
+
+
+def _plan(*documents: PlannedDocument) -> SyncPlan:
+    return SyncPlan(db_name="docs", dataset_id="d", documents=list(documents))
+
+
+def test_split_defers_documents_over_budget():
+    plan = _plan(
+        PlannedDocument(table_name="a", action="create", num_tokens=60, requests=1),
+        PlannedDocument(table_name="b", action="update", num_tokens=50, requests=1),
+        PlannedDocument(table_name="c", action="create", num_tokens=40, requests=1),
+    )
+    now, later = plan.split(max_tokens=100)
+    assert [d.table_name for d in now.documents] == ["a", "c"]
+    assert [d.table_name for d in later.documents] == ["b"]
+    assert now.num_tokens == 100
+    assert now.db_name == later.db_name == "docs"
+
+
+def test_split_always_includes_free_documents():
+    plan = _plan(
+        PlannedDocument(table_name="a", action="create", num_tokens=100),
+        PlannedDocument(table_name="b", action="create", num_tokens=10),
+        PlannedDocument(table_name="c", action="skip"),
+        PlannedDocument(table_name="d", action="delete", requests=1),
+    )
+    now, later = plan.split(max_tokens=100)
+    assert [d.table_name for d in now.documents] == ["a", "c", "d"]
+    assert [d.table_name for d in later.documents] == ["b"]
+
+
+def test_split_oversized_document_only_runs_alone():
+    big = PlannedDocument(table_name="big", action="create", num_tokens=500)
+    small = PlannedDocument(table_name="small", action="create", num_tokens=10)
+
+    now, later = _plan(big, small).split(max_tokens=100)
+    assert [d.table_name for d in now.documents] == ["big"]
+    assert [d.table_name for d in later.documents] == ["small"]
+
+    now, later = _plan(small, big).split(max_tokens=100)
+    assert [d.table_name for d in now.documents] == ["small"]
+    assert [d.table_name for d in later.documents] == ["big"]
+
+
+def test_requests_count_dataset_creation(tmp_path):
+    plan = SyncPlan(db_name="docs", documents=[PlannedDocument(table_name="a", action="create", requests=1)])
+    assert plan.requests == 2
+
+    plan.save(tmp_path / "plan.json")
+    assert SyncPlan.load(tmp_path / "plan.json") == plan
@@ -0,0 +1,38 @@
+import pytest
+from langchain_text_splitters import MarkdownHeaderTextSplitter
+
+from dify_knowledge_pipeline.reader import MarkdownSectionStream, collapse_blank_lines
+
+HEADERS = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3"), ("####", "Header 4")]
+
+DOCUMENTS = {
+    "nested": "# Title\n\nintro line\n\n## Install\n\npip install x\nmore\n\n### Detail\n\ntext\n\n## Usage\n\nuse it\n",
+    "preamble": "no header yet\n\n# Header\nbody\n",
+    "code_block": (
+        "# Code\n\n```python\n# not a header\n\n\nprint(1)\n```\n\nafter\n\n~~~\n## also not a header\n~~~\n"
+    ),
+    "header_only": "# A\n## B\n### C\n",
+    "no_space_after_hash": "#tag line\n# Real\n####### seven\ncontent\n",
+    "sibling_reset": "# A\n## B\nb text\n# C\nc text\n### D\nd text\n",
+    "unclosed_code_block": "# A\n```\ncode\n\n\n\nmore code\n\n\n",
+}
+
+
+@pytest.mark.parametrize("text", DOCUMENTS.values(), ids=DOCUMENTS.keys())
+def test_section_stream_matches_in_memory_splitter(text):
+    # 与 fork_tech_docs_markdown_to_chunks 两条路径的预处理一致
+    splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS, strip_headers=True)
+    in_memory = splitter.split_text(text.strip().replace("\n\n", "\n"))
+    expected = [(document.metadata, document.page_content) for document in in_memory]
+
+    lines = collapse_blank_lines(text.split("\n"))
+    assert list(MarkdownSectionStream(HEADERS).split_lines(lines)) == expected
+
+
+def test_section_stream_bounds_oversized_sections():
+    lines = ["# Big"] + [f"line {i}" for i in range(200)]
+    sections = list(MarkdownSectionStream(HEADERS, max_section_chars=100).split_lines(lines))
+
+    assert len(sections) > 1
+    assert all(metadata == {"Header 1": "Big"} for metadata, _ in sections)
+    assert "\n".join(content.replace("  \n", "\n") for _, content in sections) == "\n".join(lines[1:])
@@ -0,0 +1,91 @@
+import gzip
+import json
+
+import httpx
+import pytest
+
+from dify_knowledge_pipeline.client import KnowledgeDatasetsClient
+from dify_knowledge_pipeline.recorder import (
+    JsonlRecorder,
+    ResponseRecorder,
+    SnapshotRecorder,
+    _BackgroundRecorder,
+    make_recorder,
+)
+
+
+def _response(body, *, url="http://fake/v1/datasets") -> httpx.Response:
+    return httpx.Response(200, json=body, request=httpx.Request("GET", url))
+
+
+def _read_jsonl(path):
+    with gzip.open(path, "rt", encoding="utf8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_make_recorder_modes(tmp_path):
+    assert type(make_recorder(None, tmp_path)) is ResponseRecorder
+    assert type(make_recorder("off", tmp_path)) is ResponseRecorder
+    assert isinstance(make_recorder("background", tmp_path), SnapshotRecorder)
+    assert isinstance(make_recorder("jsonl", tmp_path), JsonlRecorder)
+    recorder = SnapshotRecorder(tmp_path)
+    assert make_recorder(recorder, tmp_path) is recorder
+    with pytest.raises(ValueError):
+        make_recorder("verbose", tmp_path)
+
+
+def test_background_recorder_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        _BackgroundRecorder(tmp_path)
+
+
+def test_client_records_nothing_by_default(tmp_path, monkeypatch, fake_dify):
+    monkeypatch.setattr(KnowledgeDatasetsClient, "storage_dir", tmp_path / "records")
+    client = KnowledgeDatasetsClient(api_key="fake", base_url="http://fake/v1", transport=fake_dify.transport())
+    client.create_datasets("docs")
+    client.close()
+    assert not (tmp_path / "records").exists()
+
+
+def test_snapshot_keeps_latest_response_per_name(tmp_path):
+    recorder = SnapshotRecorder(tmp_path)
+    recorder.record(_response({"n": 1}), "list.json")
+    recorder.record(_response({"n": 2}), "list.json")
+    recorder.record(_response({"n": 3}))
+    recorder.close()
+
+    assert [p.name for p in tmp_path.iterdir()] == ["list.json"]
+    assert json.loads((tmp_path / "list.json").read_text(encoding="utf8")) == {"n": 2}
+    # 关闭后不再记录
+    recorder.record(_response({"n": 4}), "list.json")
+    assert json.loads((tmp_path / "list.json").read_text(encoding="utf8")) == {"n": 2}
+
+
+def test_jsonl_appends_and_rotates(tmp_path):
+    recorder = JsonlRecorder(tmp_path, max_bytes=1, backup_count=2)
+    for i in range(4):
+        recorder.record(_response({"n": i}), "list.json")
+        recorder.flush(timeout=5)
+    recorder.close()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["responses.jsonl.gz.1", "responses.jsonl.gz.2"]
+    (entry,) = _read_jsonl(tmp_path / "responses.jsonl.gz.1")
+    assert entry["body"] == {"n": 3} and entry["status_code"] == 200 and entry["method"] == "GET"
+
+
+def test_jsonl_reopens_as_a_valid_gzip_stream(tmp_path):
+    for i in range(2):
+        recorder = JsonlRecorder(tmp_path)
+        recorder.record(_response({"n": i}))
+        recorder.close()
+    assert [entry["body"] for entry in _read_jsonl(tmp_path / "responses.jsonl.gz")] == [{"n": 0}, {"n": 1}]
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path, monkeypatch):
+    recorder = JsonlRecorder(tmp_path, max_queue=1)
+    # 后台线程不启动，队列写满后的记录被丢弃
+    monkeypatch.setattr(recorder, "_ensure_started", lambda: None)
+    for i in range(3):
+        recorder.record(_response({"n": i}))
+    assert recorder.dropped == 2
@@ -0,0 +1,74 @@
+import json
+
+import httpx
+
+from dify_knowledge_pipeline.cards import SEPARATOR
+from dify_knowledge_pipeline.metrics import Metrics
+from dify_knowledge_pipeline.scheduler import UploadScheduler, smallest_first
+
+
+def _created_names(fake_dify):
+    """按创建顺序记录文档名"""
+    names = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("create_by_text"):
+            names.append(json.loads(request.content)["name"])
+        return fake_dify.handle(request)
+
+    return handler, names
+
+
+def test_priority_orders_uploads(make_drop, fake_dify):
+    handler, names = _created_names(fake_dify)
+    scheduler = UploadScheduler(priority=smallest_first)
+    cards = {"large": "x" * 300, "small": "x", "medium": "x" * 20, "small-2": "y"}
+
+    make_drop(transport=httpx.MockTransport(handler), scheduler=scheduler).embed_knowledge(cards, db_name="docs")
+
+    # 稳定排序，大小相同的文档保持输入顺序
+    assert names == ["small", "small-2", "medium", "large"]
+
+
+def test_token_budget_counts_card_segments(make_drop, byte_counter):
+    metrics = Metrics()
+    scheduler = UploadScheduler(tokens_per_minute=6_000_000, requests_per_minute=6_000_000)
+    scheduler._counter = byte_counter
+    drop = make_drop(scheduler=scheduler, metrics=metrics)
+
+    drop.embed_knowledge({"a": SEPARATOR.join(["abc", "de"]), "b": "fghij"}, db_name="docs")
+
+    # 分隔符不计入嵌入的 token
+    assert metrics.report().counters["sync.scheduled_tokens"] == 10
+
+
+def test_backlog_pauses_until_batches_are_indexed(make_drop, fake_dify):
+    fake_dify.indexing_polls = 2
+    metrics = Metrics()
+    scheduler = UploadScheduler(max_indexing_backlog=2, poll_interval=0.001)
+    drop = make_drop(scheduler=scheduler, metrics=metrics)
+
+    report = drop.embed_knowledge({f"doc-{i}": f"text {i}" for i in range(6)}, db_name="docs")
+
+    counters = metrics.report().counters
+    assert report.created == 6
+    assert counters["sync.backlog_pauses"] >= 1 and counters["sync.indexing_polls"] >= 2
+    assert scheduler.backlog <= 2
+
+
+def test_differential_sync_admits_changed_segments_only(make_drop):
+    admitted = []
+
+    class RecordingScheduler(UploadScheduler):
+        def admit(self, knowledge_card=None, *, segments=None, requests=1, num_tokens=None):
+            admitted.append((knowledge_card is None, list(segments or []), requests))
+
+    cards = {"a": SEPARATOR.join(["one", "two", "three"]), "b": "same"}
+    make_drop().embed_knowledge(cards, db_name="docs")
+
+    cards["a"] = SEPARATOR.join(["one", "TWO", "three", "four"])
+    report = make_drop(scheduler=RecordingScheduler()).embed_knowledge(cards, db_name="docs", differential=True)
+
+    assert {result.table_name: result.action for result in report.results} == {"a": "updated", "b": "skipped"}
+    # 一个分段更新 + 一次批量新增；未变化的文档不申请预算
+    assert admitted == [(True, ["TWO", "four"], 2)]
@@ -0,0 +1,40 @@
+from dify_knowledge_pipeline.segments import diff_segments
+
+
+def _existing(*contents: str):
+    return [{"id": f"s{i}", "position": i + 1, "content": content} for i, content in enumerate(contents)]
+
+
+def test_diff_segments_unchanged():
+    diff = diff_segments(_existing("a", "b"), ["a", "b"])
+    assert diff.unchanged == ["s0", "s1"]
+    assert not diff.changed
+
+
+def test_diff_segments_reuses_ids_for_changed_content():
+    diff = diff_segments(_existing("a", "b", "c"), ["a", "B", "c"])
+    assert diff.unchanged == ["s0", "s2"]
+    assert diff.update == [("s1", "B")]
+    assert diff.create == [] and diff.delete == []
+
+
+def test_diff_segments_creates_and_deletes_surplus():
+    grown = diff_segments(_existing("a"), ["a", "b", "c"])
+    assert grown.create == ["b", "c"] and grown.delete == []
+
+    shrunk = diff_segments(_existing("a", "b", "c"), ["c"])
+    assert shrunk.unchanged == ["s2"]
+    assert shrunk.delete == ["s0", "s1"] and shrunk.update == []
+
+
+def test_diff_segments_matches_duplicates_by_count():
+    diff = diff_segments(_existing("x", "x"), ["x", "x", "x"])
+    assert diff.unchanged == ["s0", "s1"]
+    assert diff.create == ["x"]
+
+
+def test_diff_segments_orders_by_position():
+    existing = [{"id": "late", "position": 2, "content": "b"}, {"id": "early", "position": 1, "content": "a"}]
+    diff = diff_segments(existing, ["A", "B"])
+    assert diff.update == [("early", "A"), ("late", "B")]
+    assert diff.summary() == {"unchanged": 0, "updated": 2, "created": 0, "deleted": 0}
@@ -0,0 +1,49 @@
+from dify_knowledge_pipeline.state import SyncState, card_digest
+
+
+def test_card_digest_covers_segmentation_rules():
+    digest = card_digest("text", separator="---", max_tokens=1000)
+    assert digest == card_digest("text", separator="---", max_tokens=1000)
+    assert digest != card_digest("text!", separator="---", max_tokens=1000)
+    assert digest != card_digest("text", separator="===", max_tokens=1000)
+    assert digest != card_digest("text", separator="---", max_tokens=500)
+
+
+def test_state_round_trip(tmp_path):
+    state = SyncState(tmp_path / "state.json")
+    state.set("d", "a", digest="h1", document_id="doc-a")
+    state.save()
+
+    state = SyncState(tmp_path / "state.json")
+    assert state.is_unchanged("d", "a", "h1")
+    assert not state.is_unchanged("d", "a", "h2")
+    assert not state.is_unchanged("other", "a", "h1")
+    state.discard("d", "a")
+    assert state.get("d", "a") is None
+
+
+def test_corrupt_state_starts_empty(tmp_path):
+    (tmp_path / "state.json").write_text("{", encoding="utf8")
+    assert SyncState(tmp_path / "state.json").get("d", "a") is None
+
+
+def test_skip_unchanged_sends_no_writes(make_drop, fake_dify):
+    cards = {"a": "alpha", "b": "beta"}
+    report = make_drop().embed_knowledge(cards, db_name="docs", skip_unchanged=True)
+    assert report.created == 2
+
+    writes = fake_dify.requests["POST"]
+    report = make_drop().embed_knowledge(cards, db_name="docs", skip_unchanged=True)
+    assert report.skipped == 2 and report.uploaded == 0
+    assert fake_dify.requests["POST"] == writes
+
+    cards["b"] = "beta v2"
+    report = make_drop().embed_knowledge(cards, db_name="docs", skip_unchanged=True)
+    assert report.skipped == 1 and report.updated == 1
+
+
+def test_without_skip_unchanged_every_card_is_written(make_drop):
+    cards = {"a": "alpha"}
+    make_drop().embed_knowledge(cards, db_name="docs")
+    report = make_drop().embed_knowledge(cards, db_name="docs")
+    assert report.updated == 1 and report.skipped == 0
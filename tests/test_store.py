@@ -0,0 +1,110 @@
+import multiprocessing
+import pickle
+import sys
+
+import pytest
+
+from dify_knowledge_pipeline.cards import SEPARATOR
+from dify_knowledge_pipeline.manifest import ChunkManifest
+from dify_knowledge_pipeline.store import ChunkStore
+
+
+@pytest.fixture
+def store(tmp_path) -> ChunkStore:
+    store = ChunkStore(tmp_path / "chunks.db", batch_size=2)
+    yield store
+    store.close()
+
+
+def _write(store: ChunkStore, name: str, *segments: str, source=None):
+    with store.writer(source) as writer:
+        for i, segment in enumerate(segments):
+            writer.add(segment, num_tokens=len(segment), metadata={"i": i})
+        return writer.commit(name)
+
+
+def test_commit_replaces_card_atomically(store):
+    _write(store, "docs_a.txt", "one", "two", "three")
+    card = _write(store, "docs_a.txt", "uno")
+
+    assert str(card) == "uno" and len(store) == 1
+    assert [s.metadata for s in card.segments()] == [{"i": 0}]
+    assert store.segment("docs_a.txt", 0).num_tokens == 3
+    assert card.nbytes == len("uno")
+
+
+def test_abort_discards_flushed_segments(store):
+    with pytest.raises(RuntimeError):
+        with store.writer() as writer:
+            for segment in ("a", "b", "c", "d", "e"):
+                writer.add(segment)
+            raise RuntimeError("chunker failed")
+
+    assert len(store) == 0
+    assert store._connect().execute("SELECT COUNT(*) FROM segments").fetchone()[0] == 0
+
+
+def test_items_strips_only_the_suffix(store):
+    _write(store, "docs_a.txt.v2.txt", "x", "y")
+    _write(store, "docs_empty.txt")
+
+    ((table_name, card),) = store.items()
+    assert table_name == "docs_a.txt.v2"
+    assert str(card) == f"x{SEPARATOR}y"
+    assert list(card.iter_segments()) == ["x", "y"]
+
+
+def test_store_pickles_by_path(store):
+    _write(store, "docs_a.txt", "x")
+    reopened = pickle.loads(pickle.dumps(store))
+
+    assert reopened is ChunkStore.open(store.path)
+    assert str(reopened.get("docs_a.txt")) == "x"
+
+
+def _write_in_child(store: ChunkStore):
+    inherited = store._local.conn
+    if store._connect() is inherited:
+        sys.exit("forked worker reused the parent's sqlite connection")
+    _write(store, "docs_child.txt", "from child")
+    store.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="fork is not available")
+def test_forked_worker_opens_its_own_connection(store):
+    parent = store._connect()
+    _write(store, "docs_parent.txt", "from parent")
+
+    process = multiprocessing.get_context("fork").Process(target=_write_in_child, args=(store,))
+    process.start()
+    process.join()
+
+    assert process.exitcode == 0
+    # 子进程关闭的是自己的连接，父进程的连接仍然可用
+    assert store._connect() is parent
+    assert store.names() == ["docs_child.txt", "docs_parent.txt"]
+
+
+def _run(tmp_path, store, sources):
+    """模拟一次增量分片运行：未命中清单的源文件重新写入卡片"""
+    manifest = ChunkManifest.for_output(tmp_path / "out", {"chunk_size": 600}, store=store)
+    for fp, title in sources.items():
+        if manifest.lookup(fp) is None:
+            _write(store, f"{title}.txt", fp.read_text(encoding="utf8"), source=fp)
+            manifest.record(fp, title)
+    manifest.save(prune=True)
+
+
+def test_manifest_prunes_cards_of_deleted_and_renamed_sources(tmp_path, store):
+    a, b = tmp_path / "a.md", tmp_path / "b.md"
+    a.write_text("A", encoding="utf8")
+    b.write_text("B", encoding="utf8")
+    _run(tmp_path, store, {a: "docs_a", b: "docs_b"})
+    assert [name for name, _ in store.items()] == ["docs_a", "docs_b"]
+
+    # b 被删除，a 修改后标题变化
+    b.unlink()
+    a.write_text("A v2", encoding="utf8")
+    _run(tmp_path, store, {a: "docs_a2"})
+
+    assert [(name, str(card)) for name, card in store.items()] == [("docs_a2", "A v2")]
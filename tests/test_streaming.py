@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from dify_knowledge_pipeline.streaming import buffered
+
+
+def test_buffered_preserves_order_and_bounds_the_queue():
+    produced = []
+
+    def items():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    consumed = []
+    for item in buffered(items(), maxsize=2):
+        # 队列中最多 maxsize 个，另有一个阻塞在 put 中、一个已取出尚未记录
+        assert len(produced) - len(consumed) <= 2 + 2
+        consumed.append(item)
+
+    assert consumed == list(range(20))
+
+
+def test_buffered_reraises_producer_errors_in_position():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("chunker failed")
+
+    consumed = []
+    with pytest.raises(RuntimeError, match="chunker failed"):
+        for item in buffered(items()):
+            consumed.append(item)
+    assert consumed == [1, 2]
+
+
+def test_buffered_stops_and_closes_producer_when_consumer_exits():
+    closed = threading.Event()
+
+    def items():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    for item in buffered(items(), maxsize=1):
+        if item == 3:
+            break
+
+    assert closed.is_set()
+
+
+def test_embed_knowledge_stream_matches_embed_knowledge(make_drop, fake_dify):
+    def cards():
+        for i in range(12):
+            yield f"doc-{i}", f"text {i}"
+
+    drop = make_drop(max_concurrency=3)
+    report = drop.embed_knowledge_stream(cards(), db_name="docs", queue_size=2)
+
+    assert report.created == 12 and report.failed == 0
+    (documents,) = fake_dify.documents.values()
+    assert sorted(d["name"] for d in documents.values()) == sorted(f"doc-{i}.txt" for i in range(12))
+
+    report = drop.embed_knowledge_stream(cards(), db_name="docs", skip_unchanged=True)
+    assert report.skipped == 12
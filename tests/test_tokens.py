@@ -0,0 +1,31 @@
+import pytest
+
+from dify_knowledge_pipeline.tokens import TokenWindowSplitter
+
+
+@pytest.mark.parametrize("chunk_size", [4, 5, 7, 16])
+def test_window_backs_off_to_utf8_boundary(byte_counter, chunk_size):
+    text = "中文分片🥂测试ascii混合é文本" * 3
+    chunks = TokenWindowSplitter(byte_counter, chunk_size=chunk_size).split_text_with_counts(text)
+
+    assert "".join(chunk for chunk, _ in chunks) == text
+    for chunk, num_tokens in chunks:
+        assert "�" not in chunk
+        assert num_tokens == len(chunk.encode("utf8")) <= chunk_size
+
+
+def test_window_overlap_starts_on_character(byte_counter):
+    text = "你好世界" * 10
+    chunks = TokenWindowSplitter(byte_counter, chunk_size=9, chunk_overlap=4).split_text(text)
+
+    assert len(chunks) > 1
+    assert all("�" not in chunk and chunk for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous[-1] == chunk[0]
+    assert chunks[0] + "".join(chunk[1:] for chunk in chunks[1:]) == text
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(0, 0), (4, 4), (4, -1)])
+def test_window_rejects_invalid_sizes(byte_counter, chunk_size, chunk_overlap):
+    with pytest.raises(ValueError):
+        TokenWindowSplitter(byte_counter, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
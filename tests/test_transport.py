@@ -0,0 +1,129 @@
+import time
+
+import httpx
+import pytest
+
+from dify_knowledge_pipeline.transport import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DifyRetryTransport,
+    RetryPolicy,
+    TokenBucket,
+    retry_after,
+)
+
+
+def _request(method: str) -> httpx.Request:
+    return httpx.Request(method, "http://fake/v1/datasets")
+
+
+def _response(status_code: int, **kwargs) -> httpx.Response:
+    response = httpx.Response(status_code, **kwargs)
+    response.read()
+    return response
+
+
+@pytest.mark.parametrize("method", ["GET", "POST", "PATCH", "DELETE"])
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_unprocessed_statuses_retry_any_method(method, status_code):
+    assert RetryPolicy().is_retryable_response(_request(method), _response(status_code))
+
+
+@pytest.mark.parametrize("status_code", [500, 502, 504])
+def test_ambiguous_statuses_retry_only_idempotent_methods(status_code):
+    policy = RetryPolicy()
+    for method in ("GET", "HEAD", "OPTIONS", "PUT", "DELETE"):
+        assert policy.is_retryable_response(_request(method), _response(status_code))
+    for method in ("POST", "PATCH"):
+        assert not policy.is_retryable_response(_request(method), _response(status_code))
+
+
+@pytest.mark.parametrize(
+    "body, retryable",
+    [
+        ({"code": "document_indexing"}, True),
+        ({"code": "dataset_not_initialized"}, True),
+        ({"code": "invalid_action"}, False),
+        ({"message": "no code"}, False),
+        ("not json", False),
+    ],
+)
+def test_bad_request_retries_transient_dify_errors(body, retryable):
+    response = _response(400, json=body) if isinstance(body, dict) else _response(400, text=body)
+    assert RetryPolicy().is_retryable_response(_request("POST"), response) is retryable
+
+
+@pytest.mark.parametrize("status_code", [401, 404, 409, 413])
+def test_client_errors_are_not_retried(status_code):
+    assert not RetryPolicy().is_retryable_response(_request("GET"), _response(status_code))
+
+
+def test_exceptions_retry_by_whether_the_request_was_sent():
+    policy = RetryPolicy()
+    post, get = _request("POST"), _request("GET")
+
+    # 连接阶段失败，请求未发出
+    for err in (httpx.ConnectError("x"), httpx.ConnectTimeout("x"), httpx.PoolTimeout("x")):
+        assert policy.is_retryable_exception(post, err)
+    # 请求可能已被处理
+    assert not policy.is_retryable_exception(post, httpx.ReadTimeout("x"))
+    assert policy.is_retryable_exception(get, httpx.ReadTimeout("x"))
+    assert not policy.is_retryable_exception(get, CircuitOpenError("open"))
+    assert not policy.is_retryable_exception(get, ValueError("x"))
+
+
+@pytest.mark.parametrize("method, expected_attempts", [("GET", 3), ("POST", 1)])
+def test_transport_does_not_repeat_non_idempotent_writes(method, expected_attempts):
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.method)
+        return httpx.Response(502)
+
+    transport = DifyRetryTransport(httpx.MockTransport(handler), retry=RetryPolicy(max_retries=2, backoff_base=0))
+    with httpx.Client(transport=transport, base_url="http://fake/v1") as client:
+        assert client.request(method, "/datasets").status_code == 502
+    assert len(attempts) == expected_attempts
+
+
+def test_retry_after_header():
+    assert retry_after(_response(429, headers={"Retry-After": "2.5"})) == 2.5
+    assert retry_after(_response(429, headers={"Retry-After": "-1"})) == 0.0
+    assert retry_after(_response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after(_response(429, headers={"Retry-After": "soon"})) is None
+    assert retry_after(_response(429)) is None
+
+
+def test_token_bucket_allows_a_burst_then_throttles():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_circuit_breaker_opens_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    request = _request("GET")
+    breaker.record_failure()
+    breaker.before_request(request)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(request)
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.before_request(request)
+    # 探测请求返回前，其余请求仍然直接失败
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(request)
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_transport_honours_retry_after_and_recovers():
+    responses = iter([httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={"ok": True})])
+    transport = DifyRetryTransport(httpx.MockTransport(lambda request: next(responses)), retry=RetryPolicy())
+    with httpx.Client(transport=transport, base_url="http://fake/v1") as client:
+        assert client.post("/datasets", json={}).json() == {"ok": True}